@@ -9,8 +9,50 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler as DjangoASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
+
+class ASGIHandler(DjangoASGIHandler):
+    """
+    Django's handler plus responses with an async iterator (partner.export.AsyncStreamingHttpResponse):
+    Django 4.1 iterates streaming responses synchronously inside the event loop.
+    Drop it after upgrading to Django 4.2, which streams async iterators itself.
+    """
+
+    async def send_response(self, response, send):
+        if not getattr(response, 'is_async', False):
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+        content = response.streaming_content
+        try:
+            await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers})
+            async for part in content:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body'})
+        finally:
+            # also when the client disconnects mid-stream: the iterator (and the DB cursor behind it)
+            # is closed right away, then request_finished (close_old_connections) and the response's closers
+            await content.aclose()
+            await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return ASGIHandler()
+
+
 application = get_asgi_application()
@@ -32,6 +32,19 @@ DEBUG = int(os.getenv('DJANGO_DEBUG', False))
 
 ALLOWED_HOSTS = os.getenv('DJANGO_ALLOWED_HOSTS', "*").split(" ")
 
+# Serve the account views as native async views (run under an ASGI server, see core/asgi.py)
+ASYNC_VIEWS = bool(int(os.getenv('DJANGO_ASYNC_VIEWS', 0)))
+
+# Subscription history page: rows per page and the upper bound for ?limit=
+HISTORY_PAGE_SIZE = int(os.getenv('DJANGO_HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('DJANGO_HISTORY_MAX_PAGE_SIZE', 200))
+
+# Rows fetched per server-side cursor round-trip when exporting subscription history
+EXPORT_CHUNK_SIZE = int(os.getenv('DJANGO_EXPORT_CHUNK_SIZE', 2000))
+
+# CSV partner import (manage.py import_partners, admin upload): rows per email check and bulk insert
+IMPORT_BATCH_SIZE = int(os.getenv('DJANGO_IMPORT_BATCH_SIZE', 1000))
+
 # Mail handling
 EMAIL_HOST = os.getenv('DJANGO_EMAIL_HOST', 'localhost')
 EMAIL_HOST_PASSWORD = os.getenv('DJANGO_EMAIL_HOST_PASSWORD', '')
@@ -46,11 +59,78 @@ EMAIL_USE_SSL = os.getenv('DJANGO_EMAIL_USE_SSL', False)
 if EMAIL_HOST == "localhost":
     EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# SMTP socket timeout, seconds: a stuck server must not hang the mail worker
+EMAIL_TIMEOUT = int(os.getenv('DJANGO_EMAIL_TIMEOUT', 30))
+
+# Mail queue worker (manage.py process_mail_queue): one SMTP connection per batch,
+# retries with jittered exponential backoff (seconds); the lease must outlast a batch
+MAIL_BATCH_SIZE = int(os.getenv('DJANGO_MAIL_BATCH_SIZE', 100))
+MAIL_MAX_ATTEMPTS = int(os.getenv('DJANGO_MAIL_MAX_ATTEMPTS', 6))
+MAIL_RETRY_BACKOFF = float(os.getenv('DJANGO_MAIL_RETRY_BACKOFF', 30))
+MAIL_LEASE_TIMEOUT = int(os.getenv('DJANGO_MAIL_LEASE_TIMEOUT', 600))
+MAIL_POLL_INTERVAL = float(os.getenv('DJANGO_MAIL_POLL_INTERVAL', 2))
+
+TARIFFS_LINK = "https://adesk.ru/api/tariffs"
 CHECKOUT_LINK = "https://api.dev.adesk.ru/v1/partner/checkout-subscription"
 SUBSCRIBE_LINK = "https://api.dev.adesk.ru/v1/partner/subscription"
 
 DEV_AUTH = (os.getenv('DJANGO_AUTH_USER'), os.getenv('DJANGO_AUTH_PASSWORD'))
 
+# Outgoing HTTP to the Adesk API: one pooled keep-alive session per worker process.
+# Timeouts are (connect, read) in seconds; only idempotent GETs are retried.
+API_POOL_CONNECTIONS = int(os.getenv('DJANGO_API_POOL_CONNECTIONS', 4))
+API_POOL_SIZE = int(os.getenv('DJANGO_API_POOL_SIZE', 10))
+API_ASYNC_MAX_CONNECTIONS = int(os.getenv('DJANGO_API_ASYNC_MAX_CONNECTIONS', 100))
+API_CONNECT_TIMEOUT = float(os.getenv('DJANGO_API_CONNECT_TIMEOUT', 2))
+API_GET_READ_TIMEOUT = float(os.getenv('DJANGO_API_GET_READ_TIMEOUT', 2))
+API_POST_READ_TIMEOUT = float(os.getenv('DJANGO_API_POST_READ_TIMEOUT', 10))
+API_GET_RETRIES = int(os.getenv('DJANGO_API_GET_RETRIES', 2))
+API_RETRY_BACKOFF = float(os.getenv('DJANGO_API_RETRY_BACKOFF', 0.2))
+
+# Circuit breaker per upstream host, state shared through the cache: opens after
+# FAILURE_THRESHOLD failures within FAILURE_WINDOW, probes again after RECOVERY_TIMEOUT
+API_BREAKER_FAILURE_THRESHOLD = int(os.getenv('DJANGO_API_BREAKER_FAILURE_THRESHOLD', 5))
+API_BREAKER_FAILURE_WINDOW = int(os.getenv('DJANGO_API_BREAKER_FAILURE_WINDOW', 30))
+API_BREAKER_RECOVERY_TIMEOUT = int(os.getenv('DJANGO_API_BREAKER_RECOVERY_TIMEOUT', 30))
+
+# How long a checkout idempotency key stays claimed while its subscription is being submitted
+CHECKOUT_LOCK_TIMEOUT = int(os.getenv('DJANGO_CHECKOUT_LOCK_TIMEOUT', 60))
+
+# Subscription outbox worker (manage.py process_subscription_outbox): requests sent
+# concurrently per batch, retries with jittered exponential backoff (seconds)
+OUTBOX_BATCH_SIZE = int(os.getenv('DJANGO_OUTBOX_BATCH_SIZE', 20))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('DJANGO_OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BACKOFF = float(os.getenv('DJANGO_OUTBOX_RETRY_BACKOFF', 5))
+OUTBOX_LEASE_TIMEOUT = int(os.getenv('DJANGO_OUTBOX_LEASE_TIMEOUT', 60))
+OUTBOX_POLL_INTERVAL = float(os.getenv('DJANGO_OUTBOX_POLL_INTERVAL', 1))
+
+# Tariffs catalogue cache (seconds): entries are fresh for TTL, then served stale
+# while one background refresh runs, and dropped after TTL + STALE_TTL
+TARIFFS_CACHE_TTL = int(os.getenv('DJANGO_TARIFFS_CACHE_TTL', 300))
+TARIFFS_CACHE_STALE_TTL = int(os.getenv('DJANGO_TARIFFS_CACHE_STALE_TTL', 3600))
+TARIFFS_CACHE_LOCK_TIMEOUT = int(os.getenv('DJANGO_TARIFFS_CACHE_LOCK_TIMEOUT', 10))
+
+# Checkout quotes are cached per (catalogue version, tariff, period, extra quotas);
+# the signed quote token on the checkout page expires together with the cached quote
+QUOTE_CACHE_TTL = int(os.getenv('DJANGO_QUOTE_CACHE_TTL', 900))
+
+# 'shadow': prices come from CHECKOUT_LINK and are checked against partner.pricing;
+# 'local': partner.pricing replaces CHECKOUT_LINK once the current catalogue version has
+# PRICING_LOCAL_MIN_MATCHES shadow checks and no mismatch; until then it behaves like 'shadow'
+PRICING_ENGINE = os.getenv('DJANGO_PRICING_ENGINE', 'shadow')
+PRICING_LOCAL_MIN_MATCHES = int(os.getenv('DJANGO_PRICING_LOCAL_MIN_MATCHES', 1000))
+
+# Requests slower than this (seconds) get a timing log line; 0 logs every request
+REQUEST_TIMING_LOG_THRESHOLD = float(os.getenv('DJANGO_REQUEST_TIMING_LOG_THRESHOLD', 0.5))
+# /metrics requires "Authorization: Bearer <token>"; without a token it answers 403 to everyone
+METRICS_TOKEN = os.getenv('DJANGO_METRICS_TOKEN')
+
+# partner.query_budget: raise instead of logging a warning. Off by default, DEBUG included, so a
+# local server with real data is not broken by a budget; always on under the test runner.
+# The same query repeated this many times within a view counts as N+1
+QUERY_BUDGET_STRICT = bool(int(os.getenv('DJANGO_QUERY_BUDGET_STRICT', 0)))
+QUERY_BUDGET_MAX_REPEATS = int(os.getenv('DJANGO_QUERY_BUDGET_MAX_REPEATS', 5))
+
 
 # Application definition
 
@@ -62,10 +142,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_object_actions'
 ]
 
 MIDDLEWARE = [
+    'partner.timing.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,8 +175,24 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Compiled templates are kept in memory for the life of the worker: they only change with a deploy
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Per-partner account fragments (header, navbar, sales summary), seconds; 0 disables the cache.
+# Invalidated on every change of the partner, the TTL only bounds stale HTML after a template change
+FRAGMENT_CACHE_TTL = int(os.getenv('DJANGO_FRAGMENT_CACHE_TTL', 3600))
+
 WSGI_APPLICATION = 'core.wsgi.application'
 
+TEST_RUNNER = 'partner.test_runner.QueryBudgetTestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
@@ -106,8 +204,72 @@ DATABASES = {
         'USER': os.getenv('DATABASE_USER'),
         'PASSWORD': os.getenv('DATABASE_PASSWORD'),
         'HOST': os.getenv('DATABASE_HOST'),
-        'PORT': '5432'
+        'PORT': os.getenv('DATABASE_PORT', '5432'),
+        # Persistent connections: reused across requests for CONN_MAX_AGE seconds
+        # (0 -- a connection per request), checked before reuse by CONN_HEALTH_CHECKS
+        'CONN_MAX_AGE': int(os.getenv('DJANGO_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': bool(int(os.getenv('DJANGO_CONN_HEALTH_CHECKS', 1))),
+        # Required behind PgBouncer in transaction pooling mode: server-side cursors
+        # do not survive between transactions there (exports switch to keyset chunks)
+        'DISABLE_SERVER_SIDE_CURSORS': bool(int(os.getenv('DJANGO_DB_DISABLE_SERVER_SIDE_CURSORS', 0))),
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Shared between gunicorn workers when DJANGO_REDIS_URL is set, per-process otherwise
+
+if os.getenv('DJANGO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('DJANGO_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+
+# Sessions and messages
+# https://docs.djangoproject.com/en/4.0/topics/http/sessions/
+# 'cached_db' reads sessions from the cache and writes to the DB only when a session changes
+# (partner.sessions keeps working on the DB if Redis goes down); 'cache' keeps them in Redis only.
+# Both need a cache shared by all workers: without DJANGO_REDIS_URL a per-process cache would serve
+# stale sessions after logout, so DJANGO_SESSION_FALLBACK is used instead.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'partner.sessions',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+SESSION_STORE = os.getenv('DJANGO_SESSION_STORE', 'cached_db')
+if SESSION_STORE != 'db' and not os.getenv('DJANGO_REDIS_URL'):
+    SESSION_STORE = os.getenv('DJANGO_SESSION_FALLBACK', 'db')
+SESSION_ENGINE = SESSION_ENGINES[SESSION_STORE]
+# Expired rows are deleted by clear_expired_sessions in batches of this size
+SESSION_CLEANUP_BATCH_SIZE = int(os.getenv('DJANGO_SESSION_CLEANUP_BATCH_SIZE', 5000))
+
+# Flash messages travel in a signed cookie and never touch the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'partner': {'handlers': ['console'], 'level': os.getenv('DJANGO_PARTNER_LOG_LEVEL', 'INFO')},
+    },
 }
 
 
@@ -129,6 +291,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing: the first hasher hashes new passwords, the others only verify existing hashes,
+# which are re-hashed with the first one (and its current parameters) on the next successful login.
+# Parameters are tuned with manage.py benchmark_password_hashers; argon2-cffi is in requirements.txt.
+PASSWORD_HASHER_CLASSES = {
+    'scrypt': 'partner.hashers.ScryptPasswordHasher',
+    'argon2': 'partner.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHER = os.getenv('DJANGO_PASSWORD_HASHER', 'scrypt')
+PASSWORD_HASHERS = [PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv('DJANGO_PASSWORD_SCRYPT_WORK_FACTOR', 2 ** 14))
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv('DJANGO_PASSWORD_SCRYPT_BLOCK_SIZE', 8))
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv('DJANGO_PASSWORD_SCRYPT_PARALLELISM', 1))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('DJANGO_PASSWORD_ARGON2_TIME_COST', 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('DJANGO_PASSWORD_ARGON2_MEMORY_COST', 102400))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('DJANGO_PASSWORD_ARGON2_PARALLELISM', 8))
+
+# Processes hashing generated passwords in bulk (mail queue worker); 1 hashes in the worker itself
+PASSWORD_HASH_WORKERS = int(os.getenv('DJANGO_PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+
 AUTH_USER_MODEL = 'partner.User'
 LOGIN_URL = '/login/'
 
@@ -0,0 +1,26 @@
+"""
+Настройки gunicorn: файл читается автоматически из рабочего каталога (/app в образе),
+параметры командной строки в docker-compose имеют приоритет.
+"""
+import os
+import time
+
+
+def post_fork(server, worker):
+    """
+    Прогрев нового воркера до приёма запросов (partner.warmup): cached loader хранит
+    скомпилированные шаблоны в памяти процесса, поэтому прогревается каждый воркер.
+    GUNICORN_WARMUP=0 отключает прогрев.
+    """
+    if not int(os.getenv('GUNICORN_WARMUP', 1)):
+        return
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    django.setup()
+    from partner import warmup
+
+    started = time.perf_counter()
+    templates = warmup.warm_up()
+    server.log.info("Worker %s warmed up in %.0f ms, templates compiled: %s", worker.pid,
+                    (time.perf_counter() - started) * 1000, templates)
@@ -1,14 +1,26 @@
+import io
+
 from django import forms
 from django.contrib import admin, messages
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from django.template import Engine, Context
-from django.urls import reverse
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils import timezone
-from django.core.mail import EmailMessage
+from django.utils.html import format_html
 from django_object_actions import DjangoObjectActions
 
-from .models import User, Partner, Subscription
+from . import export, imports, mail, search
+from .query_budget import ChangelistQueryBudgetMixin
+from .models import User, Partner, Subscription, QueuedEmail
+
+# Сколько email перечислять в сообщении об ошибке массового действия
+MAX_REPORTED_USERS = 10
+# Сколько строк с ошибками импорта показывать на странице, полный отчёт -- manage.py import_partners --report
+MAX_REPORTED_IMPORT_ERRORS = 100
 
 
 class UserCreationForm(forms.ModelForm):
@@ -50,13 +62,19 @@ class UserChangeForm(forms.ModelForm):
         return user
 
 
+class PartnerImportForm(forms.Form):
+    file = forms.FileField(label='CSV-файл', help_text="Колонки: " + ', '.join(imports.COLUMNS))
+    encoding = forms.ChoiceField(label='Кодировка', choices=(('utf-8-sig', 'UTF-8'), ('cp1251', 'Windows-1251')))
+    dry_run = forms.BooleanField(label='Только проверить', required=False)
+
+
 class PartnerInline(admin.StackedInline):
     model = Partner
     can_delete = False
     readonly_fields = ('date_registered',)
 
 
-class UserAdmin(DjangoObjectActions, BaseUserAdmin):
+class UserAdmin(ChangelistQueryBudgetMixin, DjangoObjectActions, BaseUserAdmin):
     # The forms to add and change user instances
     form = UserChangeForm
     add_form = UserCreationForm
@@ -64,6 +82,8 @@ class UserAdmin(DjangoObjectActions, BaseUserAdmin):
     inlines = [PartnerInline]
 
     change_actions = ('deactivate', 'make_active', 'send_credentials_via_email')
+    changelist_actions = ('import_partners',)
+    actions = ['activate_selected', 'deactivate_selected', 'send_credentials_selected']
 
     @admin.display(description="Партнёр")
     def partner_d(self, obj):
@@ -75,11 +95,16 @@ class UserAdmin(DjangoObjectActions, BaseUserAdmin):
 
     # The fields to be used in displaying the User model.
     list_display = ('__str__', 'partner_d', 'date_registered', 'is_active', 'date_activated')
+    # partner_d и date_registered читают obj.partner -- без select_related это запрос на строку
+    list_select_related = ('partner',)
+    changelist_query_budget = 8
+    # массовые действия не зависят от числа выбранных пользователей
+    action_query_budget = 15
     list_filter = ('is_staff',)
-    readonly_fields = ('password', 'email', 'is_active')
+    readonly_fields = ('password', 'email', 'is_active', 'credentials_email')
     fieldsets = (
         (None, {'fields': ('email', 'password_field')}),
-        ('Права', {'fields': ('is_active',)}),
+        ('Права', {'fields': ('is_active', 'credentials_email')}),
     )
     # add_fieldsets is not a standard ModelAdmin attribute. UserAdmin
     # overrides get_fieldsets to use this attribute when creating a user.
@@ -89,39 +114,82 @@ class UserAdmin(DjangoObjectActions, BaseUserAdmin):
         ('Права', {'fields': ('is_active', 'is_staff')}),
     )
 
+    # поиск выполняет partner.search, search_fields нужны для поля поиска в changelist
     search_fields = ['email', 'partner__first_name', 'partner__last_name', 'partner__company_name']
 
     ordering = ('is_active',)
     filter_horizontal = ()
 
-    # Generate new password and send credentials to partner's email
+    def get_search_results(self, request, queryset, search_term):
+        return search.search_users(queryset, search_term), False
+
+    def get_ordering(self, request):
+        # при поиске -- сначала самые похожие, если не выбрана сортировка по столбцу
+        if request.GET.get('q', '').strip() and search.ranking_enabled():
+            return ('-' + search.RANK_FIELD,)
+        return super().get_ordering(request)
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='partner_user_import'),
+        ] + super().get_urls()
+
+    def import_partners(self, request, queryset):
+        return redirect('admin:partner_user_import')
+
+    import_partners.label = "Импорт из CSV"
+
+    def import_view(self, request):
+        """Загрузка CSV: импорт выполняется в запросе, на странице -- итог и первые строки с ошибками"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = PartnerImportForm(request.POST or None, request.FILES or None)
+        result = None
+        errors = []
+
+        def on_error(*error):
+            if len(errors) < MAX_REPORTED_IMPORT_ERRORS:
+                errors.append(error)
+
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            stream = io.TextIOWrapper(upload.file, encoding=form.cleaned_data['encoding'], newline='')
+            try:
+                result = imports.import_partners(stream, on_error=on_error, dry_run=form.cleaned_data['dry_run'])
+            except imports.ImportFileError as e:
+                form.add_error('file', str(e))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Импорт партнёров из CSV",
+            'form': form,
+            'result': result,
+            'dry_run': form.cleaned_data.get('dry_run') if result else False,
+            'errors': errors,
+            'report_headers': imports.REPORT_HEADERS,
+            'hidden_errors': result.failed - len(errors) if result else 0,
+        }
+        return TemplateResponse(request, 'admin/partner/user/import_partners.html', context)
+
+    @admin.display(description="Письмо с данными для входа")
+    def credentials_email(self, obj):
+        email = obj.emails.order_by('-id').first() if obj.pk else None
+        if email is None:
+            return "Не отправлялось"
+        url = reverse('admin:partner_queuedemail_change', args=[email.pk])
+        return format_html('<a href="{}">{}</a>, {}', url, email.get_status_display(),
+                           timezone.localtime(email.sent_at or email.created_at).strftime('%d.%m.%Y %H:%M'))
+
+    # Queue credentials to partner's email, the new password is generated by process_mail_queue
     def send_credentials_via_email(self, request, obj):
-        password = obj.generate_and_change_password()
-        # ... send credentials via email ...
-        template = (Engine.get_default()).get_template('partner/email.html')
-        context = Context({
-            "title": "Завершение регистрации Adesk Partner",
-            "text": f"Теперь вы можете войти в личный кабинет партнёра."
-                    f"<br><br>Логин: {obj.email}"
-                    f"<br>Пароль: {password}",
-            "link_text": "Войти",
-            "link_url": reverse('partner:login')
-        })
-        email = EmailMessage(
-            subject="Данные для входа в личный кабинет Adesk Partner",
-            body=template.render(context),
-            to=[obj.email],
-        )
-        email.content_subtype = "html"
-        if email.send(fail_silently=True):
-            if obj.is_active is False:
-                if not self.make_active(request, obj):
-                    return
-            self.message_user(request, "Данные для входа отправлены.",
-                              level=messages.SUCCESS)
-        else:
-            self.message_user(request, "Отправить данные для входа не удалось.",
-                              level=messages.ERROR)
+        # статус письма -- в поле "Письмо с данными для входа"
+        mail.enqueue_many([mail.credentials_email(obj)])
+        if obj.is_active is False:
+            if not self.make_active(request, obj):
+                return
+        self.message_user(request, "Данные для входа поставлены в очередь отправки.",
+                          level=messages.SUCCESS)
 
     def make_active(self, request, obj):
         commission = obj.partner.commission
@@ -145,10 +213,84 @@ class UserAdmin(DjangoObjectActions, BaseUserAdmin):
 
     deactivate.label = "Деактивировать"
 
-
-class SubscriptionAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'partner', 'cost_value', 'commission', 'reg_date', 'period', 'tariff')
+    # Массовые действия: число запросов не зависит от количества выбранных пользователей
+
+    def split_by_commission(self, request, queryset):
+        """Пользователи без процента комиссии партнёра (одним запросом) -- в сообщение, остальные -- в работу"""
+        missing = queryset.filter(partner__commission__isnull=True).values_list('email', flat=True)
+        shown = list(missing[:MAX_REPORTED_USERS + 1])
+        if shown:
+            count = len(shown) if len(shown) <= MAX_REPORTED_USERS else missing.count()
+            emails = ', '.join(shown[:MAX_REPORTED_USERS])
+            more = " и др." if count > MAX_REPORTED_USERS else ""
+            self.message_user(request, f"Не установлен процент комиссии партнёра ({count}): {emails}{more}",
+                              level=messages.ERROR)
+        return queryset.filter(partner__commission__isnull=False)
+
+    @admin.action(description="Активировать выбранных пользователей")
+    def activate_selected(self, request, queryset):
+        queryset = self.split_by_commission(request, queryset)
+        activated = queryset.filter(is_active=False).update(is_active=True, date_activated=timezone.now())
+        self.message_user(request, f"Активировано аккаунтов: {activated}", level=messages.INFO)
+
+    @admin.action(description="Деактивировать выбранных пользователей")
+    def deactivate_selected(self, request, queryset):
+        deactivated = queryset.filter(is_active=True).update(is_active=False, date_activated=None)
+        self.message_user(request, f"Деактивировано аккаунтов: {deactivated}", level=messages.WARNING)
+
+    @admin.action(description="Активировать и отправить данные для входа")
+    def send_credentials_selected(self, request, queryset):
+        queryset = self.split_by_commission(request, queryset)
+        with transaction.atomic():
+            # пароли генерирует и хеширует process_mail_queue пачками, здесь -- только очередь
+            emails = [mail.credentials_email(user) for user in queryset.select_related(None).only('id', 'email')]
+            queryset.filter(is_active=False).update(is_active=True, date_activated=timezone.now())
+            mail.enqueue_many(emails)
+        self.message_user(request, f"Данные для входа поставлены в очередь отправки: {len(emails)}",
+                          level=messages.SUCCESS)
+
+
+class SubscriptionAdmin(ChangelistQueryBudgetMixin, admin.ModelAdmin):
+    list_display = ('__str__', 'partner', 'cost_value', 'commission', 'reg_date', 'period', 'tariff', 'status')
+    list_filter = ('status',)
+    list_select_related = ('partner',)
+    # без COUNT(*) по всей таблице при поиске и фильтрах
+    show_full_result_count = False
+    changelist_query_budget = 8
     search_fields = ['partner__first_name', 'partner__last_name', 'partner__company_name', 'email', 'tariff']
+    actions = ['export_csv', 'export_xlsx']
+
+    @admin.action(description="Выгрузить в CSV")
+    def export_csv(self, request, queryset):
+        return export.export_response(request, queryset, "subscriptions", 'csv', with_partner=True)
+
+    @admin.action(description="Выгрузить в XLSX")
+    def export_xlsx(self, request, queryset):
+        return export.export_response(request, queryset, "subscriptions", 'xlsx', with_partner=True)
+
+    def get_search_results(self, request, queryset, search_term):
+        def on_truncated(limit):
+            self.message_user(request, f"По имени нашлось больше {limit} партнёров, показаны подписки только "
+                                       f"{limit} из них. Уточните запрос.", level=messages.WARNING,
+                              fail_silently=True)
+
+        return search.search_subscriptions(queryset, search_term, on_truncated=on_truncated), False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'created_at', 'sent_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ['=to']
+    # текст письма с паролем в админке не показывается
+    fields = ('user', 'to', 'subject', 'status', 'attempts', 'next_attempt_at', 'last_error', 'created_at', 'sent_at')
+    readonly_fields = fields
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
 
     def has_change_permission(self, request, obj=None):
         return False
@@ -156,5 +298,6 @@ class SubscriptionAdmin(admin.ModelAdmin):
 
 admin.site.register(User, UserAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
+admin.site.register(QueuedEmail, QueuedEmailAdmin)
 
 admin.site.unregister(Group)
@@ -0,0 +1,85 @@
+"""
+Каталог тарифов, скомпилированный из json api Adesk в неизменяемую индексированную
+структуру. Компилируется один раз на версию каталога (хэш json), дальше вьюхи и
+SubscribeForm работают со словарями: код тарифа -> тариф, периоды -> множество.
+"""
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+from typing import NamedTuple
+
+
+class Quota(NamedTuple):
+    code: str
+    name: str
+    quantity: int
+    unit_price: float
+
+
+class Tariff(NamedTuple):
+    code: str
+    name: str
+    pricing: MappingProxyType
+    periods: frozenset
+    quotas: tuple
+    quota_defaults: MappingProxyType
+    is_customizable: bool
+
+
+class Catalogue(NamedTuple):
+    version: str
+    tariffs: MappingProxyType
+    choices: tuple
+    # Квоты для полей SubscribeForm (квоты первого тарифа, как в json каталога)
+    form_quotas: tuple
+    json: dict
+
+
+def catalogue_version(tariffs_json):
+    dump = json.dumps(tariffs_json, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(dump.encode()).hexdigest()
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+# Каталог меняется редко: держим пару последних версий на время переключения
+MAX_VERSIONS = 4
+
+
+def get_catalogue(tariffs_json, version=None):
+    version = version or catalogue_version(tariffs_json)
+    catalogue = _compiled.get(version)
+    if catalogue is None:
+        catalogue = compile_catalogue(tariffs_json, version)
+        with _compiled_lock:
+            if len(_compiled) >= MAX_VERSIONS:
+                _compiled.pop(next(iter(_compiled)))
+            _compiled[version] = catalogue
+    return catalogue
+
+
+def compile_catalogue(tariffs_json, version):
+    tariffs = {}
+    for obj in tariffs_json['tariffs']:
+        quotas = tuple(Quota(code=q['code'], name=q['name'], quantity=q['quantity'],
+                             unit_price=q.get('unitPrice', q.get('price', 0)))
+                       for q in obj['quotas'])
+        tariffs[obj['code']] = Tariff(
+            code=obj['code'],
+            name=obj['name'],
+            pricing=MappingProxyType({int(period): price for period, price in obj['pricing'].items()}),
+            periods=frozenset(int(period) for period in obj['pricing']),
+            quotas=quotas,
+            quota_defaults=MappingProxyType({q.code: q.quantity for q in quotas}),
+            is_customizable=obj.get('isCustomizable', True),
+        )
+
+    first = next(iter(tariffs.values()), None)
+    return Catalogue(
+        version=version,
+        tariffs=MappingProxyType(tariffs),
+        choices=tuple((t.code, t.name) for t in tariffs.values()),
+        form_quotas=first.quotas if first else (),
+        json=tariffs_json,
+    )
@@ -0,0 +1,119 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(ConnectionError):
+    """Запрос отклонён разомкнутым предохранителем, в сеть он не уходил"""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего сервиса, состояние хранится в django cache
+    и поэтому общее для всех воркеров.
+     \n closed -- запросы проходят, отказы считаются в окне failure_window
+     \n open -- после failure_threshold отказов запросы отклоняются без обращения к сети
+     \n half_open -- через recovery_timeout пропускается один пробный запрос:
+      успех замыкает цепь, отказ снова размыкает
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    events = ('rejected', 'failure', 'opened', 'half_opened', 'closed')
+    transition_events = {OPEN: 'opened', HALF_OPEN: 'half_opened', CLOSED: 'closed'}
+
+    def __init__(self, name, failure_threshold=None, failure_window=None, recovery_timeout=None):
+        self.name = name
+        self.failure_threshold = (settings.API_BREAKER_FAILURE_THRESHOLD if failure_threshold is None
+                                  else failure_threshold)
+        self.failure_window = settings.API_BREAKER_FAILURE_WINDOW if failure_window is None else failure_window
+        self.recovery_timeout = (settings.API_BREAKER_RECOVERY_TIMEOUT if recovery_timeout is None
+                                 else recovery_timeout)
+
+        prefix = f'breaker:{name}:'
+        self.state_key = prefix + 'state'
+        self.failures_key = prefix + 'failures'
+        self.probe_key = prefix + 'probe'
+        self.stats_prefix = prefix + 'stats:'
+
+    @property
+    def state(self):
+        state = cache.get(self.state_key)
+        if state is None:
+            return self.CLOSED
+        if state['name'] == self.OPEN and time.time() - state['since'] >= self.recovery_timeout:
+            return self.HALF_OPEN
+        return state['name']
+
+    def allow_request(self):
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        # В half_open пропускаем ровно один пробный запрос, блокировка пробы
+        # истекает сама, если воркер умер, не сообщив результат
+        if state == self.HALF_OPEN and cache.add(self.probe_key, 1, self.recovery_timeout):
+            self._transition(self.HALF_OPEN)
+            return True
+        metrics.incr(self.stats_prefix + 'rejected')
+        return False
+
+    def record_success(self):
+        if cache.get(self.state_key) is not None:
+            self._transition(self.CLOSED)
+
+    def record_failure(self):
+        metrics.incr(self.stats_prefix + 'failure')
+        if self.state == self.HALF_OPEN:
+            self._transition(self.OPEN)
+            return
+
+        cache.add(self.failures_key, 0, self.failure_window)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            return
+        if failures >= self.failure_threshold:
+            self._transition(self.OPEN)
+
+    def stats(self):
+        stats = metrics.read(self.stats_prefix, self.events)
+        stats['state'] = self.state
+        return stats
+
+    def _transition(self, new_state):
+        stored = cache.get(self.state_key)
+        old_state = stored['name'] if stored else self.CLOSED
+        if new_state == self.CLOSED:
+            cache.delete_many([self.state_key, self.failures_key, self.probe_key])
+        else:
+            if new_state == self.OPEN:
+                cache.delete_many([self.failures_key, self.probe_key])
+                since = time.time()
+            else:
+                since = stored['since'] if stored else time.time()
+            cache.set(self.state_key, {'name': new_state, 'since': since}, timeout=None)
+
+        if old_state != new_state:
+            metrics.incr(self.stats_prefix + self.transition_events[new_state])
+            logger.warning("Circuit breaker %s: %s -> %s", self.name, old_state, new_state)
+
+
+_breakers = {}
+
+
+def get_breaker(name):
+    """Один экземпляр на имя в процессе; состояние всё равно живёт в кэше"""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
+
+
+def all_breakers():
+    return dict(_breakers)
@@ -0,0 +1,168 @@
+"""
+Выгрузка истории подписок в CSV/XLSX. Строки читаются серверным курсором
+(.iterator(chunk_size=...)) и сразу уходят в ответ, поэтому расход памяти
+не зависит от количества подписок. Без серверных курсоров (PgBouncer в режиме
+transaction) -- keyset-страницами того же размера.
+Под ASGI CSV отдаётся асинхронным итератором (AsyncStreamingHttpResponse, см. core/asgi.py),
+строки читаются пачками в потоке запроса.
+"""
+import csv
+import itertools
+import tempfile
+
+import openpyxl
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.db.models import DecimalField, ExpressionWrapper, F, Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Subscription
+
+HEADERS = ('Email', 'Стоимость', 'Заработано', 'Процент комиссии', 'Дата оформления', 'Период (мес.)', 'Тариф',
+           'Квоты', 'Статус')
+PARTNER_HEADERS = ('Партнёр', 'ИНН партнёра')
+STATUSES = dict(Subscription.STATUS_CHOICES)
+
+FORMATS = ('csv', 'xlsx')
+
+
+class AsyncStreamingHttpResponse(StreamingHttpResponse):
+    """
+    StreamingHttpResponse с асинхронным итератором содержимого. Django 4.1 итерирует стриминговый
+    ответ в event loop синхронно, где ORM недоступна; такой ответ отдаёт core.asgi.ASGIHandler
+    через async for (в Django 4.2 это умеет сам StreamingHttpResponse)
+    """
+    is_async = True
+
+    @property
+    def streaming_content(self):
+        async def content():
+            try:
+                async for part in self._async_iterator:
+                    yield self.make_bytes(part)
+            finally:
+                # обрыв загрузки: исходный итератор закрывается сразу (и с ним курсор), а не сборщиком мусора
+                if hasattr(self._async_iterator, 'aclose'):
+                    await self._async_iterator.aclose()
+        return content()
+
+    @streaming_content.setter
+    def streaming_content(self, value):
+        self._async_iterator = value
+
+    def __iter__(self):
+        raise TypeError("AsyncStreamingHttpResponse отдаётся только ASGI-обработчиком core.asgi")
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: write() возвращает строку, а не пишет её"""
+
+    def write(self, value):
+        return value
+
+
+def subscription_rows(queryset, with_partner=False):
+    fields = ['email', 'cost_value', 'revenue_value', 'commission', 'reg_date', 'period', 'tariff', 'quotas', 'status']
+    if with_partner:
+        fields += ['partner__first_name', 'partner__last_name', 'partner__company_name', 'partner__inn']
+
+    revenue = ExpressionWrapper(F('cost_value') * F('commission') / 100,
+                                output_field=DecimalField(max_digits=15, decimal_places=3))
+    queryset = queryset.annotate(revenue_value=revenue).order_by('-reg_date', '-id')
+
+    for row in _iter_values(queryset, fields):
+        email, cost_value, revenue, commission, reg_date, period, tariff, quotas, status = row[:9]
+        line = [email, cost_value, revenue, commission, timezone.localtime(reg_date).strftime('%d.%m.%Y %H:%M'),
+                period, tariff, flatten_quotas(quotas), STATUSES[status]]
+        if with_partner:
+            first_name, last_name, company_name, inn = row[9:]
+            line += [company_name or f"{first_name} {last_name}", inn]
+        yield line
+
+
+def _iter_values(queryset, fields):
+    """values_list(*fields) по порядку (-reg_date, -id) без загрузки всего результата в память"""
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+    if not connections[queryset.db].settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+        yield from queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+        return
+
+    # без серверного курсора psycopg2 читает весь результат .iterator() на клиент
+    queryset = queryset.values_list(*fields, 'reg_date', 'id')
+    page = queryset
+    while True:
+        rows = list(page[:chunk_size])
+        for row in rows:
+            yield row[:-2]
+        if len(rows) < chunk_size:
+            return
+        reg_date, pk = rows[-1][-2:]
+        page = queryset.filter(Q(reg_date__lt=reg_date) | Q(reg_date=reg_date, id__lt=pk), reg_date__lte=reg_date)
+
+
+def flatten_quotas(quotas):
+    return '; '.join(f"{quota['name']}: {quota['value']}" for quota in quotas or ())
+
+
+def export_response(request, queryset, filename, file_format='csv', with_partner=False):
+    if file_format == 'xlsx':
+        return _xlsx_response(queryset, filename, with_partner)
+    return _csv_response(request, queryset, filename, with_partner)
+
+
+def _headers(with_partner):
+    return HEADERS + PARTNER_HEADERS if with_partner else HEADERS
+
+
+def _csv_lines(queryset, with_partner):
+    writer = csv.writer(Echo(), delimiter=';')
+    # BOM, чтобы Excel открыл UTF-8 с кириллицей
+    yield '﻿' + writer.writerow(_headers(with_partner))
+    for row in subscription_rows(queryset, with_partner):
+        yield writer.writerow(row)
+
+
+async def _async_csv_lines(queryset, with_partner):
+    """
+    _csv_lines пачками по EXPORT_CHUNK_SIZE строк. thread_sensitive: все пачки читаются в потоке
+    запроса (ThreadSensitiveContext ASGI-обработчика), в нём же открыт курсор
+    """
+    lines = _csv_lines(queryset, with_partner)
+    next_chunk = sync_to_async(lambda: ''.join(itertools.islice(lines, settings.EXPORT_CHUNK_SIZE)))
+    try:
+        while True:
+            chunk = await next_chunk()
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        # клиент мог оборвать загрузку -- курсор закрывается сразу, а не сборщиком мусора
+        await sync_to_async(lines.close)()
+
+
+def _csv_response(request, queryset, filename, with_partner):
+    filename = f'{filename}.csv'
+    if isinstance(request, ASGIRequest):
+        response = AsyncStreamingHttpResponse(_async_csv_lines(queryset, with_partner), content_type='text/csv')
+    else:
+        response = StreamingHttpResponse(_csv_lines(queryset, with_partner), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _xlsx_response(queryset, filename, with_partner):
+    # write_only книга сбрасывает строки во временный файл по мере записи
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Подписки')
+    sheet.append(_headers(with_partner))
+    for row in subscription_rows(queryset, with_partner):
+        sheet.append(row)
+
+    spool = tempfile.TemporaryFile()
+    workbook.save(spool)
+    spool.seek(0)
+    return FileResponse(spool, as_attachment=True, filename=f'{filename}.xlsx',
+                        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
@@ -1,11 +1,18 @@
+import base64
+import datetime
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm
 from django.forms import TextInput, PasswordInput
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from .catalogue import MAX_VERSIONS
 from .models import User, Partner
 
+EMAIL_TAKEN_ERROR = 'Аккаунт с таким email уже зарегистрирован.'
+
 
 class PartnerRegistrationForm(forms.ModelForm):
     email = forms.EmailField()
@@ -40,7 +47,7 @@ class PartnerRegistrationForm(forms.ModelForm):
             pass
 
         if user:
-            self.add_error('email', 'Аккаунт с таким email уже зарегистрирован.')
+            self.add_error('email', EMAIL_TAKEN_ERROR)
             self.fields['email'].widget.attrs['class'] = 'is-invalid'
 
         return email
@@ -61,32 +68,93 @@ class CustomAuthForm(AuthenticationForm):
 
 
 class SubscribeForm(forms.Form):
+    """
+    Без каталога -- выключенная форма (сервис оформления недоступен).
+    Формы с тарифами и полями квот создаёт subscribe_form_class, по классу на версию каталога.
+    """
     client_email = forms.EmailField()
     period = forms.IntegerField(widget=forms.Select)
     tariff = forms.ChoiceField(choices=())
 
-    def __init__(self, tariff_json, disable_form=False, *args, **kwargs):
-        super(SubscribeForm, self).__init__(*args, **kwargs)
-        if disable_form:
-            return
-        self.fields['tariff'].choices = [(obj['code'], obj['name']) for obj in tariff_json['tariffs']]
-        self.tariff_json = tariff_json
-
-        quotas = tariff_json['tariffs'][0]['quotas']
-        for quota in quotas:
-            code = quota['code']
-            self.fields[code] = forms.IntegerField(label=quota['name'])
+    catalogue = None
 
     def clean(self):
         cleaned_data = super().clean()
-        period = cleaned_data['period']
-        tariff_code = cleaned_data['tariff']
+        period = cleaned_data.get('period')
+        tariff = self.catalogue.tariffs.get(cleaned_data.get('tariff'))
 
-        tariffs = {}
-        for t in self.tariff_json['tariffs']:
-            tariffs[t['code']] = t['pricing']
-
-        if str(period) not in tariffs[tariff_code].keys():
+        if tariff is not None and period not in tariff.periods:
             raise ValidationError('input period value не соответствует тарифу')
 
         return cleaned_data
+
+
+class CatalogueChoiceField(forms.ChoiceField):
+    """
+    Выбор тарифа каталога. Каталог неизменяем, поэтому при создании формы (deepcopy полей класса)
+    choices не копируются поэлементно, как в ChoiceField, а переиспользуются,
+    а проверка значения -- поиск в множестве кодов, а не перебор choices
+    """
+
+    def __init__(self, *, choices, **kwargs):
+        super().__init__(choices=choices, **kwargs)
+        self.codes = frozenset(str(code) for code, _ in choices)
+
+    def __deepcopy__(self, memo):
+        result = forms.Field.__deepcopy__(self, memo)
+        result._choices = self._choices
+        return result
+
+    def valid_value(self, value):
+        return str(value) in self.codes
+
+
+_form_classes = {}
+
+
+def subscribe_form_class(catalogue):
+    """Класс SubscribeForm с выбором тарифа и полями квот каталога, кэшируется по версии каталога"""
+    form_class = _form_classes.get(catalogue.version)
+    if form_class is None:
+        attrs = {'catalogue': catalogue, 'tariff': CatalogueChoiceField(choices=catalogue.choices)}
+        for quota in catalogue.form_quotas:
+            attrs[quota.code] = forms.IntegerField(label=quota.name)
+        form_class = type('SubscribeForm', (SubscribeForm,), attrs)
+        if len(_form_classes) >= MAX_VERSIONS:
+            _form_classes.pop(next(iter(_form_classes)))
+        _form_classes[catalogue.version] = form_class
+    return form_class
+
+
+def subscribe_form(catalogue=None, *args, **kwargs):
+    if catalogue is None:
+        return SubscribeForm(*args, **kwargs)
+    return subscribe_form_class(catalogue)(*args, **kwargs)
+
+
+class SubscriptionHistoryForm(forms.Form):
+    """Фильтры и курсор страницы истории подписок (GET-параметры)"""
+    date_from = forms.DateField(required=False, label='С', widget=forms.DateInput(attrs={'type': 'date'}))
+    date_to = forms.DateField(required=False, label='По', widget=forms.DateInput(attrs={'type': 'date'}))
+    tariff = forms.CharField(required=False, max_length=32, label='Тариф')
+    cursor = forms.CharField(required=False, widget=forms.HiddenInput)
+    limit = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+
+    @staticmethod
+    def encode_cursor(subscription):
+        value = f"{subscription.reg_date.isoformat()}|{subscription.pk}"
+        return base64.urlsafe_b64encode(value.encode()).decode()
+
+    def clean_cursor(self):
+        cursor = self.cleaned_data['cursor']
+        if not cursor:
+            return None
+        try:
+            reg_date, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return datetime.datetime.fromisoformat(reg_date), int(pk)
+        except ValueError:
+            raise ValidationError('Некорректный курсор страницы')
+
+    def clean_limit(self):
+        limit = self.cleaned_data['limit'] or settings.HISTORY_PAGE_SIZE
+        return min(limit, settings.HISTORY_MAX_PAGE_SIZE)
@@ -0,0 +1,47 @@
+"""
+Кеш фрагментов личного кабинета (шапка, меню, сводка) по партнёру.
+Ключ фрагмента включает версию партнёра; invalidate() выдаёт новую версию, и старые фрагменты
+больше не читаются, а вытесняются кешем сами. Версия сбрасывается сигналами post_save (partner.signals)
+и явно там, где данные меняются через update()/bulk_update() без сигналов.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+VERSION_PREFIX = 'fragments:partner:'
+
+
+def _new_version():
+    # случайная, а не счётчик: версия, вытесненная из кеша, не совпадёт со старой
+    return uuid.uuid4().hex
+
+
+def version(partner_id):
+    key = VERSION_PREFIX + str(partner_id)
+    current = cache.get(key)
+    if current is None:
+        cache.add(key, _new_version(), timeout=None)
+        current = cache.get(key)
+    return current
+
+
+def invalidate(partner_id):
+    cache.set(VERSION_PREFIX + str(partner_id), _new_version(), timeout=None)
+
+
+def invalidate_many(partner_ids):
+    cache.set_many({VERSION_PREFIX + str(pk): _new_version() for pk in partner_ids}, timeout=None)
+
+
+def fragment_key(name, partner_id, partner_version, vary_on=()):
+    return make_template_fragment_key(name, [partner_id, partner_version, *vary_on])
+
+
+def fetch(key):
+    return cache.get(key)
+
+
+def store(key, html):
+    cache.set(key, html, settings.FRAGMENT_CACHE_TTL)
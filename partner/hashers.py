@@ -0,0 +1,90 @@
+"""
+Хеширование паролей.
+Параметры Argon2 и scrypt задаются в настройках (PASSWORD_ARGON2_*, PASSWORD_SCRYPT_*) и подбираются
+под железо командой benchmark_password_hashers. Хеши со старыми параметрами или другим алгоритмом
+Django пересчитывает при следующем успешном входе (check_password с setter).
+make_passwords хеширует пачку паролей в пуле процессов -- для массовой выдачи данных для входа.
+"""
+import atexit
+import base64
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Меньше паролей хешируем в текущем процессе: передача в пул дороже
+MIN_POOL_PASSWORDS = 4
+
+_pool = None
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Пакет argon2-cffi -- в requirements.txt"""
+    time_cost = settings.PASSWORD_ARGON2_TIME_COST
+    memory_cost = settings.PASSWORD_ARGON2_MEMORY_COST
+    parallelism = settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    work_factor = settings.PASSWORD_SCRYPT_WORK_FACTOR
+    block_size = settings.PASSWORD_SCRYPT_BLOCK_SIZE
+    parallelism = settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @staticmethod
+    def scrypt_maxmem(n, r, p):
+        # scrypt занимает ~128 * n * r * p байт; по умолчанию OpenSSL ограничивает память 32 МБ,
+        # чего не хватает уже при work_factor 2 ** 15
+        return 2 * 128 * n * r * p
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        # как в django, но maxmem -- по параметрам именно этого хеша: verify() передаёт n, r, p
+        # из сохранённого хеша, и после уменьшения work_factor старые хеши тоже должны проверяться
+        self._check_encode_args(password, salt)
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p,
+                               maxmem=self.scrypt_maxmem(n, r, p), dklen=64)
+        hash_ = base64.b64encode(hash_).decode('ascii').strip()
+        return '%s$%d$%s$%d$%d$%s' % (self.algorithm, n, salt, r, p, hash_)
+
+
+def _init_worker():
+    # при запуске процессов через spawn (не fork) Django в дочернем процессе не настроен
+    if not apps.ready:
+        django.setup()
+
+
+def _shutdown_pool():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def get_pool():
+    """Пул создаётся при первой пачке и переиспользуется процессом (воркер очереди писем)"""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, initializer=_init_worker)
+        atexit.register(_shutdown_pool)
+    return _pool
+
+
+def make_passwords(passwords, workers=None):
+    """Хеши паролей в том же порядке; workers -- число процессов, по умолчанию PASSWORD_HASH_WORKERS"""
+    workers = settings.PASSWORD_HASH_WORKERS if workers is None else workers
+    if workers <= 1 or len(passwords) < MIN_POOL_PASSWORDS:
+        return [hashers.make_password(password) for password in passwords]
+    if workers == settings.PASSWORD_HASH_WORKERS:
+        pool = get_pool()
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    try:
+        # куски примерно поровну на процесс: меньше передач между процессами
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(hashers.make_password, passwords, chunksize=chunksize))
+    finally:
+        if pool is not _pool:
+            pool.shutdown()
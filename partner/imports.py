@@ -0,0 +1,163 @@
+"""
+Массовый импорт партнёров из CSV: команда import_partners и загрузка в админке.
+Файл читается потоком, строки проверяются теми же правилами, что PartnerRegistrationForm,
+и обрабатываются пачками по IMPORT_BATCH_SIZE: занятые email -- один запрос IN на пачку,
+User и Partner -- bulk_create в одной транзакции на пачку.
+Ошибки сообщаются по строкам через on_error(строка, email, текст), файл не прерывается.
+"""
+import csv
+import itertools
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .forms import EMAIL_TAKEN_ERROR, PartnerRegistrationForm
+from .models import Partner, User
+
+COLUMNS = ('email',) + PartnerRegistrationForm._meta.fields
+# company_name необязательна, как и в форме регистрации
+REQUIRED_COLUMNS = ('email', 'first_name', 'last_name', 'inn', 'phone_number')
+DELIMITERS = ',;\t'
+REPORT_HEADERS = ('Строка', 'Email', 'Ошибки')
+
+
+class ImportFileError(ValueError):
+    """Файл нельзя импортировать целиком: нет нужных колонок, неверная кодировка"""
+
+
+class ImportRowForm(PartnerRegistrationForm):
+    """Правила формы регистрации без запроса на строку: занятые email проверяются пачкой"""
+
+    def clean_email(self):
+        return self.cleaned_data['email']
+
+
+class ImportResult:
+    __slots__ = ('rows', 'created', 'failed', 'started', 'finished')
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def seconds(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rate(self):
+        """Строк в секунду"""
+        seconds = self.seconds()
+        return self.rows / seconds if seconds else 0.0
+
+
+def read_rows(stream):
+    """(номер строки файла, dict) для каждой строки; разделитель -- по заголовку"""
+    header = stream.readline()
+    if not header.strip():
+        raise ImportFileError("Файл пуст")
+    delimiter = max(DELIMITERS, key=header.count)
+    reader = csv.DictReader(itertools.chain([header], stream), delimiter=delimiter)
+    fieldnames = [name.strip() for name in reader.fieldnames]
+    missing = [column for column in REQUIRED_COLUMNS if column not in fieldnames]
+    if missing:
+        raise ImportFileError(f"Нет колонок: {', '.join(missing)}. Ожидаются колонки: {', '.join(COLUMNS)}")
+    reader.fieldnames = fieldnames
+    for row in reader:
+        yield reader.line_num, row
+
+
+def form_errors(form):
+    return '; '.join(f"{form[name].label}: {' '.join(errors)}" if name in form.fields
+                     else ' '.join(errors)
+                     for name, errors in form.errors.items())
+
+
+def import_partners(stream, on_error=None, batch_size=None, dry_run=False):
+    """
+    stream -- текстовый поток CSV с заголовком из COLUMNS.
+    dry_run -- только проверка (в т.ч. занятых email), без записи в БД.
+    """
+    on_error = on_error or (lambda line, email, error: None)
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    result = ImportResult()
+    # email из уже прочитанных строк файла -- дубликаты внутри файла
+    seen = set()
+    rows = read_rows(stream)
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, batch_size))
+            if not chunk:
+                break
+            _import_batch(chunk, seen, result, on_error, dry_run)
+    except UnicodeDecodeError as e:
+        # предыдущие пачки уже сохранены -- после исправления файла их строки будут отклонены как занятые
+        raise ImportFileError(f"Не удалось прочитать файл в выбранной кодировке ({e.reason}), "
+                              f"обработано строк: {result.rows}")
+    result.stop()
+    return result
+
+
+def _import_batch(chunk, seen, result, on_error, dry_run):
+    rejected = []
+    valid = []
+    for line, row in chunk:
+        result.rows += 1
+        form = ImportRowForm({column: (row.get(column) or '').strip() for column in COLUMNS})
+        email = form.data['email']
+        if not form.is_valid():
+            rejected.append((line, email, form_errors(form)))
+        elif email in seen:
+            rejected.append((line, email, "Email повторяется в файле."))
+        else:
+            seen.add(email)
+            valid.append((line, form))
+
+    for attempt in range(2):
+        taken = set(User.objects.filter(email__in=[form.cleaned_data['email'] for _, form in valid])
+                    .values_list('email', flat=True))
+        if taken:
+            for line, form in valid:
+                if form.cleaned_data['email'] in taken:
+                    rejected.append((line, form.cleaned_data['email'], EMAIL_TAKEN_ERROR))
+            valid = [(line, form) for line, form in valid if form.cleaned_data['email'] not in taken]
+        if dry_run or not valid:
+            break
+        try:
+            _create([form for _, form in valid])
+        except IntegrityError:
+            # email заняли между проверкой и вставкой (регистрация на сайте) -- пачка откатилась,
+            # проверяем её ещё раз; при повторной ошибке исключение уходит наверх
+            if attempt:
+                raise
+            continue
+        break
+    result.created += len(valid)
+    result.failed += len(rejected)
+    # в отчёте -- по порядку строк файла
+    for error in sorted(rejected, key=lambda error: error[0]):
+        on_error(*error)
+
+
+def _create(forms):
+    now = timezone.now()
+    with transaction.atomic():
+        users = []
+        for form in forms:
+            # как create_user(email) в форме регистрации: пароль неиспользуемый, аккаунт неактивен
+            user = User(email=form.cleaned_data['email'])
+            user.set_unusable_password()
+            users.append(user)
+        users = User.objects.bulk_create(users)
+        partners = []
+        for user, form in zip(users, forms):
+            partner = form.instance
+            partner.user = user
+            partner.date_registered = now
+            partners.append(partner)
+        Partner.objects.bulk_create(partners)
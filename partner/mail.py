@@ -0,0 +1,197 @@
+"""
+Очередь исходящих писем: админка сохраняет письмо (QueuedEmail) и сразу отвечает,
+команда process_mail_queue отправляет пачки через одно SMTP-соединение
+(get_connection().send_messages) с повторами и экспоненциальной паузой.
+Письма с данными для входа ставятся в очередь без текста: пароли генерируются воркером
+для всей пачки прямо перед отправкой, в БД попадают только их хеши.
+"""
+import logging
+import random
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template import Context, Engine
+from django.urls import reverse
+from django.utils import timezone
+
+from . import hashers
+from .models import QueuedEmail, User
+
+logger = logging.getLogger(__name__)
+
+# Адрес отклонён сервером -- повтор не поможет
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused,)
+# Сервер недоступен, оборвал соединение или не принял логин: остальные письма пачки
+# возвращаются в очередь, а не подключаются заново по одному (каждое -- до EMAIL_TIMEOUT)
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError,
+                     smtplib.SMTPAuthenticationError)
+
+
+CREDENTIALS_SUBJECT = "Данные для входа в личный кабинет Adesk Partner"
+# Писем в одном INSERT при постановке в очередь
+ENQUEUE_BATCH_SIZE = 1000
+
+
+def enqueue_many(emails):
+    """emails -- QueuedEmail без next_attempt_at; сохраняются одним INSERT на пачку"""
+    now = timezone.now()
+    for email in emails:
+        email.next_attempt_at = now
+    return QueuedEmail.objects.bulk_create(emails, batch_size=ENQUEUE_BATCH_SIZE)
+
+
+def credentials_email(user):
+    """Письмо с данными для входа партнёра (не сохранено), пароль сгенерирует воркер"""
+    return QueuedEmail(user=user, to=user.email, subject=CREDENTIALS_SUBJECT, kind=QueuedEmail.CREDENTIALS)
+
+
+def render_credentials(email, password):
+    template = Engine.get_default().get_template('partner/email.html')
+    context = Context({
+        "title": "Завершение регистрации Adesk Partner",
+        "text": f"Теперь вы можете войти в личный кабинет партнёра."
+                f"<br><br>Логин: {email}"
+                f"<br>Пароль: {password}",
+        "link_text": "Войти",
+        "link_url": reverse('partner:login')
+    })
+    return template.render(context)
+
+
+def issue_credentials(batch):
+    """
+    Новые пароли для писем с данными для входа в пачке: хеши -- в пуле процессов (hashers.make_passwords),
+    один bulk_update, текст писем -- только в памяти
+    """
+    items = [item for item in batch if item.kind == QueuedEmail.CREDENTIALS and item.user_id is not None]
+    passwords = [User.objects.make_random_password() for _ in items]
+    users = []
+    for item, password, encoded in zip(items, passwords, hashers.make_passwords(passwords)):
+        users.append(User(pk=item.user_id, password=encoded))
+        item.body = render_credentials(item.to, password)
+    User.objects.bulk_update(users, ['password'])
+
+
+def claim_batch(batch_size):
+    """
+    Забирает до batch_size писем, готовых к отправке, и "арендует" их сдвигом next_attempt_at
+    на MAIL_LEASE_TIMEOUT -- так же, как outbox подписок
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(QueuedEmail.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(status=QueuedEmail.PENDING, next_attempt_at__lte=now)
+                     .order_by('next_attempt_at')[:batch_size])
+        QueuedEmail.objects.filter(pk__in=[item.pk for item in batch]).update(
+            next_attempt_at=now + timezone.timedelta(seconds=settings.MAIL_LEASE_TIMEOUT))
+    return batch
+
+
+def build_message(item):
+    message = EmailMessage(subject=item.subject, body=item.body, to=[item.to])
+    if item.html:
+        message.content_subtype = 'html'
+    return message
+
+
+def is_connection_error(error):
+    # SMTPException -- тоже OSError, но отказ в одном письме соединение не ломает;
+    # прочие OSError -- сетевые (отказ в соединении, таймаут, DNS)
+    return isinstance(error, CONNECTION_ERRORS) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException))
+
+
+def process_batch(batch_size=None):
+    """
+    Отправляет одну пачку через одно соединение; возвращает число обработанных писем.
+    При ошибке соединения необработанные письма пачки возвращаются в очередь без траты попытки
+    """
+    batch = claim_batch(batch_size or settings.MAIL_BATCH_SIZE)
+    if not batch:
+        return 0
+
+    connection = get_connection()
+    try:
+        # до выдачи паролей: пока сервер недоступен, пароли пользователей не меняются
+        connection.open()
+    except Exception as e:
+        logger.warning("SMTP-сервер недоступен, писем возвращено в очередь: %d (%r)", len(batch), e)
+        release(batch, repr(e))
+        return 0
+
+    issue_credentials(batch)
+    sent_items = []
+    processed = len(batch)
+    try:
+        for index, item in enumerate(batch):
+            if item.kind == QueuedEmail.CREDENTIALS and item.user_id is None:
+                fail(item, "Пользователь удалён")
+                continue
+            try:
+                # open() ничего не делает, если соединение уже открыто; по одному письму
+                # в send_messages, чтобы ошибка одного письма не отменяла остальные
+                connection.open()
+                sent = connection.send_messages([build_message(item)])
+            except PERMANENT_ERRORS as e:
+                fail(item, repr(e))
+            except Exception as e:
+                logger.warning("Письмо %s не отправлено: %r", item.pk, e)
+                retry_later(item, repr(e))
+                if is_connection_error(e):
+                    rest = batch[index + 1:]
+                    release(rest, repr(e))
+                    processed -= len(rest)
+                    break
+                # после ошибки письма соединение могло остаться в неопределённом состоянии
+                _close(connection)
+            else:
+                if sent:
+                    sent_items.append(item)
+                else:
+                    fail(item, "Сервер не принял письмо")
+    finally:
+        _close(connection)
+        mark_sent(sent_items)
+    return processed
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        logger.warning("Ошибка при закрытии SMTP-соединения", exc_info=True)
+
+
+def mark_sent(items):
+    QueuedEmail.objects.filter(pk__in=[item.pk for item in items]).update(
+        status=QueuedEmail.SENT, body='', sent_at=timezone.now(), attempts=F('attempts') + 1, last_error='')
+
+
+def fail(item, error):
+    QueuedEmail.objects.filter(pk=item.pk).update(status=QueuedEmail.FAILED, body='', attempts=item.attempts + 1,
+                                                  last_error=error)
+
+
+def release(items, error):
+    """Снимает аренду с писем, до которых не дошла отправка: попытка не засчитывается"""
+    if not items:
+        return
+    delay = random.uniform(settings.MAIL_RETRY_BACKOFF, 1.5 * settings.MAIL_RETRY_BACKOFF)
+    QueuedEmail.objects.filter(pk__in=[item.pk for item in items]).update(
+        last_error=error, next_attempt_at=timezone.now() + timezone.timedelta(seconds=delay))
+
+
+def retry_later(item, error):
+    attempts = item.attempts + 1
+    if attempts >= settings.MAIL_MAX_ATTEMPTS:
+        fail(item, error)
+        return
+
+    delay = random.uniform(0, settings.MAIL_RETRY_BACKOFF * (2 ** attempts))
+    QueuedEmail.objects.filter(pk=item.pk).update(
+        attempts=attempts, last_error=error,
+        next_attempt_at=timezone.now() + timezone.timedelta(seconds=delay))
@@ -0,0 +1,41 @@
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from partner import timing
+from partner.models import User
+
+
+class Command(BaseCommand):
+    help = ("Время рендеринга страниц кабинета без кеша фрагментов и с ним (FRAGMENT_CACHE_TTL), "
+            "по фазе render RequestTimingMiddleware")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Пользователь, от имени которого запрашиваются страницы")
+        parser.add_argument('--url', nargs='*', help="По умолчанию -- профиль и история подписок")
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, email, url, requests, **options):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {email} не найден")
+        urls = url or [reverse('partner:account_profile'), reverse('partner:account_history')]
+
+        client = Client()
+        client.force_login(user)
+        for page in urls:
+            for ttl in (0, settings.FRAGMENT_CACHE_TTL or 3600):
+                with override_settings(FRAGMENT_CACHE_TTL=ttl, ALLOWED_HOSTS=['testserver']):
+                    # первый запрос компилирует шаблоны и заполняет кеш фрагментов
+                    client.get(page)
+                    with timing.captured() as timings:
+                        for _ in range(requests):
+                            client.get(page)
+                render = statistics.median(t.phases['render'] for t in timings) * 1000
+                total = statistics.median(t.total() for t in timings) * 1000
+                self.stdout.write(f"{page} {'с кешем' if ttl else 'без кеша'}: "
+                                  f"render {render:.2f} мс, всего {total:.2f} мс (медианы)")
@@ -0,0 +1,97 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.contrib import admin
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from partner.models import Partner, Subscription, User
+
+# Синтетические данные отличаются доменом email и удаляются через --cleanup
+BENCH_DOMAIN = 'bench.invalid'
+FIRST_NAMES = ('Иван', 'Пётр', 'Анна', 'Мария', 'Олег', 'Елена', 'Сергей', 'Ольга')
+LAST_NAMES = ('Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Волков', 'Зайцев')
+# в подписке хранится название тарифа, как его отдаёт api Adesk
+TARIFFS = ('Бизнес', 'Старт', 'Про')
+
+
+class Command(BaseCommand):
+    help = ("Время поиска в changelist админки (поиск, COUNT и первая страница) на синтетических данных. "
+            "Запускать на отдельной базе: --seed добавляет партнёров и подписки с email @" + BENCH_DOMAIN)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Создать синтетические данные")
+        parser.add_argument('--partners', type=int, default=10000)
+        parser.add_argument('--subscriptions', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true', help="Удалить синтетические данные и выйти")
+
+    def handle(self, *args, seed, partners, subscriptions, batch_size, repeat, cleanup, **options):
+        if cleanup:
+            deleted, _ = User.objects.filter(email__endswith='@' + BENCH_DOMAIN).delete()
+            self.stdout.write(self.style.SUCCESS(f"Удалено объектов: {deleted}"))
+            return
+        if seed:
+            self.seed(partners, subscriptions, batch_size)
+
+        sample = Partner.objects.filter(user__email__endswith='@' + BENCH_DOMAIN).select_related('user').last()
+        if sample is None:
+            self.stderr.write("Нет синтетических данных, запустите с --seed")
+            return
+
+        terms = {
+            'ИНН': sample.inn,
+            'email партнёра': sample.user.email,
+            'номер договора': sample.contract_number,
+            'фамилия': sample.last_name[:5],
+            'часть email': 'client12345',
+            'тариф': 'старт',
+            # под имя подходит больше MAX_PARTNER_MATCHES партнёров
+            'частое имя': 'Иван',
+        }
+        for model in (User, Subscription):
+            model_admin = admin.site._registry[model]
+            for label, term in terms.items():
+                timings = [self.run_search(model_admin, term) for _ in range(repeat)]
+                self.stdout.write(f"{model.__name__} / {label} ({term}): "
+                                  f"медиана {statistics.median(timings):.1f} мс, max {max(timings):.1f} мс")
+
+    @staticmethod
+    def run_search(model_admin, term):
+        request = RequestFactory().get('/', {'q': term})
+        start = time.perf_counter()
+        queryset, _ = model_admin.get_search_results(request, model_admin.get_queryset(request), term)
+        ordering = model_admin.get_ordering(request) or ('-pk',)
+        queryset = queryset.order_by(*ordering, '-pk')
+        queryset.count()
+        list(queryset[:model_admin.list_per_page])
+        return (time.perf_counter() - start) * 1000
+
+    def seed(self, partners, subscriptions, batch_size):
+        started = User.objects.filter(email__endswith='@' + BENCH_DOMAIN).count()
+        users = User.objects.bulk_create(
+            [User(email=f'partner{started + i}@{BENCH_DOMAIN}', is_active=True, password='!')
+             for i in range(partners)], batch_size=batch_size)
+        partner_objs = Partner.objects.bulk_create(
+            [Partner(user=user, inn=f'{7700000000 + started + i}', phone_number='+70000000000',
+                     first_name=random.choice(FIRST_NAMES), last_name=random.choice(LAST_NAMES),
+                     company_name=f'ООО Компания {started + i}' if i % 3 else None,
+                     contract_number=f'Д-{started + i}', commission=10)
+             for i, user in enumerate(users)], batch_size=batch_size)
+
+        now = timezone.now()
+        for offset in range(0, subscriptions, batch_size):
+            Subscription.objects.bulk_create(
+                [Subscription(partner=random.choice(partner_objs), email=f'client{offset + i}@example.com',
+                              cost_value=10000, commission=10, period=12, tariff=random.choice(TARIFFS),
+                              reg_date=now - datetime.timedelta(minutes=offset + i))
+                 for i in range(min(batch_size, subscriptions - offset))])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE partner_user, partner_partner, partner_subscription')
+        self.stdout.write(self.style.SUCCESS(f"Создано партнёров: {partners}, подписок: {subscriptions}"))
@@ -0,0 +1,48 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests as req
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import Api
+
+
+class Command(BaseCommand):
+    help = ("Запросы к api через общую keep-alive сессию Api.session() и новым соединением на запрос "
+            "(requests.get, как до пула) против локальной заглушки partner.upstream_stub: "
+            "запросов в секунду, p50/p95 и число открытых TCP-соединений")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--delay', type=float, default=0.005, help="Задержка ответа заглушки, с")
+
+    def handle(self, *args, requests, concurrency, delay, **options):
+        with UpstreamStub(delay=delay) as stub, override_settings(**stub.settings()):
+            url = stub.url + '/tariffs'
+            variants = (
+                ('без пула (requests.get)', lambda: req.get(url, timeout=2).json()),
+                ('Api.session()', lambda: Api.get(url)),
+            )
+            for label, call in variants:
+                stub.reset()
+                timings, elapsed = self.run(call, requests, concurrency)
+                p50 = statistics.median(timings) * 1000
+                p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+                self.stdout.write(f"{label}: {len(timings) / elapsed:.0f} запросов/с, p50 {p50:.1f} мс, "
+                                  f"p95 {p95:.1f} мс, TCP-соединений: {stub.connections}")
+
+    @staticmethod
+    def run(call, requests, concurrency):
+        def timed(_):
+            start = time.perf_counter()
+            call()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = sorted(pool.map(timed, range(requests)))
+        return timings, time.perf_counter() - start
@@ -0,0 +1,116 @@
+import asyncio
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client, override_settings
+from django.urls import include, path
+
+from partner.models import Partner
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import CheckoutView, TariffsCache
+from partner.views.async_account_views import AsyncCheckoutView
+
+SYNC_URL = '/bench/sync/checkout'
+# формы уходят как из браузера; multipart AsyncClient в Django 4.1 читает тело за пределы FakePayload
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+ASYNC_URL = '/bench/async/checkout'
+
+# ROOT_URLCONF на время замера: обе версии checkout рядом, остальное -- как в core.urls
+urlpatterns = [
+    path(SYNC_URL.lstrip('/'), CheckoutView.as_view()),
+    path(ASYNC_URL.lstrip('/'), AsyncCheckoutView.as_view()),
+    path('', include('core.urls')),
+]
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочное сравнение CheckoutView и AsyncCheckoutView при медленном upstream "
+            "(локальная заглушка partner.upstream_stub): sync -- пул из --threads потоков, как воркер "
+            "gunicorn с потоками; async -- один event loop с --concurrency одновременных запросов")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Email пользователя-партнёра")
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--delay', type=float, default=0.1, help="Задержка ответа заглушки, с")
+
+    def handle(self, *args, email, requests, threads, concurrency, delay, **options):
+        try:
+            partner = Partner.objects.select_related('user').get(user__email=email)
+        except Partner.DoesNotExist:
+            raise CommandError(f"Партнёр {email} не найден")
+
+        with UpstreamStub(delay=delay) as stub, override_settings(
+                ROOT_URLCONF=__name__, ALLOWED_HOSTS=['testserver'], PRICING_ENGINE='shadow', **stub.settings()):
+            TariffsCache.invalidate()
+            catalogue = TariffsCache.get_catalogue()
+            tariff = next(t for t in catalogue.tariffs.values() if len(t.periods) and t.is_customizable)
+            period = min(tariff.periods)
+            quota = catalogue.form_quotas[0]
+            # у каждого запроса своё количество квоты: кэш расчётов (в т.ч. от прошлых запусков)
+            # не срабатывает, каждый запрос идёт в upstream
+            offset = random.randrange(10 ** 6) * requests * 2
+            forms = []
+            for i in range(requests * 2):
+                data = {'client_email': email, 'tariff': tariff.code, 'period': period}
+                data.update({q.code: q.quantity for q in catalogue.form_quotas})
+                data[quota.code] = quota.quantity + 1 + offset + i
+                forms.append(urlencode(data))
+
+            stub.reset()
+            timings, elapsed = self.run_sync(partner.user, forms[:requests], threads)
+            self.report(f"sync, {threads} потоков", timings, elapsed, stub)
+            stub.reset()
+            # вход -- синхронно, до запуска event loop
+            client = AsyncClient()
+            client.force_login(partner.user)
+            timings, elapsed = asyncio.run(self.run_async(client, forms[requests:], concurrency))
+            self.report(f"async, {concurrency} одновременно", timings, elapsed, stub)
+
+    @staticmethod
+    def run_sync(user, forms, threads):
+        def worker(chunk):
+            client = Client()
+            client.force_login(user)
+            timings = []
+            try:
+                for data in chunk:
+                    start = time.perf_counter()
+                    response = client.post(SYNC_URL, data, content_type=FORM_CONTENT_TYPE)
+                    timings.append((time.perf_counter() - start, response.status_code))
+            finally:
+                connection.close()
+            return timings
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            timings = [t for result in pool.map(worker, [forms[i::threads] for i in range(threads)]) for t in result]
+        return timings, time.perf_counter() - start
+
+    @staticmethod
+    async def run_async(client, forms, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(data):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(ASYNC_URL, data, content_type=FORM_CONTENT_TYPE)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*[one(data) for data in forms])
+        return list(timings), time.perf_counter() - start
+
+    def report(self, label, timings, elapsed, stub):
+        errors = sum(1 for _, status in timings if status != 200)
+        durations = sorted(duration for duration, _ in timings)
+        p50 = statistics.median(durations) * 1000
+        p95 = durations[int(len(durations) * 0.95) - 1] * 1000
+        self.stdout.write(f"{label}: {len(durations) / elapsed:.0f} запросов/с, p50 {p50:.0f} мс, "
+                          f"p95 {p95:.0f} мс, запросов в upstream {stub.requests}, ошибок {errors}")
@@ -0,0 +1,111 @@
+import itertools
+import json
+import timeit
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from partner.catalogue import catalogue_version, compile_catalogue, get_catalogue
+from partner.forms import subscribe_form
+from partner.upstream_stub import TARIFFS
+from partner.views.account_views import TariffsCache, checkout_api_data
+
+
+class LegacySubscribeForm(forms.Form):
+    """SubscribeForm до компиляции каталога: choices и поля квот -- на каждый экземпляр, clean() -- по json"""
+    client_email = forms.EmailField()
+    period = forms.IntegerField(widget=forms.Select)
+    tariff = forms.ChoiceField(choices=())
+
+    def __init__(self, tariff_json, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['tariff'].choices = [(obj['code'], obj['name']) for obj in tariff_json['tariffs']]
+        self.tariff_json = tariff_json
+        for quota in tariff_json['tariffs'][0]['quotas']:
+            self.fields[quota['code']] = forms.IntegerField(label=quota['name'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        tariffs = {}
+        for t in self.tariff_json['tariffs']:
+            tariffs[t['code']] = t['pricing']
+        if str(cleaned_data['period']) not in tariffs[cleaned_data['tariff']].keys():
+            raise ValidationError('input period value не соответствует тарифу')
+        return cleaned_data
+
+
+def legacy_api_data(tariffs_json, sub_form):
+    """parse_checkout_form до компиляции каталога: поиск тарифа перебором json"""
+    tariff_code = sub_form.cleaned_data['tariff']
+    tariff_obj = next(filter(lambda t: t['code'] == tariff_code, tariffs_json['tariffs']))
+    extra_quotas = {}
+    for quota in tariff_obj['quotas']:
+        extra_value = sub_form.cleaned_data[quota['code']] - quota['quantity']
+        if extra_value > 0:
+            extra_quotas[quota['code']] = extra_value
+    return tariff_obj, {'client_email': sub_form.cleaned_data['client_email'],
+                        'period': sub_form.cleaned_data['period'], 'tariff': tariff_code,
+                        'extra_quotas': json.dumps(extra_quotas), 'extra_options': "[]"}
+
+
+class Command(BaseCommand):
+    help = ("Построение и проверка SubscribeForm и сбор данных для CHECKOUT_LINK: по json каталога "
+            "(как до partner.catalogue) и по скомпилированному каталогу, мкс на операцию")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=2000, help="Повторов каждой операции")
+        parser.add_argument('--live', action='store_true',
+                            help="Каталог из TariffsCache (api Adesk), по умолчанию -- из partner.upstream_stub")
+        parser.add_argument('--tariffs', type=int, default=0,
+                            help="Дополнить каталог копиями тарифов до этого числа -- как растёт цена перебора json")
+
+    def handle(self, *args, number, live, tariffs, **options):
+        tariffs_json = TariffsCache.get() if live else TARIFFS
+        if tariffs > len(tariffs_json['tariffs']):
+            # копии -- в начале списка: выбранный в форме тариф перебор json находит последним
+            copies = [dict(t, code=f"{t['code']}_{i}") for i, t in
+                      zip(range(tariffs - len(tariffs_json['tariffs'])), itertools.cycle(tariffs_json['tariffs']))]
+            tariffs_json = {'tariffs': copies + tariffs_json['tariffs']}
+        catalogue = get_catalogue(tariffs_json)
+        tariff = next(t for t in reversed(catalogue.tariffs.values()) if t.is_customizable)
+        data = {'client_email': 'client@example.com', 'tariff': tariff.code, 'period': min(tariff.periods)}
+        data.update({q.code: q.quantity + 1 for q in catalogue.form_quotas})
+        self.stdout.write(f"Тарифов в каталоге: {len(catalogue.tariffs)}, квот в форме: {len(catalogue.form_quotas)}")
+
+        def legacy_validated():
+            form = LegacySubscribeForm(tariffs_json, data=data)
+            assert form.is_valid(), form.errors
+            return form
+
+        def compiled_validated():
+            form = subscribe_form(catalogue, data=data)
+            assert form.is_valid(), form.errors
+            return form
+
+        legacy_form, compiled_form = legacy_validated(), compiled_validated()
+        rows = (
+            ("пустая форма (страница профиля)",
+             lambda: LegacySubscribeForm(tariffs_json), lambda: subscribe_form(catalogue)),
+            ("форма с данными + is_valid()", legacy_validated, compiled_validated),
+            ("тариф и данные для CHECKOUT_LINK",
+             lambda: legacy_api_data(tariffs_json, legacy_form), lambda: checkout_api_data(catalogue, compiled_form)),
+            ("checkout целиком (форма, проверка, данные)",
+             lambda: legacy_api_data(tariffs_json, legacy_validated()),
+             lambda: checkout_api_data(catalogue, compiled_validated())),
+        )
+        for label, legacy, compiled in rows:
+            legacy_us = self.measure(legacy, number)
+            compiled_us = self.measure(compiled, number)
+            self.stdout.write(f"{label}: по json {legacy_us:.1f} мкс, по каталогу {compiled_us:.1f} мкс "
+                              f"(x{legacy_us / compiled_us:.1f})")
+
+        version = catalogue_version(tariffs_json)
+        self.stdout.write(f"разовые: версия каталога (хэш json) {self.measure(lambda: catalogue_version(tariffs_json), number):.1f} мкс, "
+                          f"компиляция {self.measure(lambda: compile_catalogue(tariffs_json, version), number):.1f} мкс, "
+                          f"get_catalogue по версии {self.measure(lambda: get_catalogue(tariffs_json, version), number):.2f} мкс")
+
+    @staticmethod
+    def measure(func, number):
+        """Лучшее из трёх прогонов, мкс на вызов"""
+        return min(timeit.repeat(func, number=number, repeat=3)) / number * 10 ** 6
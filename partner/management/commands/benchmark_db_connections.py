@@ -0,0 +1,90 @@
+import http.client
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from partner.models import User
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Запросов в секунду к странице с новым соединением с БД на каждый запрос (CONN_MAX_AGE=0) "
+            "и с постоянными соединениями из настроек. Запросы идут по HTTP в WSGI-сервер в отдельном потоке "
+            "(один поток, как синхронный воркер gunicorn): соединения закрываются по request_finished, "
+            "число открытых соединений считается по сигналу connection_created")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Пользователь, от имени которого запрашивается страница")
+        parser.add_argument('--url', help="По умолчанию -- история подписок")
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, email, url, requests, **options):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {email} не найден")
+        url = url or reverse('partner:account_history')
+
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS and settings.ALLOWED_HOSTS[0] != '*' else 'localhost'
+        # сессия -- от тестового клиента, дальше запросы идут мимо него: django.test.Client
+        # отключает close_old_connections, и соединения не закрывались бы ни при каком CONN_MAX_AGE
+        client = Client()
+        client.force_login(user)
+        headers = {'Host': host,
+                   'Cookie': '; '.join(f'{morsel.key}={morsel.value}' for morsel in client.cookies.values())}
+
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                opened.append(connection.alias)
+
+        server = WSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(WSGIHandler())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        connection_created.connect(count_connection)
+
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        try:
+            for max_age in (0, configured):
+                # settings_dict общий для соединений всех потоков, новое значение действует
+                # с ближайшего подключения сервера
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                self.get(server, url, headers)
+                opened.clear()
+                start = time.perf_counter()
+                for _ in range(requests):
+                    self.get(server, url, headers)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"CONN_MAX_AGE={max_age}: {requests / elapsed:.0f} запросов/с, "
+                                  f"{elapsed / requests * 1000:.2f} мс на запрос, соединений с БД {len(opened)}")
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+            connection_created.disconnect(count_connection)
+            server.shutdown()
+            server.server_close()
+
+    @staticmethod
+    def get(server, url, headers):
+        conn = http.client.HTTPConnection(*server.server_address)
+        try:
+            conn.request('GET', url, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise CommandError(f"{url}: HTTP {response.status}")
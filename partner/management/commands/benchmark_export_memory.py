@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import gc
+import os
+import resource
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from partner import export
+from partner.models import Partner, Subscription, User
+from partner.views.account_views import AccountHistoryExportView
+
+# Синтетические данные -- в том же домене, что у benchmark_admin_search, удаляются через --cleanup
+BENCH_EMAIL = 'export@bench.invalid'
+QUOTAS = [{'code': 'users', 'name': 'Пользователи', 'value': 5},
+          {'code': 'legal_entities', 'name': 'Юр. лица', 'value': 2}]
+
+
+class RssSampler:
+    """Пик RSS процесса над исходным уровнем: фоновый поток читает /proc/self/statm"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self._stop = threading.Event()
+
+    def rss(self):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * self.page_size
+
+    def __enter__(self):
+        gc.collect()
+        self.start = self.peak = self.rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.rss())
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.rss())
+
+    @property
+    def growth_mb(self):
+        return (self.peak - self.start) / 2 ** 20
+
+
+class Command(BaseCommand):
+    help = ("Пик RSS при выгрузке истории подписок в CSV: StreamingHttpResponse под WSGI, "
+            "асинхронный итератор под ASGI (core.asgi) и для сравнения весь файл в памяти. "
+            "Запускать на отдельной базе: --rows создаёт партнёра " + BENCH_EMAIL + " с подписками")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=300000, help="Подписок в выгрузке")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--max-rss-mb', type=float, default=50,
+                            help="Допустимый рост RSS при потоковой выгрузке; больше -- ошибка")
+        parser.add_argument('--cleanup', action='store_true', help="Удалить синтетические данные и выйти")
+
+    def handle(self, *args, rows, batch_size, max_rss_mb, cleanup, **options):
+        if not os.path.exists('/proc/self/statm'):
+            raise CommandError("Нужен /proc (Linux): RSS читается из /proc/self/statm")
+        if cleanup:
+            deleted, _ = User.objects.filter(email=BENCH_EMAIL).delete()
+            self.stdout.write(self.style.SUCCESS(f"Удалено объектов: {deleted}"))
+            return
+
+        partner = self.seed(rows, batch_size)
+        subs = Subscription.objects.filter(partner=partner)
+        # (название, выгрузка, потоковая -- проверяется --max-rss-mb)
+        variants = (
+            ('WSGI, StreamingHttpResponse', lambda: self.export_wsgi(partner), True),
+            ('ASGI, асинхронный итератор', lambda: self.export_asgi(partner), True),
+            ('весь файл в памяти', lambda: len(''.join(export._csv_lines(subs, False)).encode()), False),
+        )
+        failed = []
+        for label, run, streaming in variants:
+            with RssSampler() as sampler:
+                start = time.perf_counter()
+                size = run()
+                seconds = time.perf_counter() - start
+            self.stdout.write(f"{label}: {size / 2 ** 20:.1f} МБ за {seconds:.1f} с, "
+                              f"рост RSS {sampler.growth_mb:.1f} МБ")
+            if streaming and sampler.growth_mb > max_rss_mb:
+                failed.append(label)
+        self.stdout.write(f"пик RSS процесса: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} МБ")
+        if failed:
+            raise CommandError(f"Рост RSS больше {max_rss_mb:.0f} МБ: {', '.join(failed)}")
+
+    def seed(self, rows, batch_size):
+        user = User.objects.filter(email=BENCH_EMAIL).first()
+        if user is None:
+            user = User.objects.create(email=BENCH_EMAIL, is_active=True, password='!')
+            Partner.objects.create(user=user, inn='7799999999', phone_number='+70000000000',
+                                   first_name='Выгрузка', last_name='Бенчмарк', commission=10)
+        partner = user.partner
+        existing = Subscription.objects.filter(partner=partner).count()
+        now = timezone.now()
+        for offset in range(existing, rows, batch_size):
+            Subscription.objects.bulk_create(
+                [Subscription(partner=partner, email=f'client{offset + i}@example.com', cost_value=10000,
+                              commission=10, period=12, tariff='Бизнес', quotas=QUOTAS,
+                              reg_date=now - datetime.timedelta(minutes=offset + i))
+                 for i in range(min(batch_size, rows - offset))])
+        if existing < rows:
+            self.stdout.write(f"Создано подписок: {rows - existing}")
+        return partner
+
+    @staticmethod
+    def export_wsgi(partner):
+        request = RequestFactory().get(reverse('partner:account_history_export'), {'format': 'csv'})
+        request.user = partner.user
+        response = AccountHistoryExportView.as_view()(request)
+        return sum(len(chunk) for chunk in response)
+
+    @staticmethod
+    def export_asgi(partner):
+        """Запрос через core.asgi.ASGIHandler, как под uvicorn; сессия -- от тестового клиента"""
+        from core.asgi import ASGIHandler
+
+        client = Client()
+        client.force_login(partner.user)
+        cookie = '; '.join(f'{morsel.key}={morsel.value}' for morsel in client.cookies.values())
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': reverse('partner:account_history_export'), 'query_string': b'format=csv', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        received = {'status': None, 'size': 0}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                received['status'] = message['status']
+            else:
+                received['size'] += len(message.get('body', b''))
+
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            asyncio.run(ASGIHandler()(scope, receive, send))
+        if received['status'] != 200:
+            raise CommandError(f"ASGI-выгрузка ответила {received['status']}")
+        return received['size']
@@ -0,0 +1,60 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from partner import warmup
+from partner.models import User
+
+
+class Command(BaseCommand):
+    help = ("Время первого запроса нового воркера с прогревом (partner.warmup, как в gunicorn post_fork) и без. "
+            "Каждый замер -- отдельный процесс, как после перезапуска воркера")
+    # проверки импортируют URLconf и прогрели бы воркер до замера
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=settings.LOGIN_URL)
+        parser.add_argument('--email', help="Запрашивать страницу от имени этого пользователя")
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--child', choices=('cold', 'warm'), help="Служебный: один замер в этом процессе")
+
+    def handle(self, *args, url, email, rounds, child, **options):
+        if child:
+            self.stdout.write(json.dumps(self.measure(url, email, warm=child == 'warm')))
+            return
+
+        argv = [sys.executable, '-m', 'django', 'benchmark_first_request', '--url', url]
+        argv += ['--email', email] if email else []
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        for mode in ('cold', 'warm'):
+            results = [json.loads(subprocess.run(argv + ['--child', mode], env=env, check=True,
+                                                 capture_output=True, text=True).stdout.splitlines()[-1])
+                       for _ in range(rounds)]
+            self.stdout.write(f"{'с прогревом' if mode == 'warm' else 'без прогрева'}: " + ', '.join(
+                f"{name} {statistics.median(r[name] for r in results):.1f} мс"
+                for name in ('warmup', 'first', 'second')) + " (медианы)")
+
+    @staticmethod
+    def measure(url, email, warm):
+        started = time.perf_counter()
+        if warm:
+            warmup.warm_up()
+        warmup_ms = (time.perf_counter() - started) * 1000
+
+        client = Client()
+        if email:
+            client.force_login(User.objects.get(email=email))
+        timings = {'warmup': warmup_ms}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name in ('first', 'second'):
+                started = time.perf_counter()
+                client.get(url)
+                timings[name] = (time.perf_counter() - started) * 1000
+        return timings
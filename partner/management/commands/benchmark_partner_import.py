@@ -0,0 +1,70 @@
+import csv
+import io
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from partner import imports
+from partner.forms import PartnerRegistrationForm
+from partner.imports import ImportResult
+
+# Синтетические строки отличаются доменом email, все изменения откатываются
+BENCH_DOMAIN = 'import-bench.invalid'
+
+
+class Command(BaseCommand):
+    help = ("Строк в секунду и SQL-запросов на строку при импорте партнёров: построчно через "
+            "PartnerRegistrationForm (как RegistrationView) и пачками через partner.imports. "
+            "Данные создаются в транзакции, которая откатывается")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--invalid', type=float, default=0.05, help="Доля строк с ошибками")
+        parser.add_argument('--batch-size', type=int, nargs='*', default=[100, 1000])
+
+    def handle(self, *args, rows, invalid, batch_size, **options):
+        data = self.synthetic_csv(rows, invalid)
+
+        result, queries = self.measure(lambda: self.import_per_row(data))
+        self.report("построчно (форма регистрации)", result, queries)
+        for size in batch_size:
+            result, queries = self.measure(lambda: imports.import_partners(io.StringIO(data), batch_size=size))
+            self.report(f"пачками по {size}", result, queries)
+
+    @staticmethod
+    def synthetic_csv(rows, invalid):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(imports.COLUMNS)
+        every = round(1 / invalid) if invalid else 0
+        for i in range(rows):
+            broken = every and i % every == 0
+            writer.writerow((f'partner{i}@{BENCH_DOMAIN}', 'Иван', 'Иванов', f'ООО Компания {i}' if i % 3 else '',
+                             '' if broken else f'{7700000000 + i}', '+70000000000'))
+        return out.getvalue()
+
+    @staticmethod
+    def import_per_row(data):
+        result = ImportResult()
+        for row in csv.DictReader(io.StringIO(data)):
+            result.rows += 1
+            form = PartnerRegistrationForm(row)
+            if form.is_valid():
+                form.save()
+                result.created += 1
+            else:
+                result.failed += 1
+        result.stop()
+        return result
+
+    @staticmethod
+    def measure(run):
+        with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+            result = run()
+            transaction.set_rollback(True)
+        return result, len(captured)
+
+    def report(self, label, result, queries):
+        self.stdout.write(f"{label}: {result.rows} строк, создано {result.created}, с ошибками {result.failed}, "
+                          f"{result.rate():.0f} строк/с, {queries / result.rows:.2f} запросов на строку")
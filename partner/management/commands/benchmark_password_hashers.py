@@ -0,0 +1,119 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, get_hashers
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from partner import hashers
+from partner.models import User
+
+# Пользователь для замера входа создаётся в транзакции, которая откатывается
+BENCH_EMAIL = 'login@hashers-bench.invalid'
+PASSWORD = 'Bench-password-123'
+# Параметры, которые перебирает --tune, и переменные окружения для них
+TUNING = {
+    'scrypt': ('work_factor', [2 ** n for n in range(12, 18)], 'DJANGO_PASSWORD_SCRYPT_WORK_FACTOR'),
+    'argon2': ('time_cost', [1, 2, 3, 4, 6, 8], 'DJANGO_PASSWORD_ARGON2_TIME_COST'),
+}
+
+
+def median_ms(func, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = ("Время хеширования и проверки пароля для хешеров из PASSWORD_HASHERS, задержка входа "
+            "(authenticate) и пропускная способность массового хеширования в пуле процессов. "
+            "С --tune подбирает параметры основного хешера под --target-ms")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=10)
+        parser.add_argument('--bulk', type=int, default=200, help="Паролей в замере массового хеширования")
+        parser.add_argument('--workers', type=int, nargs='*', help="По умолчанию -- 1 и PASSWORD_HASH_WORKERS")
+        parser.add_argument('--tune', action='store_true')
+        parser.add_argument('--target-ms', type=float, default=100,
+                            help="Желаемое время одного хеша для --tune, мс")
+
+    def handle(self, *args, rounds, bulk, workers, tune, target_ms, **options):
+        self.stored_hashes()
+        self.stdout.write("\n== Хеш / проверка одного пароля")
+        for hasher in get_hashers():
+            try:
+                encoded = hasher.encode(PASSWORD, hasher.salt())
+            except ValueError as e:
+                # нет библиотеки алгоритма (argon2-cffi)
+                self.stdout.write(f"{hasher.algorithm}: недоступен ({e})")
+                continue
+            encode_ms = median_ms(lambda: hasher.encode(PASSWORD, hasher.salt()), rounds)
+            verify_ms = median_ms(lambda: hasher.verify(PASSWORD, encoded), rounds)
+            self.stdout.write(f"{hasher.algorithm}: хеш {encode_ms:.1f} мс, проверка {verify_ms:.1f} мс")
+
+        self.login_latency(rounds)
+        self.bulk_throughput(bulk, workers or sorted({1, settings.PASSWORD_HASH_WORKERS}))
+        if tune:
+            self.tune(rounds, target_ms)
+
+    def stored_hashes(self):
+        """Сколько хешей уже пересчитано на основной хешер -- прогресс перехода при входе"""
+        self.stdout.write(f"== Пароли пользователей (основной хешер: {get_hasher().algorithm})")
+        for hasher in get_hashers():
+            count = User.objects.filter(password__startswith=f'{hasher.algorithm}$').count()
+            if count:
+                self.stdout.write(f"{hasher.algorithm}: {count}")
+        self.stdout.write(f"без пароля: {User.objects.filter(password__startswith='!').count()}")
+
+    def login_latency(self, rounds):
+        self.stdout.write("\n== Вход (authenticate)")
+        legacy = PBKDF2PasswordHasher()
+        legacy_encoded = legacy.encode(PASSWORD, legacy.salt())
+        with transaction.atomic():
+            user = User.objects.create_user(BENCH_EMAIL, PASSWORD)
+            user.is_active = True
+            user.save(update_fields=['is_active'])
+            current_ms = median_ms(lambda: authenticate(email=BENCH_EMAIL, password=PASSWORD), rounds)
+
+            def legacy_login():
+                User.objects.filter(pk=user.pk).update(password=legacy_encoded)
+                authenticate(email=BENCH_EMAIL, password=PASSWORD)
+
+            # первый вход со старым хешем: проверка PBKDF2 + пересчёт основным хешером
+            legacy_ms = median_ms(legacy_login, rounds)
+            transaction.set_rollback(True)
+        self.stdout.write(f"хеш основного хешера: {current_ms:.1f} мс")
+        self.stdout.write(f"хеш {legacy.algorithm}, первый вход с пересчётом: {legacy_ms:.1f} мс")
+
+    def bulk_throughput(self, bulk, workers):
+        self.stdout.write(f"\n== Массовое хеширование ({bulk} паролей, hashers.make_passwords)")
+        passwords = [User.objects.make_random_password() for _ in range(bulk)]
+        for count in workers:
+            start = time.perf_counter()
+            hashers.make_passwords(passwords, workers=count)
+            seconds = time.perf_counter() - start
+            self.stdout.write(f"процессов {count}: {bulk / seconds:.0f} паролей/с ({seconds:.2f} с)")
+
+    def tune(self, rounds, target_ms):
+        hasher = get_hasher()
+        if hasher.algorithm not in TUNING:
+            self.stdout.write(f"\nПодбор параметров для {hasher.algorithm} не поддерживается")
+            return
+        attribute, values, env = TUNING[hasher.algorithm]
+        self.stdout.write(f"\n== Подбор {attribute} для {hasher.algorithm} (цель {target_ms:.0f} мс)")
+        best = None
+        for value in values:
+            setattr(hasher, attribute, value)
+            encode_ms = median_ms(lambda: hasher.encode(PASSWORD, hasher.salt()), rounds)
+            self.stdout.write(f"{attribute}={value}: {encode_ms:.1f} мс")
+            if encode_ms <= target_ms:
+                best = value
+        if best is None:
+            self.stdout.write(self.style.WARNING(f"Даже {attribute}={values[0]} медленнее цели"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{env}={best}"))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from partner import timing
+
+
+class Command(BaseCommand):
+    help = ("Накладные расходы RequestTimingMiddleware: время на запрос (без view) "
+            "и на SQL-запрос через execute_wrapper, в микросекундах")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=5000)
+
+    def handle(self, *args, requests, queries, **options):
+        request = RequestFactory().get('/my/')
+
+        def view(request):
+            with timing.timed('render'):
+                return HttpResponse()
+
+        plain = self.measure(lambda: view(request), requests)
+        middleware = timing.RequestTimingMiddleware(view)
+        # строка лога пишется только для медленных запросов, в замер её не включаем
+        with override_settings(REQUEST_TIMING_LOG_THRESHOLD=float('inf')):
+            wrapped = self.measure(lambda: middleware(request), requests)
+        self.stdout.write(f"запрос: {plain:.1f} мкс без middleware, {wrapped:.1f} мкс с ней, "
+                          f"+{wrapped - plain:.1f} мкс")
+
+        with connection.cursor() as cursor:
+            def query():
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+
+            plain = self.measure(query, queries)
+            with timing.collect():
+                wrapped = self.measure(query, queries)
+        self.stdout.write(f"SQL: {plain:.1f} мкс без замера, {wrapped:.1f} мкс с ним, +{wrapped - plain:.1f} мкс")
+
+    @staticmethod
+    def measure(func, number):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return (time.perf_counter() - start) / number * 1e6
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from partner import timing
+from partner.models import User
+
+# Хранилища до и после перехода на кеш
+VARIANTS = (
+    ('db + сообщения по умолчанию', 'db', 'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('db + cookie', 'db', settings.MESSAGE_STORAGE),
+    ('cached_db + cookie', 'cached_db', settings.MESSAGE_STORAGE),
+    ('cache + cookie', 'cache', settings.MESSAGE_STORAGE),
+)
+
+
+class Command(BaseCommand):
+    help = ("SQL-запросы и записи в БД на запрос страницы кабинета для разных хранилищ сессий и сообщений, "
+            "по замерам RequestTimingMiddleware (partner.timing). Кеш -- тот, что настроен в CACHES")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Пользователь, от имени которого запрашиваются страницы")
+        parser.add_argument('--url', nargs='*', help="По умолчанию -- история подписок")
+        parser.add_argument('--requests', type=int, default=100)
+
+    def handle(self, *args, email, url, requests, **options):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {email} не найден")
+        urls = url or [reverse('partner:account_history')]
+
+        for label, store, message_storage in VARIANTS:
+            with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[store], MESSAGE_STORAGE=message_storage,
+                                   ALLOWED_HOSTS=['testserver']), timing.captured() as timings:
+                # SessionMiddleware выбирает движок при создании, поэтому клиент на каждый вариант свой
+                client = Client()
+                client.force_login(user)
+                for _ in range(requests):
+                    for page in urls:
+                        client.get(page)
+            queries = sum(t.queries for t in timings) / len(timings)
+            writes = sum(t.writes for t in timings) / len(timings)
+            db_ms = sum(t.phases['db'] for t in timings) / len(timings) * 1000
+            self.stdout.write(f"{label}: {queries:.2f} запросов, {writes:.2f} записей, {db_ms:.2f} мс SQL на запрос")
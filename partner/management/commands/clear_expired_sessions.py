@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = ("Удаляет истёкшие сессии из django_session пачками по первичному ключу: короткие транзакции "
+            "вместо одного DELETE по всей таблице. Сессии в Redis истекают сами")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.SESSION_CLEANUP_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.1, help="Пауза между пачками, с")
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, повторяя очистку")
+        parser.add_argument('--interval', type=float, default=3600, help="Пауза между очистками, с")
+
+    def handle(self, *args, batch_size, pause, loop, interval, **options):
+        while True:
+            started = time.monotonic()
+            deleted = self.clear_expired(batch_size, pause)
+            self.stdout.write(self.style.SUCCESS(
+                f"Удалено истёкших сессий: {deleted} за {time.monotonic() - started:.1f} с"))
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @staticmethod
+    def clear_expired(batch_size, pause):
+        deleted = 0
+        now = timezone.now()
+        while True:
+            # expire_date проиндексирован, пачка -- выборка по индексу и DELETE по первичному ключу
+            keys = list(Session.objects.filter(expire_date__lt=now).values_list('pk', flat=True)[:batch_size])
+            if not keys:
+                return deleted
+            deleted += Session.objects.filter(pk__in=keys).delete()[0]
+            if len(keys) < batch_size:
+                return deleted
+            time.sleep(pause)
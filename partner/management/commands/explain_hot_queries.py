@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from partner import search
+from partner.models import Partner, Subscription, SubscriptionOutbox, User, subscription_totals
+
+# Таблицы, полный просмотр которых в горячем запросе -- регрессия
+LARGE_TABLES = ('partner_subscription', 'partner_subscriptionoutbox')
+
+
+class Command(BaseCommand):
+    help = ("Печатает EXPLAIN ANALYZE горячих запросов личного кабинета, админки и воркера outbox. "
+            "С --fail-on-seq-scan завершается с ошибкой, если план читает большую таблицу целиком")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partner', type=int, help="id партнёра для запросов истории (по умолчанию -- "
+                                                        "партнёр последней подписки)")
+        parser.add_argument('--only', nargs='*', help="Только запросы с этими именами")
+        parser.add_argument('--fail-on-seq-scan', action='store_true')
+
+    def handle(self, *args, partner, only, fail_on_seq_scan, **options):
+        if partner is None:
+            last = Subscription.objects.order_by('-id').only('partner_id').first()
+            if last is None:
+                raise CommandError("Нет подписок: укажите --partner")
+            partner = last.partner_id
+        partner = Partner.objects.select_related('user').get(pk=partner)
+
+        queries = self.hot_queries(partner)
+        unknown = set(only or ()) - queries.keys()
+        if unknown:
+            raise CommandError(f"Неизвестные запросы: {', '.join(sorted(unknown))}")
+
+        postgres = connection.vendor == 'postgresql'
+        regressions = []
+        for name, queryset in queries.items():
+            if only and name not in only:
+                continue
+            # EXPLAIN ANALYZE выполняет запрос -- откатываем на случай блокировок и побочных эффектов
+            with transaction.atomic():
+                plan = queryset.explain(analyze=True, buffers=True) if postgres else queryset.explain()
+                transaction.set_rollback(True)
+
+            seq_scans = [table for table in LARGE_TABLES if f'Seq Scan on {table} ' in plan]
+            if seq_scans:
+                regressions.append(name)
+            title = f"== {name}" + (f" [Seq Scan: {', '.join(seq_scans)}]" if seq_scans else "")
+            self.stdout.write(self.style.WARNING(title) if seq_scans else self.style.SUCCESS(title))
+            self.stdout.write(plan + '\n')
+
+        if fail_on_seq_scan and regressions:
+            raise CommandError(f"Полный просмотр больших таблиц: {', '.join(regressions)}")
+
+    @staticmethod
+    def hot_queries(partner):
+        history = Subscription.objects.filter(partner=partner).order_by('-reg_date', '-id')
+        last = history.first()
+        now = timezone.now()
+        queries = {
+            'history_first_page': history[:settings.HISTORY_PAGE_SIZE + 1],
+            'history_filtered': history.filter(reg_date__gte=now - timezone.timedelta(days=30),
+                                               tariff=last.tariff if last else '')[:settings.HISTORY_PAGE_SIZE + 1],
+            'user_changelist': User.objects.select_related('partner').order_by('is_active', '-id')[:100],
+            'subscription_changelist': Subscription.objects.select_related('partner').order_by('-id')[:100],
+            'subscription_changelist_pending': (Subscription.objects.select_related('partner')
+                                                .filter(status=Subscription.PENDING).order_by('-id')[:100]),
+            'admin_search_inn': search.search_subscriptions(Subscription.objects.all(), partner.inn)
+                                      .order_by('-id')[:100],
+            'admin_search_email': search.search_subscriptions(Subscription.objects.all(), partner.user.email)
+                                        .order_by('-id')[:100],
+            'admin_search_name': search.search_subscriptions(Subscription.objects.all(), partner.last_name)
+                                       .order_by('-id')[:100],
+            'outbox_due': (SubscriptionOutbox.objects.filter(processed_at__isnull=True, next_attempt_at__lte=now)
+                           .order_by('next_attempt_at')[:settings.OUTBOX_BATCH_SIZE]),
+            'partner_by_inn': Partner.objects.filter(inn=partner.inn),
+            'login_by_email': User.objects.filter(email=partner.user.email),
+        }
+        if last is not None:
+            # тот же фильтр курсора, что в history_page
+            cursor = Q(reg_date__lt=last.reg_date) | Q(reg_date=last.reg_date, id__lt=last.id)
+            queries['history_next_page'] = history.filter(cursor, reg_date__lte=last.reg_date)[
+                                           :settings.HISTORY_PAGE_SIZE + 1]
+        queries['partner_totals'] = (Subscription.objects.filter(partner=partner, status=Subscription.CONFIRMED)
+                                     .values('partner').annotate(**subscription_totals()))
+        return queries
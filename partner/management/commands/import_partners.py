@@ -0,0 +1,40 @@
+import csv
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from partner import imports
+
+
+class Command(BaseCommand):
+    help = ("Импорт партнёров из CSV (колонки: " + ', '.join(imports.COLUMNS) + ") с проверками формы "
+            "регистрации. Партнёры создаются неактивными, ошибки -- построчно в отчёт")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV-файл, '-' -- stdin")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Например, cp1251 для выгрузок из Excel")
+        parser.add_argument('--report', help="CSV-отчёт об ошибках, по умолчанию -- в stderr")
+        parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Только проверить, ничего не создавая")
+
+    def handle(self, *args, path, encoding, report, batch_size, dry_run, **options):
+        source = sys.stdin if path == '-' else open(path, encoding=encoding, newline='')
+        report_file = open(report, 'w', encoding='utf-8-sig', newline='') if report else self.stderr
+        writer = csv.writer(report_file)
+        writer.writerow(imports.REPORT_HEADERS)
+        try:
+            result = imports.import_partners(source, on_error=lambda *error: writer.writerow(error),
+                                             batch_size=batch_size, dry_run=dry_run)
+        except imports.ImportFileError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report:
+                report_file.close()
+
+        action = "прошло проверку" if dry_run else "создано партнёров"
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {result.rows}, {action}: {result.created}, с ошибками: {result.failed} "
+            f"за {result.seconds():.1f} с ({result.rate():.0f} строк/с)"))
@@ -0,0 +1,71 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from partner.models import Partner
+from partner.views.account_views import TariffsCache
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочная проверка предпросмотра стоимости: прогоняет запросы через весь стек middleware "
+            "от имени партнёра и печатает p50/p95; с --compare -- то же для полной страницы checkout")
+
+    def add_arguments(self, parser):
+        parser.add_argument('email', help="Email пользователя-партнёра")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--compare', action='store_true', help="Также замерить CheckoutView")
+
+    def handle(self, *args, email, requests, concurrency, compare, **options):
+        try:
+            partner = Partner.objects.select_related('user').get(user__email=email)
+        except Partner.DoesNotExist:
+            raise CommandError(f"Партнёр {email} не найден")
+
+        catalogue = TariffsCache.get_catalogue()
+        tariff = next(iter(catalogue.tariffs.values()))
+        period = min(tariff.periods)
+        # Разные количества квот, чтобы нагрузка не сводилась к одному ключу кэша расчётов
+        forms = [dict({'client_email': email, 'tariff': tariff.code, 'period': period},
+                      **{q.code: q.quantity + i % 20 for q in catalogue.form_quotas})
+                 for i in range(requests)]
+
+        self.run('preview', reverse('partner:price_preview'), partner, forms, concurrency)
+        if compare:
+            self.run('checkout', reverse('partner:checkout'), partner, forms, concurrency)
+
+    def run(self, name, url, partner, forms, concurrency):
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS[0] != '*' else 'localhost'
+
+        def worker(chunk):
+            client = Client(HTTP_HOST=host)
+            client.force_login(partner.user)
+            timings = []
+            try:
+                for data in chunk:
+                    start = time.perf_counter()
+                    response = client.post(url, data)
+                    timings.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url}: HTTP {response.status_code}")
+            finally:
+                connection.close()
+            return timings
+
+        chunks = [forms[i::concurrency] for i in range(concurrency)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = sorted(t for result in pool.map(worker, chunks) for t in result)
+        elapsed = time.perf_counter() - start
+
+        p50 = statistics.median(timings) * 1000
+        p95 = timings[int(len(timings) * 0.95) - 1] * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: {len(timings)} запросов за {elapsed:.1f} с ({len(timings) / elapsed:.0f}/с), "
+            f"p50 {p50:.1f} мс, p95 {p95:.1f} мс, max {timings[-1] * 1000:.1f} мс"))
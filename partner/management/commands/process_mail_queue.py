@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from partner import mail
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди пачками, одно SMTP-соединение на пачку"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.MAIL_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно, опрашивая очередь")
+        parser.add_argument('--poll-interval', type=float, default=settings.MAIL_POLL_INTERVAL,
+                            help="Пауза между опросами пустой очереди, с")
+
+    def handle(self, *args, batch_size, loop, poll_interval, **options):
+        total = 0
+        started = time.monotonic()
+        while True:
+            processed = mail.process_batch(batch_size)
+            total += processed
+            if processed:
+                continue
+            if not loop:
+                break
+            time.sleep(poll_interval)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано: {total} за {elapsed:.1f} с ({total / elapsed if elapsed else 0:.1f} в секунду)"))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from partner import fragments
+from partner.models import Partner, Subscription, subscription_totals
+
+FIELDS = ('revenue_total', 'sales_total', 'subscriptions_count')
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает накопительные итоги партнёров (заработок, продажи, количество подписок) по истории подписок"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Только показать расхождения")
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        # Один GROUP BY по всем подпискам вместо запроса на каждого партнёра
+        totals = {row.pop('partner'): row
+                  for row in (Subscription.objects.filter(status=Subscription.CONFIRMED)
+                              .values('partner').annotate(**subscription_totals()))}
+        empty = {'revenue_total': 0, 'sales_total': 0, 'subscriptions_count': 0}
+
+        changed = []
+        checked = 0
+        for partner in Partner.objects.only('id', *FIELDS).iterator(chunk_size=batch_size):
+            checked += 1
+            expected = totals.get(partner.id, empty)
+            if all(getattr(partner, field) == expected[field] for field in FIELDS):
+                continue
+            for field in FIELDS:
+                setattr(partner, field, expected[field])
+            changed.append(partner)
+
+        if not dry_run:
+            Partner.objects.bulk_update(changed, FIELDS, batch_size=batch_size)
+            fragments.invalidate_many([partner.pk for partner in changed])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Проверено партнёров: {checked}, {'расхождений' if dry_run else 'исправлено'}: {len(changed)}"))
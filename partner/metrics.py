@@ -0,0 +1,19 @@
+from django.core.cache import cache
+
+
+def incr(key, delta=1):
+    """
+    Счётчик в django cache: общий для всех воркеров при redis-бэкенде.
+    Не истекает, сбрасывается только вместе с кэшем.
+    """
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # ключ вытеснен между add и incr
+        return None
+
+
+def read(prefix, names):
+    values = cache.get_many([prefix + name for name in names])
+    return {name: values.get(prefix + name, 0) for name in names}
@@ -0,0 +1,50 @@
+# Generated by Django 4.1.13 on 2026-10-17 12:57
+
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    Partner = apps.get_model('partner', 'Partner')
+    Subscription = apps.get_model('partner', 'Subscription')
+
+    totals = (Subscription.objects.values('partner')
+              .annotate(revenue_total=Sum(F('cost_value') * F('commission') / 100),
+                        sales_total=Sum('cost_value'),
+                        subscriptions_count=Count('id')))
+    partners = []
+    for row in totals:
+        partners.append(Partner(id=row['partner'], revenue_total=row['revenue_total'],
+                                sales_total=row['sales_total'], subscriptions_count=row['subscriptions_count']))
+    Partner.objects.bulk_update(partners, ['revenue_total', 'sales_total', 'subscriptions_count'],
+                                batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0012_rename_inn_partner_inn_alter_partner_commission_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partner',
+            name='revenue_total',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='Сумма заработка'),
+        ),
+        migrations.AddField(
+            model_name='partner',
+            name='sales_total',
+            field=models.BigIntegerField(default=0, verbose_name='Сумма продаж'),
+        ),
+        migrations.AddField(
+            model_name='partner',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество подписок'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['partner', 'reg_date'], name='subscription_partner_date_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
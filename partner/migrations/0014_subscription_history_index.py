@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-17 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0013_partner_totals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='subscription',
+            name='subscription_partner_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['partner', 'reg_date', 'id'], name='subscription_history_idx'),
+        ),
+    ]
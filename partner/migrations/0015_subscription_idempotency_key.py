@@ -0,0 +1,22 @@
+# Generated by Django 4.1.13 on 2026-10-17 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0014_subscription_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='subscription',
+            constraint=models.UniqueConstraint(fields=('partner', 'idempotency_key'), name='subscription_idempotency_key'),
+        ),
+    ]
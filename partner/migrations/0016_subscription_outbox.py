@@ -0,0 +1,36 @@
+# Generated by Django 4.1.13 on 2026-10-17 13:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0015_subscription_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Оформляется'), ('confirmed', 'Оформлена'), ('failed', 'Ошибка оформления')], default='confirmed', max_length=16, verbose_name='Статус'),
+        ),
+        migrations.CreateModel(
+            name='SubscriptionOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(verbose_name='Данные запроса')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('next_attempt_at', models.DateTimeField(verbose_name='Следующая попытка')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+                ('subscription', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='partner.subscription')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionoutbox',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['next_attempt_at'], name='outbox_due_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.1.13 on 2026-10-17 13:17
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # индексы строятся CONCURRENTLY, без блокировки записи в большие таблицы
+    atomic = False
+
+    dependencies = [
+        ('partner', '0016_subscription_outbox'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddIndexConcurrently(
+            model_name='partner',
+            index=models.Index(fields=['inn'], name='partner_inn_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='partner',
+            index=models.Index(fields=['contract_number'], name='partner_contract_number_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='partner',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('first_name'), name='gin_trgm_ops'), name='partner_first_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='partner',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('last_name'), name='gin_trgm_ops'), name='partner_last_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='partner',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('company_name'), name='gin_trgm_ops'), name='partner_company_name_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='subscription_email_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='subscription_email_trgm_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(fields=['tariff'], name='subscription_tariff_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='user_email_upper_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+        ),
+    ]
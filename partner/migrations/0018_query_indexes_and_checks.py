@@ -0,0 +1,45 @@
+# Generated by Django 4.1.13 on 2026-10-17 13:19
+
+from django.contrib.postgres.operations import AddConstraintNotValid, AddIndexConcurrently, ValidateConstraint
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы строятся CONCURRENTLY; ограничения добавляются NOT VALID и проверяются
+    # отдельно, чтобы не держать блокировку записи на время проверки всех строк
+    atomic = False
+
+    dependencies = [
+        ('partner', '0017_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status', 'confirmed'), _negated=True), fields=['status', '-id'], name='subscription_unconfirmed_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['is_active', '-id'], name='user_admin_order_idx'),
+        ),
+        AddConstraintNotValid(
+            model_name='partner',
+            constraint=models.CheckConstraint(check=models.Q(('commission__gte', 0), ('commission__lte', 100)), name='partner_commission_percent'),
+        ),
+        AddConstraintNotValid(
+            model_name='subscription',
+            constraint=models.CheckConstraint(check=models.Q(('cost_value__gte', 0)), name='subscription_cost_value_non_negative'),
+        ),
+        AddConstraintNotValid(
+            model_name='subscription',
+            constraint=models.CheckConstraint(check=models.Q(('commission__gte', 0), ('commission__lte', 100)), name='subscription_commission_percent'),
+        ),
+        AddConstraintNotValid(
+            model_name='subscription',
+            constraint=models.CheckConstraint(check=models.Q(('period__gt', 0)), name='subscription_period_positive'),
+        ),
+        ValidateConstraint(model_name='partner', name='partner_commission_percent'),
+        ValidateConstraint(model_name='subscription', name='subscription_cost_value_non_negative'),
+        ValidateConstraint(model_name='subscription', name='subscription_commission_percent'),
+        ValidateConstraint(model_name='subscription', name='subscription_period_positive'),
+    ]
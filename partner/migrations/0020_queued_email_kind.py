@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-17 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('partner', '0019_queued_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedemail',
+            name='kind',
+            field=models.CharField(blank=True, choices=[('credentials', 'Данные для входа')], max_length=16, verbose_name='Тип'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-17 16:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+    # индексы строятся и удаляются CONCURRENTLY, без блокировки записи в подписки
+    atomic = False
+
+    dependencies = [
+        ('partner', '0020_queued_email_kind'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(django.db.models.functions.text.Upper('tariff'), name='subscription_tariff_upper_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='subscription',
+            name='subscription_tariff_idx',
+        ),
+    ]
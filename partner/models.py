@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Upper
 from django.utils.formats import date_format
 
 from django.contrib.auth.models import (
@@ -18,7 +21,11 @@ class MyUserManager(BaseUserManager):
             email=email,
         )
 
-        user.set_password(password)
+        if password is None:
+            # заявка с сайта: аккаунт неактивен, пароль выдаётся при активации -- хешировать нечего
+            user.set_unusable_password()
+        else:
+            user.set_password(password)
         user.save(using=self._db)
 
         return user
@@ -48,6 +55,15 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     USERNAME_FIELD = 'email'
 
+    class Meta:
+        indexes = [
+            # поиск в админке: email__iexact / email__icontains (partner.search)
+            models.Index(Upper('email'), name='user_email_upper_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='user_email_trgm_idx'),
+            # changelist UserAdmin: ORDER BY is_active, id DESC (ordering + детерминирующий -pk)
+            models.Index(fields=['is_active', '-id'], name='user_admin_order_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -71,6 +87,27 @@ class Partner(models.Model):
                                                                                                          "комиссии")
     date_registered = models.DateTimeField(verbose_name="Дата подачи заявки", null=True)
 
+    # Накопительные итоги по подпискам, обновляются при оформлении подписки,
+    # пересчитываются командой reconcile_partner_totals
+    revenue_total = models.DecimalField(max_digits=15, decimal_places=3, default=0, verbose_name="Сумма заработка")
+    sales_total = models.BigIntegerField(default=0, verbose_name="Сумма продаж")
+    subscriptions_count = models.PositiveIntegerField(default=0, verbose_name="Количество подписок")
+
+    class Meta:
+        indexes = [
+            # точный поиск в админке (partner.search)
+            models.Index(fields=['inn'], name='partner_inn_idx'),
+            models.Index(fields=['contract_number'], name='partner_contract_number_idx'),
+            # icontains по имени и компании
+            GinIndex(OpClass(Upper('first_name'), name='gin_trgm_ops'), name='partner_first_name_trgm_idx'),
+            GinIndex(OpClass(Upper('last_name'), name='gin_trgm_ops'), name='partner_last_name_trgm_idx'),
+            GinIndex(OpClass(Upper('company_name'), name='gin_trgm_ops'), name='partner_company_name_trgm_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(commission__gte=0, commission__lte=100),
+                                   name='partner_commission_percent'),
+        ]
+
     def __str__(self):
         name = f"{self.first_name} {self.last_name}"
         if self.company_name is None:
@@ -78,7 +115,25 @@ class Partner(models.Model):
         return f"{self.company_name}"
 
 
+def subscription_totals():
+    """Агрегаты для накопительных итогов Partner (по оформленным подпискам), считаются одним запросом"""
+    return {
+        'revenue_total': Sum(F('cost_value') * F('commission') / 100),
+        'sales_total': Sum('cost_value'),
+        'subscriptions_count': Count('id'),
+    }
+
+
 class Subscription(models.Model):
+    PENDING = 'pending'
+    CONFIRMED = 'confirmed'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Оформляется'),
+        (CONFIRMED, 'Оформлена'),
+        (FAILED, 'Ошибка оформления'),
+    )
+
     partner = models.ForeignKey(Partner, on_delete=models.CASCADE, verbose_name="Партнёр")
     email = models.EmailField()
     cost_value = models.IntegerField(verbose_name="Итоговая стоимость")
@@ -87,6 +142,30 @@ class Subscription(models.Model):
     period = models.IntegerField(verbose_name="Период (мес.)")
     tariff = models.CharField(max_length=32, verbose_name="Тариф")
     quotas = models.JSONField(null=True, blank=True, verbose_name="Квоты")
+    # Выдаётся странице checkout, защищает от повторной отправки формы
+    idempotency_key = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    # pending -- ждёт отправки в api Adesk (SubscriptionOutbox), в итоги партнёра входят только confirmed
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=CONFIRMED, verbose_name="Статус")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['partner', 'reg_date', 'id'], name='subscription_history_idx'),
+            # поиск в админке (partner.search)
+            models.Index(Upper('email'), name='subscription_email_upper_idx'),
+            GinIndex(OpClass(Upper('email'), name='gin_trgm_ops'), name='subscription_email_trgm_idx'),
+            # тариф хранится названием ("Бизнес"), поиск -- tariff__iexact
+            models.Index(Upper('tariff'), name='subscription_tariff_upper_idx'),
+            # фильтр "Статус" в админке: оформляющихся и ошибочных мало, оформленные в индекс не входят
+            models.Index(fields=['status', '-id'], name='subscription_unconfirmed_idx',
+                         condition=~models.Q(status='confirmed')),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['partner', 'idempotency_key'], name='subscription_idempotency_key'),
+            models.CheckConstraint(check=models.Q(cost_value__gte=0), name='subscription_cost_value_non_negative'),
+            models.CheckConstraint(check=models.Q(commission__gte=0, commission__lte=100),
+                                   name='subscription_commission_percent'),
+            models.CheckConstraint(check=models.Q(period__gt=0), name='subscription_period_positive'),
+        ]
 
     def __str__(self):
         return self.email
@@ -94,3 +173,70 @@ class Subscription(models.Model):
     @property
     def revenue(self):
         return self.cost_value * self.commission / 100
+
+
+class SubscriptionOutbox(models.Model):
+    """
+    Запрос на оформление подписки в api Adesk, ожидающий отправки.
+    Создаётся в одной транзакции с Subscription(status=pending),
+    отправляется командой process_subscription_outbox.
+    """
+    subscription = models.OneToOneField(Subscription, on_delete=models.CASCADE, related_name='outbox')
+    payload = models.JSONField(verbose_name="Данные запроса")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Обработано")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='outbox_due_idx',
+                         condition=models.Q(processed_at__isnull=True)),
+        ]
+
+
+class QueuedEmail(models.Model):
+    """
+    Письмо в очереди отправки (partner.mail). Админка только ставит письмо в очередь,
+    команда process_mail_queue отправляет пачки через одно SMTP-соединение.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+    # текст письма с данными для входа собирается при отправке вместе с новым паролем
+    CREDENTIALS = 'credentials'
+    KIND_CHOICES = (
+        (CREDENTIALS, 'Данные для входа'),
+    )
+
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='emails',
+                             verbose_name="Пользователь")
+    to = models.EmailField(verbose_name="Получатель")
+    subject = models.CharField(max_length=255, verbose_name="Тема")
+    kind = models.CharField(max_length=16, blank=True, choices=KIND_CHOICES, verbose_name="Тип")
+    # стирается, когда письмо покидает очередь
+    body = models.TextField(blank=True, verbose_name="Текст")
+    html = models.BooleanField(default=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток")
+    next_attempt_at = models.DateTimeField(verbose_name="Следующая попытка")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="Отправлено")
+
+    class Meta:
+        verbose_name = "Письмо"
+        verbose_name_plural = "Очередь писем"
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='queuedemail_due_idx',
+                         condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to}"
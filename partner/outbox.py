@@ -0,0 +1,145 @@
+"""
+Асинхронное оформление подписок через outbox: вьюха сохраняет подписку в статусе
+pending вместе с запросом к SUBSCRIBE_LINK, команда process_subscription_outbox
+отправляет запросы пачками и подтверждает или отклоняет подписки.
+"""
+import decimal
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import fragments
+from .circuit_breaker import CircuitOpenError
+from .models import Partner, Subscription, SubscriptionOutbox
+
+logger = logging.getLogger(__name__)
+
+
+_executors = {}
+
+
+def _executor(size):
+    if size not in _executors:
+        _executors[size] = ThreadPoolExecutor(max_workers=size, thread_name_prefix='outbox')
+    return _executors[size]
+
+
+def enqueue_subscription(subscription, api_data):
+    """Вызывается в транзакции, создавшей subscription"""
+    payload = {key: str(value) if isinstance(value, decimal.Decimal) else value for key, value in api_data.items()}
+    return SubscriptionOutbox.objects.create(subscription=subscription, payload=payload,
+                                             next_attempt_at=timezone.now())
+
+
+def claim_batch(batch_size):
+    """
+    Забирает до batch_size готовых к отправке записей. Запись "арендуется" сдвигом
+    next_attempt_at на OUTBOX_LEASE_TIMEOUT: параллельные воркеры её пропускают,
+    а если воркер упал, запись снова станет доступна после аренды.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(SubscriptionOutbox.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(processed_at__isnull=True, next_attempt_at__lte=now)
+                     .order_by('next_attempt_at')[:batch_size])
+        SubscriptionOutbox.objects.filter(pk__in=[item.pk for item in batch]).update(
+            next_attempt_at=now + timezone.timedelta(seconds=settings.OUTBOX_LEASE_TIMEOUT))
+    return batch
+
+
+def process_batch(batch_size=None):
+    """Отправляет одну пачку; возвращает число обработанных записей"""
+    from .views.account_views import Api
+
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0
+
+    # Повтор после таймаута или истёкшей аренды api узнаёт по ключу и не оформляет подписку второй раз
+    keys = dict(Subscription.objects.filter(pk__in=[item.subscription_id for item in batch])
+                .values_list('pk', 'idempotency_key'))
+
+    def submit(item):
+        headers = {"App-Token": f"{settings.APP_TOKEN_SUBSCRIBE}",
+                   "Idempotency-Key": keys.get(item.subscription_id) or f'subscription-{item.subscription_id}'}
+        try:
+            return Api.post(settings.SUBSCRIBE_LINK, data=item.payload, headers=headers, auth=settings.DEV_AUTH)
+        except Exception as e:
+            return e
+
+    # Запросы пачки уходят одновременно через общий пул соединений Api.session()
+    results = list(_executor(batch_size).map(submit, batch))
+    for item, result in zip(batch, results):
+        if isinstance(result, CircuitOpenError):
+            postpone(item, Api.breaker(settings.SUBSCRIBE_LINK).recovery_timeout)
+        elif isinstance(result, ConnectionError):
+            retry_later(item, "Сервис оформления подписок недоступен.")
+        elif isinstance(result, Exception):
+            logger.exception("Outbox item %s failed", item.pk, exc_info=result)
+            retry_later(item, repr(result))
+        elif result.get('success') is False:
+            fail(item, result.get('message', ''))
+        else:
+            confirm(item)
+    return len(batch)
+
+
+def confirm(item):
+    subscription = Subscription.objects.select_related('partner').get(pk=item.subscription_id)
+    partner = subscription.partner
+    cost_value = decimal.Decimal(subscription.cost_value)
+    commission = subscription.commission
+
+    with transaction.atomic():
+        # status=pending в условии: повторная обработка той же записи не задвоит задолженность
+        updated = Subscription.objects.filter(pk=subscription.pk, status=Subscription.PENDING).update(
+            status=Subscription.CONFIRMED)
+        if updated:
+            Partner.objects.filter(pk=partner.pk).update(
+                debt=F('debt') + cost_value * (1 - commission / 100),
+                revenue_total=F('revenue_total') + cost_value * commission / 100,
+                sales_total=F('sales_total') + subscription.cost_value,
+                subscriptions_count=F('subscriptions_count') + 1,
+            )
+            # итоги обновлены через update(), без post_save
+            transaction.on_commit(lambda: fragments.invalidate(partner.pk))
+        SubscriptionOutbox.objects.filter(pk=item.pk).update(processed_at=timezone.now(), attempts=F('attempts') + 1,
+                                                             last_error='')
+
+
+def fail(item, error):
+    with transaction.atomic():
+        Subscription.objects.filter(pk=item.subscription_id, status=Subscription.PENDING).update(
+            status=Subscription.FAILED)
+        SubscriptionOutbox.objects.filter(pk=item.pk).update(processed_at=timezone.now(), attempts=F('attempts') + 1,
+                                                             last_error=error)
+
+
+def retry_later(item, error):
+    attempts = item.attempts + 1
+    if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        fail(item, error)
+        return
+
+    delay = random.uniform(0, settings.OUTBOX_RETRY_BACKOFF * (2 ** attempts))
+    SubscriptionOutbox.objects.filter(pk=item.pk).update(
+        attempts=attempts, last_error=error,
+        next_attempt_at=timezone.now() + timezone.timedelta(seconds=delay))
+
+
+def postpone(item, delay):
+    """
+    Запрос не отправлялся (предохранитель разомкнут): попытка не засчитывается,
+    запись откладывается до пробного запроса предохранителя
+    """
+    delay = random.uniform(delay, delay * 1.5)
+    SubscriptionOutbox.objects.filter(pk=item.pk).update(
+        last_error="Сервис оформления подписок недоступен, отправка отложена.",
+        next_attempt_at=timezone.now() + timezone.timedelta(seconds=delay))
@@ -0,0 +1,136 @@
+"""
+Локальный расчёт стоимости подписки по скомпилированному каталогу (partner.catalogue),
+повторяющий расчёт CHECKOUT_LINK:
+  totalPrice = pricing[period] + sum(unitPrice * quantity * period) по extra квотам.
+Результат -- словарь той же формы, что и pricing из api (см. debug_pricing).
+
+PRICING_ENGINE: 'shadow' -- стоимость берётся из api, локальный расчёт только сверяется
+с ним и считает расхождения; 'local' -- api для расчёта не вызывается, если для текущей
+версии каталога набрано PRICING_LOCAL_MIN_MATCHES сверок без единого расхождения (trusted),
+до этого -- как 'shadow'.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+SHADOW = 'shadow'
+LOCAL = 'local'
+
+STATS_PREFIX = 'pricing:stats:'
+# те же счётчики по версиям каталога -- для trusted()
+VERSION_STATS_PREFIX = 'pricing:version:{}:'
+EVENTS = ('match', 'mismatch')
+
+
+def _money(value):
+    return Decimal(str(value))
+
+
+def _price_table(tariff, period):
+    """(базовая цена, {code: (quota, цена единицы за весь период)}) для тарифа и периода"""
+    if period not in tariff.periods:
+        raise ValueError(f'Тариф {tariff.code} не продаётся на {period} мес.')
+    return _money(tariff.pricing[period]), {q.code: (q, _money(q.unit_price) * period) for q in tariff.quotas}
+
+
+def calculate(catalogue, tariff_code, period, extra_quotas):
+    """extra_quotas -- {code: value} сверх включённых в тариф, как в api_data['extra_quotas']"""
+    return calculate_many(catalogue, [(tariff_code, period, extra_quotas)])[0]
+
+
+def calculate_many(catalogue, configurations):
+    """
+    Расчёт сразу для многих конфигураций (tariff_code, period, extra_quotas).
+    Таблица цен строится один раз на пару тариф/период, дальше на каждую
+    конфигурацию -- только умножения по её квотам.
+    """
+    tables = {}
+    result = []
+    for tariff_code, period, extra_quotas in configurations:
+        period = int(period)
+        tariff = catalogue.tariffs.get(tariff_code)
+        if tariff is None:
+            raise ValueError(f'Неизвестный тариф {tariff_code}')
+        table = tables.get((tariff_code, period))
+        if table is None:
+            table = tables[(tariff_code, period)] = _price_table(tariff, period)
+        base_price, unit_prices = table
+
+        extra = []
+        quotas_sum = Decimal(0)
+        for code, quantity in extra_quotas.items():
+            quantity = int(quantity)
+            if quantity <= 0:
+                continue
+            if code not in unit_prices:
+                raise ValueError(f'В тарифе {tariff_code} нет квоты {code}')
+            quota, unit_period_price = unit_prices[code]
+            price = unit_period_price * quantity
+            quotas_sum += price
+            extra.append({'code': code, 'name': quota.name, 'unitPrice': quota.unit_price,
+                          'price': float(price), 'quantity': quantity})
+
+        result.append({
+            'totalPrice': float(base_price + quotas_sum),
+            'period': period,
+            'tariff': {'code': tariff.code, 'name': tariff.name, 'price': tariff.pricing[period]},
+            'options': [],
+            'quotas': [],
+            'extraOptions': [],
+            'extraQuotas': extra,
+            'quotas_sum': float(quotas_sum),
+        })
+    return result
+
+
+def diff(local, upstream):
+    """Список расхождений локального расчёта с ответом api, пустой если совпадают"""
+    problems = []
+    for field in ('totalPrice', 'quotas_sum'):
+        if _money(local[field]) != _money(upstream.get(field)):
+            problems.append(f'{field}: {local[field]} != {upstream.get(field)}')
+
+    upstream_quotas = {q['code']: q for q in upstream.get('extraQuotas', [])}
+    local_quotas = {q['code']: q for q in local['extraQuotas']}
+    for code in local_quotas.keys() | upstream_quotas.keys():
+        ours, theirs = local_quotas.get(code), upstream_quotas.get(code)
+        if ours is None or theirs is None:
+            problems.append(f'{code}: {ours and ours["price"]} != {theirs and theirs["price"]}')
+        elif (ours['quantity'], _money(ours['price'])) != (theirs['quantity'], _money(theirs['price'])):
+            problems.append(f'{code}: {ours["quantity"]}x{ours["price"]} != {theirs["quantity"]}x{theirs["price"]}')
+    return problems
+
+
+def shadow_compare(catalogue, tariff_code, period, extra_quotas, upstream):
+    """Сверяет локальный расчёт с ответом api; ошибки расчёта тоже считаются расхождением"""
+    try:
+        problems = diff(calculate(catalogue, tariff_code, period, extra_quotas), upstream)
+    except (ValueError, KeyError, TypeError) as e:
+        problems = [repr(e)]
+
+    event = 'mismatch' if problems else 'match'
+    metrics.incr(STATS_PREFIX + event)
+    metrics.incr(VERSION_STATS_PREFIX.format(catalogue.version) + event)
+    if problems:
+        logger.warning("Pricing mismatch for %s/%s %s (catalogue %s): %s",
+                       tariff_code, period, extra_quotas, catalogue.version, '; '.join(problems))
+    return not problems
+
+
+def stats():
+    return metrics.read(STATS_PREFIX, EVENTS)
+
+
+def trusted(catalogue):
+    """
+    Локальный расчёт может заменить api для этой версии каталога: сверок не меньше
+    PRICING_LOCAL_MIN_MATCHES и ни одного расхождения. Новая версия каталога (или сброшенный кэш)
+    снова начинает со сверок
+    """
+    version_stats = metrics.read(VERSION_STATS_PREFIX.format(catalogue.version), EVENTS)
+    return version_stats['mismatch'] == 0 and version_stats['match'] >= settings.PRICING_LOCAL_MIN_MATCHES
@@ -0,0 +1,110 @@
+"""
+Бюджет SQL-запросов для вьюх и changelist админки.
+query_budget -- контекстный менеджер и декоратор: считает запросы через execute_wrapper
+и сообщает о превышении бюджета или о повторах одного и того же запроса (N+1).
+При QUERY_BUDGET_STRICT (всегда в тестах, см. partner.test_runner) -- исключение QueryBudgetExceeded,
+иначе предупреждение в лог.
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# IN (%s, %s, ...) разной длины -- один и тот же запрос
+_PLACEHOLDER_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+# INSERT ... VALUES (...), (...) -- пачка bulk_create, их повторы не N+1
+_MULTI_ROW_VALUES_RE = re.compile(r'\), \(')
+
+
+def query_shape(sql):
+    return _PLACEHOLDER_LIST_RE.sub('(%s, ...)', sql)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(ContextDecorator):
+    """
+    max_queries -- не больше стольких запросов за блок;
+    max_repeats -- один запрос (с точностью до параметров) не больше стольких раз
+    """
+
+    def __init__(self, max_queries=None, max_repeats=None, name=None, using='default'):
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats or settings.QUERY_BUDGET_MAX_REPEATS
+        self.name = name
+        self.using = using
+        self.queries = []
+        self._stack = None
+
+    def _recreate_cm(self):
+        # декорированная функция может выполняться одновременно в нескольких потоках
+        return type(self)(self.max_queries, self.max_repeats, self.name, self.using)
+
+    def __enter__(self):
+        self.queries = []
+        self._stack = ExitStack()
+        self._stack.enter_context(connections[self.using].execute_wrapper(self._record))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack.close()
+        if exc_type is None:
+            self.check()
+        return False
+
+    def __call__(self, func):
+        if self.name is None:
+            self.name = func.__qualname__
+        return super().__call__(func)
+
+    def _record(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def problems(self):
+        problems = []
+        if self.max_queries is not None and len(self.queries) > self.max_queries:
+            problems.append(f"{len(self.queries)} запросов при бюджете {self.max_queries}")
+        shapes = Counter(query_shape(sql) for sql in self.queries if not _MULTI_ROW_VALUES_RE.search(sql))
+        for shape, count in shapes.most_common():
+            if count < self.max_repeats:
+                break
+            problems.append(f"{count} повторов запроса: {shape}")
+        return problems
+
+    def check(self):
+        problems = self.problems()
+        if not problems:
+            return
+        message = f"{self.name or 'query_budget'}: " + '; '.join(problems)
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class ChangelistQueryBudgetMixin:
+    """
+    Бюджет запросов для changelist_view ModelAdmin. Ответ рендерится внутри бюджета,
+    т.к. list_display и __str__ обращаются к связанным объектам именно при рендеринге.
+    """
+    changelist_query_budget = None
+    # POST с действием над выбранными объектами (actions) -- отдельный бюджет
+    action_query_budget = None
+
+    def changelist_view(self, request, extra_context=None):
+        name = f"{type(self).__name__}.changelist_view"
+        budget = self.changelist_query_budget
+        if request.method == 'POST' and 'action' in request.POST:
+            budget = self.action_query_budget
+        with query_budget(budget, name=name):
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
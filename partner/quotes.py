@@ -0,0 +1,52 @@
+"""
+Кэш расчётов стоимости (quote) из CHECKOUT_LINK. Ключ -- хэш нормализованных
+входных данных (версия каталога, тариф, период, extra квоты), поэтому смена
+каталога делает старые расчёты недоступными. Страница checkout выдаёт подписанный
+токен расчёта, по которому SubscribeView берёт ту же стоимость без повторного запроса.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from . import metrics
+
+STATS_PREFIX = 'quotes:stats:'
+EVENTS = ('hit', 'miss')
+TOKEN_SALT = 'partner.quote'
+
+
+def quote_key(catalogue_version, tariff, period, extra_quotas):
+    """extra_quotas -- {code: value}; нулевые значения не влияют на стоимость и отбрасываются"""
+    normalized = [catalogue_version, tariff, int(period),
+                  sorted((code, int(value)) for code, value in extra_quotas.items() if int(value) > 0)]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+def fetch(key):
+    pricing = cache.get('quote:' + key)
+    metrics.incr(STATS_PREFIX + ('miss' if pricing is None else 'hit'))
+    return pricing
+
+
+def store(key, pricing):
+    cache.set('quote:' + key, pricing, settings.QUOTE_CACHE_TTL)
+
+
+def stats():
+    return metrics.read(STATS_PREFIX, EVENTS)
+
+
+def make_token(partner, key):
+    return signing.dumps({'partner': partner.pk, 'quote': key}, salt=TOKEN_SALT, compress=True)
+
+
+def check_token(token, partner, key):
+    """True, если токен выдан этому партнёру для этих же входных данных и не устарел"""
+    try:
+        data = signing.loads(token, salt=TOKEN_SALT, max_age=settings.QUOTE_CACHE_TTL)
+    except signing.BadSignature:
+        return False
+    return data == {'partner': partner.pk, 'quote': key}
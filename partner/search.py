@@ -0,0 +1,129 @@
+"""
+Поиск в админке по партнёрам и подпискам. Запрос делится на слова, как в ModelAdmin
+(кавычки объединяют слова): каждое слово должно найтись хотя бы в одном поле.
+ \n ИНН, email, номер договора (запрос из одного слова) и тариф -- точное совпадение по btree-индексу
+ \n остальное -- icontains по полям с GIN-индексами pg_trgm на UPPER(поле)
+  (именно так django строит icontains на PostgreSQL), партнёры ранжируются по сходству.
+Поиск подписок по имени партнёра идёт в два шага: id подходящих партнёров, затем
+подписки этих партнёров -- так каждое условие OR использует свой индекс, без OR через JOIN.
+"""
+import re
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.utils.text import smart_split, unescape_string_literal
+
+from .models import Partner
+
+INN_RE = re.compile(r'^\d{10}(\d{2})?$')
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+$')
+
+PARTNER_FIELDS = ('first_name', 'last_name', 'company_name')
+USER_RANK_FIELDS = ('email',) + tuple(f'partner__{field}' for field in PARTNER_FIELDS)
+RANK_FIELD = 'search_rank'
+# Короче трёх символов триграммный индекс не помогает -- ищем только точные совпадения
+MIN_CONTAINS_LENGTH = 3
+# Больше партнёров по имени в поиске подписок не берём: запрос слишком общий, админ получает предупреждение
+MAX_PARTNER_MATCHES = 1000
+
+
+def _contains(prefix, fields, term):
+    q = Q()
+    for field in fields:
+        q |= Q(**{f'{prefix}{field}__icontains': term})
+    return q
+
+
+def _words(term):
+    """Слова запроса, как их выделяет ModelAdmin.get_search_results"""
+    words = []
+    for bit in smart_split(term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit:
+            words.append(bit)
+    return words
+
+
+def ranking_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def _ranked(queryset, fields, term):
+    """Аннотация RANK_FIELD -- триграммное сходство с запросом (только PostgreSQL + pg_trgm)"""
+    if not ranking_enabled():
+        return queryset
+    return queryset.annotate(**{RANK_FIELD: Greatest(*[TrigramSimilarity(field, term) for field in fields])})
+
+
+def _is_contract_number(term):
+    return Partner.objects.filter(contract_number=term).exists()
+
+
+def search_users(queryset, term):
+    """UserAdmin: queryset -- User, аннотированный RANK_FIELD для сортировки по релевантности"""
+    term = term.strip()
+    words = _words(term)
+    if not words:
+        return queryset
+
+    if len(words) == 1 and INN_RE.match(words[0]):
+        queryset = queryset.filter(partner__inn=words[0])
+    elif len(words) == 1 and EMAIL_RE.match(words[0]):
+        queryset = queryset.filter(email__iexact=words[0])
+    elif len(words) == 1 and _is_contract_number(words[0]):
+        queryset = queryset.filter(partner__contract_number=words[0])
+    else:
+        q = Q()
+        for word in words:
+            q &= Q(email__icontains=word) | _contains('partner__', PARTNER_FIELDS, word)
+        queryset = queryset.filter(q)
+    return _ranked(queryset, USER_RANK_FIELDS, term)
+
+
+def search_subscriptions(queryset, term, on_truncated=None):
+    """
+    SubscriptionAdmin: queryset -- Subscription, порядок остаётся хронологическим.
+    on_truncated(limit) вызывается, если по слову нашлось больше MAX_PARTNER_MATCHES партнёров
+    и в поиск вошли подписки только первых из них
+    """
+    term = term.strip()
+    words = _words(term)
+    if not words:
+        return queryset
+
+    if len(words) == 1:
+        word = words[0]
+        if INN_RE.match(word):
+            return queryset.filter(partner__inn=word)
+        if EMAIL_RE.match(word):
+            # email клиента в подписке или email партнёра
+            partner_ids = list(Partner.objects.filter(user__email__iexact=word).values_list('pk', flat=True))
+            return queryset.filter(Q(email__iexact=word) | Q(partner_id__in=partner_ids))
+        if _is_contract_number(word):
+            return queryset.filter(partner__contract_number=word)
+
+    # короткие слова триграммный индекс не сужает: рядом с другими словами они пропускаются,
+    # запрос только из коротких слов -- точное название тарифа
+    long_words = [word for word in words if len(word) >= MIN_CONTAINS_LENGTH]
+    if not long_words:
+        return queryset.filter(tariff__iexact=term)
+
+    truncated = False
+    q = Q()
+    for word in long_words:
+        partner_ids = list(Partner.objects.filter(_contains('', PARTNER_FIELDS, word))
+                           .values_list('pk', flat=True)[:MAX_PARTNER_MATCHES + 1])
+        if len(partner_ids) > MAX_PARTNER_MATCHES:
+            del partner_ids[MAX_PARTNER_MATCHES:]
+            truncated = True
+        # тариф -- название из короткого справочника, подстрока в нём совпадает с большей частью таблицы
+        q &= Q(email__icontains=word) | Q(tariff__iexact=word) | Q(partner_id__in=partner_ids)
+    if truncated and on_truncated is not None:
+        on_truncated(MAX_PARTNER_MATCHES)
+    # название тарифа из нескольких слов
+    if len(words) > 1:
+        q |= Q(tariff__iexact=' '.join(words))
+    return queryset.filter(q)
@@ -0,0 +1,64 @@
+"""
+Движок сессий cached_db, переживающий недоступность кеша.
+Сессия читается из кеша, при промахе -- из БД; в БД пишется только изменённая сессия.
+Ошибка кеша (Redis недоступен) не роняет запрос: предупреждение в лог, сессия работает напрямую с БД.
+Ключ, не удалённый из кеша при выходе, запоминается и удаляется повторно перед любым следующим обращением
+к кешу, до тех пор вместо кеша читается БД -- вышедшая сессия не оживает, когда кеш вернётся.
+"""
+import logging
+import threading
+
+from django.contrib.sessions.backends import cached_db
+
+logger = logging.getLogger(__name__)
+
+
+class FallbackCache:
+    """Обёртка над кешем сессий: ошибка обращения к кешу считается промахом"""
+    # ключи, которые не удалось удалить из кеша; общие для всех запросов процесса
+    pending_deletes = set()
+    lock = threading.Lock()
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _retry_deletes(self):
+        with self.lock:
+            keys = list(self.pending_deletes)
+        if keys:
+            self.cache.delete_many(keys)
+            with self.lock:
+                self.pending_deletes.difference_update(keys)
+
+    def _call(self, default, method, *args, **kwargs):
+        try:
+            # пока не удалены ключи вышедших сессий, кеш не читаем: ошибка -- промах, сессия берётся из БД
+            self._retry_deletes()
+            return getattr(self.cache, method)(*args, **kwargs)
+        except Exception as e:
+            logger.warning("Кеш сессий недоступен, работаем с БД: %s", e)
+            return default
+
+    def get(self, *args, **kwargs):
+        return self._call(None, 'get', *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self._call(None, 'set', *args, **kwargs)
+
+    def delete(self, key):
+        with self.lock:
+            self.pending_deletes.add(key)
+        try:
+            self._retry_deletes()
+        except Exception as e:
+            logger.warning("Кеш сессий недоступен, ключ удалим позже: %s", e)
+
+    def __contains__(self, key):
+        return self._call(False, 'has_key', key)
+
+
+class SessionStore(cached_db.SessionStore):
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._cache = FallbackCache(self._cache)
@@ -0,0 +1,32 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import fragments, timing
+from .models import Partner, Subscription, User
+
+
+@receiver(post_save, sender=Partner)
+def partner_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: fragments.invalidate(instance.pk))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: fragments.invalidate(instance.partner_id))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # в шапке email пользователя; вход сохраняет только last_login
+    if created or update_fields is not None and 'email' not in update_fields:
+        return
+    partner_ids = list(Partner.objects.filter(user=instance).values_list('pk', flat=True))
+    if partner_ids:
+        transaction.on_commit(lambda: fragments.invalidate_many(partner_ids))
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    timing.install_sql_timer(connection)
@@ -1,6 +1,9 @@
 from django import template
+from django.conf import settings
 from django.urls import reverse
 
+from partner import fragments
+
 register = template.Library()
 
 
@@ -60,3 +63,41 @@ def choices_display(boundField, key):
     return choices[key]
 
 
+class PartnerFragmentNode(template.Node):
+    def __init__(self, nodelist, name, partner, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.partner = partner
+        self.vary_on = vary_on
+
+    def render(self, context):
+        partner = self.partner.resolve(context)
+        if partner is None or not settings.FRAGMENT_CACHE_TTL:
+            return self.nodelist.render(context)
+
+        # версия читается из кеша один раз на объект партнёра, т.е. на запрос
+        partner_version = getattr(partner, '_fragment_version', None)
+        if partner_version is None:
+            partner_version = partner._fragment_version = fragments.version(partner.pk)
+        key = fragments.fragment_key(self.name.resolve(context), partner.pk, partner_version,
+                                     [var.resolve(context) for var in self.vary_on])
+        html = fragments.fetch(key)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragments.store(key, html)
+        return html
+
+
+@register.tag
+def partner_fragment(parser, token):
+    """
+    {% partner_fragment 'name' partner [vary_on ...] %}...{% endpartner_fragment %}
+    Фрагмент в кеше по партнёру и его версии (partner.fragments), FRAGMENT_CACHE_TTL=0 -- без кеша
+    """
+    nodelist = parser.parse(('endpartner_fragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' требует имя фрагмента и партнёра")
+    return PartnerFragmentNode(nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]),
+                               [parser.compile_filter(bit) for bit in bits[3:]])
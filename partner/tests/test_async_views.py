@@ -0,0 +1,51 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.urls import include, path
+
+from partner.models import Partner, User
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import TariffsCache
+from partner.views.async_account_views import AsyncAccountProfileView
+
+PROFILE_URL = '/async/profile'
+
+urlpatterns = [
+    path(PROFILE_URL.lstrip('/'), AsyncAccountProfileView.as_view()),
+    path('', include('core.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncAccountProfileViewTest(TransactionTestCase):
+    """TransactionTestCase -- ORM async-вьюхи работает в потоках sync_to_async со своими соединениями"""
+
+    def setUp(self):
+        self.stub = UpstreamStub().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(**self.stub.settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        TariffsCache.invalidate()
+
+        self.user = User.objects.create_user('partner@example.com', 'password')
+        self.user.is_active = True
+        self.user.save()
+        self.client = AsyncClient()
+        self.client.force_login(self.user)
+
+    async def test_profile_with_catalogue(self):
+        await sync_to_async(Partner.objects.create)(
+            user=self.user, inn='7700000001', phone_number='+70000000000', first_name='Иван', last_name='Иванов',
+            commission=10)
+        response = await self.client.get(PROFILE_URL)
+        self.assertEqual(response.status_code, 200)
+        catalogue = await TariffsCache.aget_catalogue()
+        self.assertEqual(response.context['tariff_json'], catalogue.json)
+        self.assertEqual(response.context['partner'].inn, '7700000001')
+
+    async def test_user_without_partner(self):
+        response = await self.client.get(PROFILE_URL)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '/admin')
@@ -0,0 +1,78 @@
+import asyncio
+
+from django.core.signals import request_finished
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.asgi import ASGIHandler
+from partner.models import Partner, Subscription, User
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'], EXPORT_CHUNK_SIZE=2)
+class AsgiCsvExportTest(TransactionTestCase):
+    """
+    Выгрузка CSV через core.asgi.ASGIHandler, как под uvicorn.
+    TransactionTestCase -- ORM выполняется в потоке запроса со своим соединением.
+    """
+    rows = 5
+
+    def setUp(self):
+        user = User.objects.create_user('partner@example.com', 'password')
+        user.is_active = True
+        user.save()
+        partner = Partner.objects.create(user=user, inn='7700000001', phone_number='+70000000000',
+                                         first_name='Иван', last_name='Иванов', commission=10)
+        Subscription.objects.bulk_create(
+            [Subscription(partner=partner, email=f'client{i}@example.com', cost_value=10000, commission=10,
+                          period=12, tariff='Бизнес', reg_date=timezone.now()) for i in range(self.rows)])
+        client = Client()
+        client.force_login(user)
+        self.cookie = '; '.join(f'{morsel.key}={morsel.value}' for morsel in client.cookies.values())
+
+        self.finished = 0
+        request_finished.connect(self.on_request_finished)
+        self.addCleanup(request_finished.disconnect, self.on_request_finished)
+
+    def on_request_finished(self, **kwargs):
+        self.finished += 1
+        # поток запроса завершается вместе с ним, его соединения закрываются здесь же
+        connections.close_all()
+
+    def export(self, send):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': reverse('partner:account_history_export'), 'query_string': b'format=csv', 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        asyncio.run(ASGIHandler()(scope, receive, send))
+
+    def test_streams_csv_and_finishes_request(self):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        self.export(send)
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        self.assertEqual(len(body.splitlines()), self.rows + 1)
+        self.assertEqual(self.finished, 1)
+
+    def test_client_disconnect_closes_response(self):
+        sent = []
+
+        async def send(message):
+            if len(sent) == 2:
+                raise OSError("client disconnected")
+            sent.append(message)
+
+        with self.assertRaises(OSError):
+            self.export(send)
+        self.assertEqual(self.finished, 1)
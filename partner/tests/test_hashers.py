@@ -0,0 +1,17 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from partner.hashers import ScryptPasswordHasher
+
+
+class ScryptPasswordHasherTest(SimpleTestCase):
+    def test_verify_after_lowering_work_factor(self):
+        """Хеш с большим work_factor проверяется и после уменьшения work_factor в настройках"""
+        hasher = ScryptPasswordHasher()
+        with mock.patch.object(ScryptPasswordHasher, 'work_factor', 2 ** 15):
+            encoded = hasher.encode('password', hasher.salt())
+        with mock.patch.object(ScryptPasswordHasher, 'work_factor', 2 ** 14):
+            self.assertTrue(hasher.verify('password', encoded))
+            self.assertFalse(hasher.verify('wrong', encoded))
+            self.assertTrue(hasher.must_update(encoded))
@@ -0,0 +1,159 @@
+import email
+import re
+import socket
+import socketserver
+import threading
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from partner import mail
+from partner.models import QueuedEmail, User
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply('220 stub')
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stub')
+            elif verb == 'MAIL':
+                if server.drop_after is not None and len(server.messages) >= server.drop_after:
+                    # сервер обрывает соединение посреди пачки
+                    return
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                address = command.split(':', 1)[1].strip().strip('<>')
+                if address in server.refused:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                server.messages.append((recipients, b''.join(data)))
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """SMTP-сервер без TLS и авторизации: принимает письма в messages, адреса из refused отклоняет"""
+    daemon_threads = True
+
+    def __init__(self, refused=(), drop_after=None):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.refused = set(refused)
+        self.drop_after = drop_after
+        self.messages = []
+        self.connections = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST='127.0.0.1',
+                   EMAIL_USE_TLS=False, EMAIL_USE_SSL=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+                   EMAIL_TIMEOUT=5, DEFAULT_FROM_EMAIL='Adesk <partner@example.com>', PASSWORD_HASH_WORKERS=1)
+class ProcessBatchTest(TestCase):
+    def start_stub(self, **kwargs):
+        stub = SMTPStub(**kwargs).start()
+        self.addCleanup(stub.stop)
+        settings_override = override_settings(EMAIL_PORT=stub.server_address[1])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return stub
+
+    def enqueue(self, *addresses):
+        mail.enqueue_many([QueuedEmail(to=address, subject="Тема", body="Текст") for address in addresses])
+
+    def test_sent_and_refused_recipient(self):
+        stub = self.start_stub(refused={'refused@example.com'})
+        self.enqueue('first@example.com', 'refused@example.com', 'second@example.com')
+
+        self.assertEqual(mail.process_batch(), 3)
+        self.assertEqual([recipients for recipients, _ in stub.messages],
+                         [['first@example.com'], ['second@example.com']])
+        self.assertEqual(stub.connections, 1)
+        refused = QueuedEmail.objects.get(to='refused@example.com')
+        self.assertEqual(refused.status, QueuedEmail.FAILED)
+        self.assertIn('SMTPRecipientsRefused', refused.last_error)
+        self.assertEqual(QueuedEmail.objects.filter(status=QueuedEmail.SENT, body='').count(), 2)
+
+    def test_server_down(self):
+        """Сервер недоступен: одна попытка подключения на пачку, письма ждут без траты попыток"""
+        user = User.objects.create_user('partner@example.com', 'password')
+        mail.enqueue_many([mail.credentials_email(user)])
+        self.enqueue('first@example.com', 'second@example.com')
+
+        with override_settings(EMAIL_PORT=unused_port()):
+            self.assertEqual(mail.process_batch(), 0)
+        now = timezone.now()
+        for item in QueuedEmail.objects.all():
+            self.assertEqual((item.status, item.attempts), (QueuedEmail.PENDING, 0))
+            self.assertGreater(item.next_attempt_at, now)
+            self.assertIn('ConnectionRefusedError', item.last_error)
+        # пароль не сменён, раз письмо с ним не ушло
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('password'))
+        self.assertEqual(mail.process_batch(), 0)
+
+    def test_disconnect_releases_rest_of_batch(self):
+        stub = self.start_stub(drop_after=1)
+        self.enqueue('first@example.com', 'second@example.com', 'third@example.com', 'fourth@example.com')
+
+        self.assertEqual(mail.process_batch(), 2)
+        self.assertEqual(stub.connections, 1)
+        items = {item.to: item for item in QueuedEmail.objects.all()}
+        self.assertEqual(items['first@example.com'].status, QueuedEmail.SENT)
+        self.assertEqual((items['second@example.com'].status, items['second@example.com'].attempts),
+                         (QueuedEmail.PENDING, 1))
+        for address in ('third@example.com', 'fourth@example.com'):
+            self.assertEqual((items[address].status, items[address].attempts), (QueuedEmail.PENDING, 0))
+            self.assertIn('SMTPServerDisconnected', items[address].last_error)
+
+    def test_credentials(self):
+        """Текст с паролем собирается при отправке и в БД не сохраняется"""
+        stub = self.start_stub()
+        user = User.objects.create_user('partner@example.com', 'password')
+        mail.enqueue_many([mail.credentials_email(user)])
+        self.assertEqual(QueuedEmail.objects.get().body, '')
+
+        self.assertEqual(mail.process_batch(), 1)
+        item = QueuedEmail.objects.get()
+        self.assertEqual((item.status, item.body), (QueuedEmail.SENT, ''))
+        message = email.message_from_bytes(stub.messages[0][1])
+        password = re.search(r'Пароль: (\S+)', message.get_payload(decode=True).decode()).group(1)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password(password))
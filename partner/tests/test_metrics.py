@@ -0,0 +1,61 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from partner import timing
+from partner.models import Partner
+
+
+class MetricsAccessTest(SimpleTestCase):
+    @override_settings(METRICS_TOKEN='')
+    def test_forbidden_without_token(self):
+        self.assertEqual(self.client.get(reverse('partner:metrics')).status_code, 403)
+        response = self.client.get(reverse('partner:metrics'), HTTP_AUTHORIZATION='Bearer ')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token(self):
+        url = reverse('partner:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('partner_request_duration_seconds', response.content.decode())
+
+
+class RequestTimingTest(TestCase):
+    def test_sql_timer_survives_execute_wrapper_block(self):
+        """Соединение, открытое внутри execute_wrapper(), не теряет sql_timer на выходе из блока"""
+        connection.execute_wrappers.remove(timing.sql_timer)
+
+        def outer(execute, *args):
+            return execute(*args)
+
+        with connection.execute_wrapper(outer):
+            timing.install_sql_timer(connection)
+        self.assertEqual(connection.execute_wrappers, [timing.sql_timer])
+
+    def test_async_middleware_times_sql_in_threads(self):
+        """Под ASGI middleware асинхронная, SQL из sync_to_async попадает в замер запроса"""
+        def count_partners():
+            # отдельный поток (thread_sensitive=False) живёт дольше теста: его соединение закрывается
+            # здесь же, иначе PostgreSQL не даст удалить тестовую базу
+            try:
+                return Partner.objects.count()
+            finally:
+                connection.close()
+
+        async def view(request):
+            await sync_to_async(count_partners, thread_sensitive=False)()
+            return HttpResponse()
+
+        middleware = timing.RequestTimingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        with timing.captured() as timings:
+            response = asyncio.run(middleware(RequestFactory().get('/')))
+        self.assertEqual(timings[0].queries, 1)
+        self.assertIn('db;dur=', response['Server-Timing'])
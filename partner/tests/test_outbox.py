@@ -0,0 +1,56 @@
+import datetime
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from partner import outbox
+from partner.models import Partner, Subscription, User
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import Api
+
+
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.stub = UpstreamStub().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(**self.stub.settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.breaker = Api.breaker(self.stub.url)
+        self.addCleanup(self.breaker._transition, self.breaker.CLOSED)
+
+        user = User.objects.create_user('partner@example.com', 'password')
+        self.partner = Partner.objects.create(user=user, inn='7700000001', phone_number='+70000000000',
+                                              first_name='Иван', last_name='Иванов', commission=10)
+
+    def enqueue(self, idempotency_key=None):
+        subscription = Subscription.objects.create(
+            partner=self.partner, email='client@example.com', cost_value=10000, commission=10, period=12,
+            tariff='Бизнес', reg_date=timezone.now(), idempotency_key=idempotency_key,
+            status=Subscription.PENDING)
+        return outbox.enqueue_subscription(subscription, {'client_email': 'client@example.com', 'tariff': 'business'})
+
+    def test_idempotency_key_header(self):
+        self.enqueue('a' * 32)
+        without_key = self.enqueue()
+
+        self.assertEqual(outbox.process_batch(), 2)
+
+        keys = sorted(headers['Idempotency-Key'] for _, _, headers in self.stub.posts)
+        self.assertEqual(keys, sorted(['a' * 32, f'subscription-{without_key.subscription_id}']))
+        self.assertEqual(Subscription.objects.filter(status=Subscription.CONFIRMED).count(), 2)
+
+    def test_open_breaker_does_not_consume_attempts(self):
+        item = self.enqueue()
+        self.breaker._transition(self.breaker.OPEN)
+
+        with override_settings(OUTBOX_MAX_ATTEMPTS=1):
+            self.assertEqual(outbox.process_batch(), 1)
+
+        item.refresh_from_db()
+        self.assertEqual(item.attempts, 0)
+        self.assertIsNone(item.processed_at)
+        self.assertGreater(item.next_attempt_at,
+                           timezone.now() + datetime.timedelta(seconds=self.breaker.recovery_timeout - 5))
+        self.assertEqual(Subscription.objects.get().status, Subscription.PENDING)
+        self.assertEqual(self.stub.posts, [])
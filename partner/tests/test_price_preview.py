@@ -0,0 +1,51 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from partner.models import Partner, User
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import TariffsCache
+
+
+@override_settings(PRICING_ENGINE='shadow')
+class PricePreviewTest(TestCase):
+    def setUp(self):
+        self.stub = UpstreamStub().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(**self.stub.settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        TariffsCache.invalidate()
+
+        user = User.objects.create_user('partner@example.com', 'password')
+        user.is_active = True
+        user.save()
+        Partner.objects.create(user=user, inn='7700000001', phone_number='+70000000000',
+                               first_name='Иван', last_name='Иванов', commission=10)
+        self.client.force_login(user)
+        TariffsCache.get_catalogue()
+        self.stub.reset()
+
+    def preview(self, **data):
+        form = {'client_email': '', 'tariff': 'business', 'period': 12, 'users': 5, 'legal_entities': 1}
+        form.update(data)
+        return self.client.post(reverse('partner:price_preview'), form).json()
+
+    def test_without_email_not_sent_upstream(self):
+        data = self.preview()
+        self.assertTrue(data['success'])
+        self.assertTrue(data['pricing']['estimate'])
+        self.assertEqual(self.stub.requests, 0)
+
+    def test_with_email_priced_upstream_and_cached(self):
+        data = self.preview(client_email='client@example.com')
+        self.assertFalse(data['pricing']['estimate'])
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(self.stub.posts[0][1]['client_email'], 'client@example.com')
+
+        # тот же расчёт без email -- из кэша расчётов, уже не оценка
+        cached = self.preview()
+        self.assertFalse(cached['pricing']['estimate'])
+        self.assertEqual(cached['pricing']['totalPrice'], data['pricing']['totalPrice'])
+        self.assertEqual(self.stub.requests, 1)
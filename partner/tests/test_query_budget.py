@@ -0,0 +1,107 @@
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from partner.admin import UserAdmin
+from partner.models import Partner, Subscription, User
+from partner.query_budget import QueryBudgetExceeded, query_budget
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import TariffsCache
+
+QUOTAS = [{'code': 'users', 'name': 'Пользователи', 'value': 5}]
+
+
+def create_partner(email, commission=10, **user_fields):
+    user = User.objects.create_user(email, 'password')
+    User.objects.filter(pk=user.pk).update(**user_fields)
+    return Partner.objects.create(user=user, inn='7700000001', phone_number='+70000000000',
+                                  first_name='Иван', last_name='Иванов', commission=commission)
+
+
+class QueryBudgetTest(TestCase):
+    def test_strict_under_test_runner(self):
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+
+    def test_budget_exceeded(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "3 запросов при бюджете 2"):
+            with query_budget(2, name='block'):
+                for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+                    User.objects.filter(email=email).exists()
+
+    def test_repeated_query(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, "5 повторов запроса"):
+            with query_budget(max_repeats=5):
+                for pk in range(5):
+                    User.objects.filter(pk=pk).exists()
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_warning_when_not_strict(self):
+        with self.assertLogs('partner.query_budget', 'WARNING') as logs:
+            with query_budget(0, name='block'):
+                User.objects.exists()
+        self.assertIn("block: 1 запросов при бюджете 0", logs.output[0])
+
+
+class ChangelistBudgetTest(TestCase):
+    """Число запросов changelist и массовых действий не растёт с числом строк"""
+    rows = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'password')
+        for i in range(cls.rows):
+            partner = create_partner(f'partner{i}@example.com', commission=None if i % 10 == 0 else 10)
+            Subscription.objects.create(partner=partner, email=f'client{i}@example.com', cost_value=10000,
+                                        commission=10, period=12, tariff='Бизнес', quotas=QUOTAS,
+                                        reg_date=timezone.now())
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_user_changelist(self):
+        self.assertEqual(self.client.get(reverse('admin:partner_user_changelist')).status_code, 200)
+
+    def test_user_changelist_catches_n_plus_one(self):
+        with mock.patch.object(UserAdmin, 'list_select_related', False):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('admin:partner_user_changelist'))
+
+    def test_user_actions(self):
+        selected = list(User.objects.filter(is_staff=False).values_list('pk', flat=True))
+        for action in ('activate_selected', 'deactivate_selected', 'send_credentials_selected'):
+            response = self.client.post(reverse('admin:partner_user_changelist'),
+                                        {'action': action, '_selected_action': selected})
+            self.assertEqual(response.status_code, 302, action)
+        self.assertEqual(User.objects.filter(is_active=True, is_staff=False).count(), self.rows - 3)
+
+    def test_subscription_changelist(self):
+        self.assertEqual(self.client.get(reverse('admin:partner_subscription_changelist')).status_code, 200)
+
+
+class SubscribeBudgetTest(TestCase):
+    """checkout и оформление подписки укладываются в бюджеты CheckoutView и SubscribeView"""
+
+    def setUp(self):
+        self.stub = UpstreamStub().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(**self.stub.settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        TariffsCache.invalidate()
+        self.partner = create_partner('partner@example.com', is_active=True)
+        self.client.force_login(self.partner.user)
+
+    def test_checkout_and_subscribe(self):
+        data = {'client_email': 'client@example.com', 'tariff': 'business', 'period': 12,
+                'users': 5, 'legal_entities': 1}
+        response = self.client.post(reverse('partner:checkout'), data)
+        self.assertEqual(response.status_code, 200)
+        data.update(checkout_key=response.context['checkout_key'], quote_token=response.context['quote_token'])
+        response = self.client.post(reverse('partner:subscribe'), data)
+        self.assertRedirects(response, reverse('partner:account_history'), fetch_redirect_response=False)
+        self.assertEqual(Subscription.objects.filter(partner=self.partner).count(), 1)
@@ -0,0 +1,70 @@
+from unittest import mock
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from partner import search
+from partner.models import Partner, Subscription, User
+
+
+class SubscriptionSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin@example.com', 'password')
+        partners = (('Иван', 'Петров', 'Бизнес'), ('Иван', 'Петров', 'Старт'), ('Иван', 'Петров', 'Старт'),
+                    ('Олег', 'Петров', 'Бизнес'), ('Иван', 'Сидоров', 'Про'))
+        for i, (first_name, last_name, tariff) in enumerate(partners):
+            user = User.objects.create_user(f'partner{i}@example.com', 'password')
+            partner = Partner.objects.create(user=user, inn=f'770000000{i}', phone_number='+70000000000',
+                                             first_name=first_name, last_name=last_name, commission=10)
+            Subscription.objects.create(partner=partner, email=f'client{i}@example.com', cost_value=10000,
+                                        commission=10, period=12, tariff=tariff, reg_date=timezone.now())
+
+    def search(self, term):
+        return search.search_subscriptions(Subscription.objects.all(), term)
+
+    def test_tariff_name(self):
+        """В подписке хранится название тарифа, а не код"""
+        self.assertEqual(self.search('Бизнес').count(), 2)
+        self.assertEqual(self.search('Старт').count(), 2)
+        self.assertEqual(self.search('business').count(), 0)
+
+    def test_partner_name(self):
+        self.assertEqual(self.search('Иван').count(), 4)
+
+    def test_first_and_last_name(self):
+        """Слова запроса ищутся по отдельности: имя и фамилия -- в разных полях"""
+        self.assertEqual(self.search('Иван Петров').count(), 3)
+        self.assertEqual(self.search('Петров Олег').count(), 1)
+        self.assertEqual(self.search('Иван Сидоров').count(), 1)
+        self.assertEqual(self.search('"Иван Петров"').count(), 0)
+        users = search.search_users(User.objects.all(), 'Иван Петров')
+        self.assertEqual(sorted(users.values_list('email', flat=True)),
+                         ['partner0@example.com', 'partner1@example.com', 'partner2@example.com'])
+
+    def test_name_and_client_email(self):
+        self.assertEqual(self.search('Иван client1').count(), 1)
+        self.assertEqual(self.search('Сидоров Бизнес').count(), 0)
+        self.assertEqual(self.search('Петров Бизнес').count(), 2)
+
+    def test_exact_paths_only_for_single_word(self):
+        self.assertEqual(self.search('7700000004').count(), 1)
+        self.assertEqual(self.search('7700000004 Петров').count(), 0)
+
+    def test_truncated_partner_matches(self):
+        truncated = []
+        with mock.patch.object(search, 'MAX_PARTNER_MATCHES', 2):
+            self.assertEqual(search.search_subscriptions(Subscription.objects.all(), 'Иван',
+                                                         on_truncated=truncated.append).count(), 2)
+            self.assertEqual(truncated, [2])
+            self.assertEqual(search.search_subscriptions(Subscription.objects.all(), 'Олег',
+                                                         on_truncated=truncated.append).count(), 1)
+            self.assertEqual(truncated, [2])
+
+    def test_admin_warns_about_truncation(self):
+        self.client.force_login(self.admin)
+        with mock.patch.object(search, 'MAX_PARTNER_MATCHES', 2):
+            response = self.client.get(reverse('admin:partner_subscription_changelist'), {'q': 'Иван'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "По имени нашлось больше 2 партнёров")
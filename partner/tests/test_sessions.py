@@ -0,0 +1,53 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from partner.sessions import FallbackCache, SessionStore
+
+
+class FlakyCache:
+    """Кеш, который при down=True отвечает ошибкой, как недоступный Redis"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.down = False
+
+    def __getattr__(self, name):
+        if self.down:
+            raise ConnectionError("cache is down")
+        return getattr(self.cache, name)
+
+
+class FallbackCacheTest(TestCase):
+    def setUp(self):
+        self.cache = FlakyCache(caches['default'])
+        self.cache.clear()
+        self.addCleanup(FallbackCache.pending_deletes.clear)
+
+    def store(self, session_key=None):
+        store = SessionStore(session_key)
+        store._cache = FallbackCache(self.cache)
+        return store
+
+    def test_cache_down(self):
+        store = self.store()
+        store['partner'] = 1
+        self.cache.down = True
+        store.save()
+        self.assertEqual(self.store(store.session_key).load(), {'partner': 1})
+
+    def test_logout_during_cache_outage(self):
+        """Сессия, удалённая при недоступном кеше, не оживает из кеша, когда он вернётся"""
+        store = self.store()
+        store['partner'] = 1
+        store.save()
+        session_key, cache_key = store.session_key, store.cache_key
+        self.assertIn(cache_key, self.cache.cache)
+
+        self.cache.down = True
+        store.delete()
+        self.assertEqual(self.store(session_key).load(), {})
+
+        self.cache.down = False
+        self.assertEqual(self.store(session_key).load(), {})
+        self.assertNotIn(cache_key, self.cache.cache)
+        self.assertEqual(FallbackCache.pending_deletes, set())
@@ -0,0 +1,130 @@
+import decimal
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from partner import outbox, quotes
+from partner.models import Partner, Subscription, SubscriptionOutbox, User
+from partner.upstream_stub import UpstreamStub
+from partner.views.account_views import TariffsCache
+
+
+class DoubleSubmitTest(TransactionTestCase):
+    """
+    Повторная отправка формы подписки: два запроса с одним checkout_key одновременно.
+    TransactionTestCase -- запросы идут из потоков, каждый со своим соединением и транзакциями.
+    """
+
+    def setUp(self):
+        self.stub = UpstreamStub().start()
+        self.addCleanup(self.stub.stop)
+        settings_override = override_settings(**self.stub.settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        TariffsCache.invalidate()
+
+        user = User.objects.create_user('partner@example.com', 'password')
+        user.is_active = True
+        user.save()
+        self.partner = Partner.objects.create(user=user, inn='7700000001', phone_number='+70000000000',
+                                              first_name='Иван', last_name='Иванов', commission=10)
+
+    def checkout(self, client_email='client@example.com', users=5):
+        """Данные формы подписки так, как их отправляет страница checkout: с checkout_key и quote_token"""
+        data = {'client_email': client_email, 'tariff': 'business', 'period': 12,
+                'users': users, 'legal_entities': 1}
+        client = Client()
+        client.force_login(self.partner.user)
+        response = client.post(reverse('partner:checkout'), data)
+        self.assertEqual(response.status_code, 200)
+        data.update(checkout_key=response.context['checkout_key'], quote_token=response.context['quote_token'])
+        return data
+
+    def post_concurrently(self, forms):
+        """Каждая форма -- в своём потоке, запросы стартуют одновременно"""
+        count = len(forms)
+        clients = []
+        for _ in range(count):
+            client = Client()
+            client.force_login(self.partner.user)
+            clients.append(client)
+        barrier = threading.Barrier(count)
+        responses = [None] * count
+
+        def submit(index):
+            try:
+                barrier.wait()
+                responses[index] = clients[index].post(reverse('partner:subscribe'), forms[index])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def assert_one_subscription(self, responses, data):
+        self.assertEqual([r.status_code for r in responses], [302, 302])
+        self.assertTrue(all(r.url == reverse('partner:account_history') for r in responses))
+        subscription = Subscription.objects.get(partner=self.partner)
+        self.assertEqual(subscription.idempotency_key, data['checkout_key'])
+        self.assertEqual(SubscriptionOutbox.objects.count(), 1)
+
+        # задолженность растёт один раз, в т.ч. при повторной обработке outbox
+        self.assertEqual(outbox.process_batch(), 1)
+        self.assertEqual(outbox.process_batch(), 0)
+        self.partner.refresh_from_db()
+        subscription.refresh_from_db()
+        cost_value = decimal.Decimal(subscription.cost_value)
+        self.assertEqual(subscription.status, Subscription.CONFIRMED)
+        self.assertEqual(self.partner.subscriptions_count, 1)
+        self.assertEqual(self.partner.debt, (cost_value * (1 - subscription.commission / 100)).quantize(
+            decimal.Decimal('0.01')))
+        self.assertEqual(len([path for path, _, _ in self.stub.posts if path == '/subscription']), 1)
+
+    def test_same_checkout_key_creates_one_subscription(self):
+        data = self.checkout()
+        self.assert_one_subscription(self.post_concurrently([data, data]), data)
+
+    def test_unique_key_without_checkout_lock(self):
+        """Блокировка в кэше истекла (или кэш сброшен): повтор отсекает уникальный ключ в БД"""
+        data = self.checkout()
+        # расчёт вытеснен из кэша, заглушка отвечает медленно: оба запроса проходят claim_checkout
+        # и ждут CHECKOUT_LINK, подписку сохраняют почти одновременно
+        self.stub.delay = 0.2
+        with override_settings(CHECKOUT_LOCK_TIMEOUT=0), mock.patch.object(quotes, 'fetch', return_value=None):
+            responses = self.post_concurrently([data, data])
+        self.assert_one_subscription(responses, data)
+
+    def test_parallel_subscriptions_keep_exact_totals(self):
+        """Разные подписки одного партнёра одновременно: итоги партнёра -- точные суммы по подпискам"""
+        count = 8
+        forms = [self.checkout(f'client{i}@example.com', users=3 + i) for i in range(count)]
+        responses = self.post_concurrently(forms)
+        self.assertEqual([r.status_code for r in responses], [302] * count)
+        self.assertEqual(SubscriptionOutbox.objects.count(), count)
+
+        while outbox.process_batch(batch_size=3):
+            pass
+        subscriptions = list(Subscription.objects.filter(partner=self.partner))
+        self.assertEqual(len(subscriptions), count)
+        self.assertEqual({s.status for s in subscriptions}, {Subscription.CONFIRMED})
+        # стоимость растёт с квотой: подписки различимы, ни одна не потерялась и не задвоилась
+        self.assertEqual(len({s.cost_value for s in subscriptions}), count)
+        self.assertEqual(len([path for path, _, _ in self.stub.posts if path == '/subscription']), count)
+
+        cent, mill = decimal.Decimal('0.01'), decimal.Decimal('0.001')
+        self.partner.refresh_from_db()
+        self.assertEqual(self.partner.subscriptions_count, count)
+        self.assertEqual(self.partner.sales_total, sum(int(s.cost_value) for s in subscriptions))
+        self.assertEqual(decimal.Decimal(self.partner.debt).quantize(cent), sum(
+            (decimal.Decimal(s.cost_value) * (1 - s.commission / 100)).quantize(cent) for s in subscriptions))
+        self.assertEqual(decimal.Decimal(self.partner.revenue_total).quantize(mill), sum(
+            (decimal.Decimal(s.cost_value) * s.commission / 100).quantize(mill) for s in subscriptions))
@@ -0,0 +1,195 @@
+"""
+Время обработки запроса по фазам: upstream (Api), db (SQL), render (шаблоны).
+RequestTimingMiddleware открывает замер на запрос, фазы добавляются через timed()/record()
+из любого места, в т.ч. из потоков sync_to_async (замер хранится в contextvar).
+SQL считает sql_timer, который ставится на каждое соединение с БД при подключении (partner.signals).
+По итогам запроса -- заголовок Server-Timing, строка лога и гистограммы процесса,
+которые отдаёт /metrics в текстовом формате Prometheus.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django import shortcuts
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('upstream', 'db', 'render')
+# Границы бакетов гистограмм, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+_current = ContextVar('request_timing', default=None)
+# Списки, в которые middleware добавляет замеры завершённых запросов (см. captured)
+_capturing = []
+
+
+class RequestTiming:
+    __slots__ = ('started', 'finished', 'phases', 'queries', 'writes')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.writes = 0
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+
+def record(phase, seconds):
+    current = _current.get()
+    if current is not None:
+        current.phases[phase] += seconds
+
+
+@contextmanager
+def timed(phase):
+    if _current.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+def render(*args, **kwargs):
+    """django.shortcuts.render с замером фазы render"""
+    with timed('render'):
+        return shortcuts.render(*args, **kwargs)
+
+
+def sql_timer(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current = _current.get()
+        if current is not None:
+            current.phases['db'] += time.perf_counter() - start
+            current.queries += 1
+            if sql[:6] in WRITE_STATEMENTS:
+                current.writes += 1
+
+
+def install_sql_timer(connection):
+    """
+    sql_timer на соединение, один раз. В начало списка: execute_wrapper() снимает последний
+    обёртчик, а подключение часто происходит внутри такого блока (query_budget)
+    """
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, sql_timer)
+
+
+@contextmanager
+def collect():
+    """Замер фаз для текущего контекста; SQL считается в любом потоке, куда контекст скопирован"""
+    timing = RequestTiming()
+    token = _current.set(timing)
+    try:
+        yield timing
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def captured():
+    """Замеры всех запросов, завершившихся внутри блока -- для бенчмарков"""
+    timings = []
+    _capturing.append(timings)
+    try:
+        yield timings
+    finally:
+        _capturing.remove(timings)
+
+
+class Histograms:
+    """Гистограммы длительностей в памяти процесса: (view, phase) -> счётчики по бакетам"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            data = self._data.get(labels)
+            if data is None:
+                # счётчики по бакетам (последний -- +Inf), сумма
+                data = self._data[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            data[0][index] += 1
+            data[1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: (list(counts), total) for labels, (counts, total) in self._data.items()}
+
+
+histograms = Histograms()
+
+
+class RequestTimingMiddleware:
+    """
+    Должна стоять первой в MIDDLEWARE, чтобы total включал остальные middleware.
+    Под ASGI работает асинхронно: синхронная middleware первой в цепочке держала бы
+    поток thread_sensitive весь запрос, и async-вьюхи процесса выполнялись бы по одной.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # как в django.utils.deprecation.MiddlewareMixin
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        with collect() as timing:
+            response = self.get_response(request)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        with collect() as timing:
+            response = await self.get_response(request)
+        return self.finish(request, response, timing)
+
+    @staticmethod
+    def finish(request, response, timing):
+        timing.stop()
+        total = timing.total()
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+
+        histograms.observe((view, 'total'), total)
+        for timings in _capturing:
+            timings.append(timing)
+        for phase, seconds in timing.phases.items():
+            histograms.observe((view, phase), seconds)
+
+        response['Server-Timing'] = ', '.join(
+            [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in timing.phases.items()]
+            + [f'total;dur={total * 1000:.1f}'])
+
+        if total >= settings.REQUEST_TIMING_LOG_THRESHOLD:
+            logger.info("request view=%s method=%s status=%s total_ms=%.1f upstream_ms=%.1f db_ms=%.1f "
+                        "db_queries=%d db_writes=%d render_ms=%.1f",
+                        view, request.method, response.status_code, total * 1000,
+                        timing.phases['upstream'] * 1000, timing.phases['db'] * 1000, timing.queries,
+                        timing.writes, timing.phases['render'] * 1000)
+        return response
@@ -0,0 +1,123 @@
+"""
+Локальная заглушка api Adesk для бенчмарков и тестов: каталог тарифов (GET),
+расчёт стоимости (POST .../checkout...) и оформление подписки (любой другой POST).
+Отвечает с задержкой delay, считает запросы и принятые TCP-соединения -- по ним видно,
+переиспользует ли клиент keep-alive соединения. Запускается в фоновом потоке:
+
+    with UpstreamStub(delay=0.05) as stub, override_settings(**stub.settings()):
+        ...
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from . import pricing
+from .catalogue import get_catalogue
+
+TARIFFS = {'tariffs': [
+    {'code': 'business', 'name': 'Бизнес', 'isCustomizable': True, 'pricing': {'1': 2990.0, '12': 24990.0},
+     'quotas': [{'code': 'users', 'name': 'Пользователи', 'quantity': 3, 'unitPrice': 100.0},
+                {'code': 'legal_entities', 'name': 'Юр. лица', 'quantity': 1, 'unitPrice': 200.0}]},
+    {'code': 'start', 'name': 'Старт', 'isCustomizable': False, 'pricing': {'12': 9990.0},
+     'quotas': [{'code': 'users', 'name': 'Пользователи', 'quantity': 1, 'unitPrice': 100.0},
+                {'code': 'legal_entities', 'name': 'Юр. лица', 'quantity': 1, 'unitPrice': 200.0}]},
+]}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, stub):
+        self.stub = stub
+        super().__init__(('127.0.0.1', 0), _Handler)
+
+    def get_request(self):
+        request = super().get_request()
+        with self.stub.lock:
+            self.stub.connections += 1
+        return request
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # заголовки и тело уходят разными send(): без TCP_NODELAY keep-alive соединение
+    # ждёт delayed ACK клиента (~40 мс) и замер показывает задержку заглушки, а не клиента
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, data, status=200):
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+        if stub.delay:
+            time.sleep(stub.delay)
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(TARIFFS)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        stub = self.server.stub
+        with stub.lock:
+            stub.posts.append((self.path, data, dict(self.headers)))
+        if 'checkout' not in self.path:
+            self._reply({'success': True})
+            return
+        try:
+            result = pricing.calculate(get_catalogue(TARIFFS), data['tariff'], data['period'],
+                                       json.loads(data.get('extra_quotas') or '{}'))
+        except ValueError as e:
+            self._reply({'success': False, 'message': str(e)})
+            return
+        del result['quotas_sum']
+        self._reply({'success': True, 'pricing': result})
+
+
+class UpstreamStub:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.posts = []
+        self._server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def settings(self):
+        """Настройки для override_settings: все ссылки api -- на заглушку"""
+        return {'TARIFFS_LINK': self.url + '/tariffs', 'CHECKOUT_LINK': self.url + '/checkout',
+                'SUBSCRIBE_LINK': self.url + '/subscription'}
+
+    def reset(self):
+        with self.lock:
+            self.requests = self.connections = 0
+            self.posts = []
+
+    def start(self):
+        self._server = _Server(self)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
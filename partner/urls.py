@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.contrib.auth.views import LogoutView
 from django.urls import path
 from django.views.generic import RedirectView
 
 from .views.auth_views import *
 from .views.account_views import *
+from .views.metrics_views import metrics_view
+from .views.async_account_views import AsyncAccountProfileView, AsyncCheckoutView, AsyncSubscribeView
+
+if settings.ASYNC_VIEWS:
+    AccountProfileView, CheckoutView, SubscribeView = AsyncAccountProfileView, AsyncCheckoutView, AsyncSubscribeView
 
 app_name = 'partner'
 urlpatterns = [
@@ -15,6 +21,11 @@ urlpatterns = [
 
     path('my/', AccountProfileView.as_view(), name='account_profile'),
     path('my/history/', AccountHistoryView.as_view(), name='account_history'),
+    path('my/history/more', AccountHistoryMoreView.as_view(), name='account_history_more'),
+    path('my/history/export', AccountHistoryExportView.as_view(), name='account_history_export'),
     path('my/checkout', CheckoutView.as_view(), name='checkout'),
+    path('my/checkout/preview', PricePreviewView.as_view(), name='price_preview'),
     path('my/checkout/subscribe', SubscribeView.as_view(), name='subscribe'),
+
+    path('metrics', metrics_view, name='metrics'),
 ]
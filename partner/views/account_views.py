@@ -1,21 +1,51 @@
+import asyncio
+import datetime
 import decimal
 import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+import weakref
+from functools import partial
 from json import loads
+from urllib.parse import urlsplit
 
+import httpx
 import requests as req
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db.models import Sum, F
-from django.shortcuts import render, redirect
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import redirect
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
 
-from ..forms import SubscribeForm
+from .. import export, metrics, quotes, timing
+from .. import pricing as pricing_engine
+from ..circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from ..catalogue import catalogue_version, get_catalogue
+from ..forms import SubscriptionHistoryForm, subscribe_form
+from ..outbox import enqueue_subscription
+from ..query_budget import query_budget
+from ..timing import render
 from ..models import Subscription, Partner
 
 
+CHECKOUT_KEY_RE = re.compile(r'[0-9a-f]{32}')
+
+
 def debug_pricing():
     pricing = \
         '''
@@ -51,7 +81,27 @@ def debug_pricing():
     return loads(pricing)
 
 
+class JitteredRetry(Retry):
+    """Retry с "full jitter": пауза выбирается случайно из [0, экспоненциальный backoff]"""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff else 0
+
+    @staticmethod
+    def delay(attempt):
+        """Та же пауза для повторов httpx-клиента: attempt -- номер попытки, перед первой (0) паузы нет"""
+        return random.uniform(0, settings.API_RETRY_BACKOFF * (2 ** attempt)) if attempt else 0
+
+
 class Api:
+    retry_statuses = (502, 503, 504)
+
+    _session = None
+    _session_pid = None
+    _session_lock = threading.Lock()
+    _async_clients = weakref.WeakKeyDictionary()
+
     @staticmethod
     def get(url, *args, **kwargs):
         return Api.__make_request('get', url, *args, **kwargs)
@@ -60,91 +110,546 @@ class Api:
     def post(url, data, *args, **kwargs):
         return Api.__make_request('post', url, data, *args, **kwargs)
 
+    @staticmethod
+    async def aget(url, *args, **kwargs):
+        return await Api.__amake_request('get', url, *args, **kwargs)
+
+    @staticmethod
+    async def apost(url, data, *args, **kwargs):
+        return await Api.__amake_request('post', url, data, *args, **kwargs)
+
+    @staticmethod
+    def breaker(url):
+        """Предохранитель на каждый хост upstream"""
+        return get_breaker(urlsplit(url).netloc)
+
+    @staticmethod
+    def available(url):
+        """
+        Без сетевого запроса: False, пока предохранитель хоста разомкнут.
+        В half_open возвращает True, чтобы следующий запрос к хосту стал пробным.
+        """
+        return Api.breaker(url).state != CircuitBreaker.OPEN
+
+    @staticmethod
+    def basic_auth(auth):
+        """
+        DEV_AUTH без заданных переменных окружения -- (None, None): такие учётные данные не отправляются.
+        Одинаково для requests (отправил бы "None:None") и httpx (не принимает None)
+        """
+        if auth and None in auth:
+            return None
+        return auth
+
+    @staticmethod
+    def session():
+        """
+        Общая для процесса keep-alive сессия с пулом соединений.
+        Пересоздаётся после fork, чтобы воркеры gunicorn не делили сокеты мастера.
+        """
+        if Api._session is None or Api._session_pid != os.getpid():
+            with Api._session_lock:
+                if Api._session is None or Api._session_pid != os.getpid():
+                    Api._session = Api.__build_session()
+                    Api._session_pid = os.getpid()
+        return Api._session
+
+    @staticmethod
+    def async_client():
+        """
+        httpx-клиент с пулом соединений, один на event loop
+        (под uvicorn-воркером loop один на процесс)
+        """
+        loop = asyncio.get_running_loop()
+        client = Api._async_clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=settings.API_ASYNC_MAX_CONNECTIONS,
+                                  max_keepalive_connections=settings.API_POOL_SIZE)
+            client = httpx.AsyncClient(limits=limits, verify=False)
+            Api._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def __build_session():
+        retry = JitteredRetry(
+            total=settings.API_GET_RETRIES,
+            backoff_factor=settings.API_RETRY_BACKOFF,
+            status_forcelist=Api.retry_statuses,
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=settings.API_POOL_CONNECTIONS,
+                              pool_maxsize=settings.API_POOL_SIZE,
+                              max_retries=retry)
+        session = req.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
     @staticmethod
     def __make_request(method, url, data=None, request=None, headers=None, auth=None):
+        breaker = Api.breaker(url)
+        if not breaker.allow_request():
+            if request:
+                messages.warning(request, message="Сервис оформления подписок недоступен.")
+            raise CircuitOpenError
+
+        auth = Api.basic_auth(auth)
+        session = Api.session()
         try:
-            if method == "get":
-                r = req.get(url, timeout=2, headers=headers, auth=auth, verify=False)
-            if method == "post":
-                r = req.post(url, data=data, timeout=10, headers=headers, auth=auth, verify=False)
+            with timing.timed('upstream'):
+                if method == "get":
+                    timeout = (settings.API_CONNECT_TIMEOUT, settings.API_GET_READ_TIMEOUT)
+                    r = session.get(url, timeout=timeout, headers=headers, auth=auth, verify=False)
+                if method == "post":
+                    timeout = (settings.API_CONNECT_TIMEOUT, settings.API_POST_READ_TIMEOUT)
+                    r = session.post(url, data=data, timeout=timeout, headers=headers, auth=auth, verify=False)
         except (req.Timeout, req.ConnectionError) as e:
+            breaker.record_failure()
             if request:
                 messages.warning(request, message="Сервис оформления подписок недоступен.")
             raise ConnectionError
+
+        # 4xx -- ошибка запроса, а не недоступность сервиса
+        if r.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return Api.__raise_for_status(r, request)
+
+    @staticmethod
+    async def __amake_request(method, url, data=None, request=None, headers=None, auth=None):
+        breaker = Api.breaker(url)
+        if not await sync_to_async(breaker.allow_request, thread_sensitive=False)():
+            if request:
+                messages.warning(request, message="Сервис оформления подписок недоступен.")
+            raise CircuitOpenError
+
+        if method == "get":
+            timeout = httpx.Timeout(settings.API_GET_READ_TIMEOUT, connect=settings.API_CONNECT_TIMEOUT)
+            retries = settings.API_GET_RETRIES
+        else:
+            timeout = httpx.Timeout(settings.API_POST_READ_TIMEOUT, connect=settings.API_CONNECT_TIMEOUT)
+            retries = 0
+        auth = Api.basic_auth(auth)
+
+        client = Api.async_client()
+        started = time.perf_counter()
+        for attempt in range(retries + 1):
+            if attempt:
+                await asyncio.sleep(JitteredRetry.delay(attempt))
+            try:
+                r = await client.request(method.upper(), url, data=data, headers=headers, auth=auth,
+                                         timeout=timeout)
+            except httpx.TransportError:
+                if attempt < retries:
+                    continue
+                timing.record('upstream', time.perf_counter() - started)
+                await sync_to_async(breaker.record_failure, thread_sensitive=False)()
+                if request:
+                    messages.warning(request, message="Сервис оформления подписок недоступен.")
+                raise ConnectionError
+            if r.status_code not in Api.retry_statuses:
+                break
+        timing.record('upstream', time.perf_counter() - started)
+
+        record = breaker.record_failure if r.status_code >= 500 else breaker.record_success
+        await sync_to_async(record, thread_sensitive=False)()
         return Api.__raise_for_status(r, request)
 
     @staticmethod
     def __raise_for_status(r, request=None):
-        try:
-            r.raise_for_status()
-        except req.HTTPError:
+        # r -- ответ requests или httpx
+        if r.status_code >= 400:
             if request:
                 messages.warning(request, message="Сервер оформления подписок недоступен.")
             raise ConnectionError
         return r.json()
 
 
+class TariffsCache:
+    """
+    Каталог тарифов в django cache (общий для воркеров при redis-бэкенде).
+     \n свежая запись (моложе TARIFFS_CACHE_TTL) отдаётся сразу -- hit
+     \n устаревшая отдаётся сразу, а обновление уходит в фоновый поток -- stale
+     \n при пустом кэше upstream запрашивает только держатель блокировки,
+      остальные ждут его результат не дольше TARIFFS_CACHE_LOCK_TIMEOUT -- miss
+    """
+    key = 'tariffs:catalogue'
+    lock_key = 'tariffs:catalogue:lock'
+    stats_prefix = 'tariffs:stats:'
+    events = ('hit', 'stale', 'miss', 'refresh', 'refresh_error', 'wait_timeout')
+
+    @classmethod
+    def get(cls, request=None):
+        return cls._entry(request)['tariffs']
+
+    @classmethod
+    def get_catalogue(cls, request=None):
+        """Скомпилированный каталог (partner.catalogue) текущей версии"""
+        entry = cls._entry(request)
+        return get_catalogue(entry['tariffs'], entry.get('version'))
+
+    @classmethod
+    async def aget_catalogue(cls, request=None):
+        """
+        get_catalogue() для async-вьюх: кэш читается в пуле потоков, а upstream запрашивается
+        через httpx (Api.aget) -- ожидание медленного api не занимает поток
+        """
+        entry = await sync_to_async(cls._cached, thread_sensitive=False)()
+        if entry is None:
+            entry = await cls._afill(request)
+        return get_catalogue(entry['tariffs'], entry.get('version'))
+
+    @classmethod
+    def stats(cls):
+        return metrics.read(cls.stats_prefix, cls.events)
+
+    @classmethod
+    def invalidate(cls):
+        cache.delete(cls.key)
+
+    @classmethod
+    def _entry(cls, request):
+        entry = cls._cached()
+        if entry is None:
+            return cls._fill(request)
+        return entry
+
+    @classmethod
+    def _cached(cls):
+        """Запись из кэша (устаревшая -- с обновлением в фоне) или None при промахе"""
+        entry = cache.get(cls.key)
+        if entry is None:
+            cls._count('miss')
+        elif time.time() - entry['fetched_at'] < settings.TARIFFS_CACHE_TTL:
+            cls._count('hit')
+        else:
+            cls._count('stale')
+            cls._refresh_in_background()
+        return entry
+
+    @classmethod
+    def _fill(cls, request):
+        deadline = time.monotonic() + settings.TARIFFS_CACHE_LOCK_TIMEOUT
+        while True:
+            token = cls._acquire()
+            if token is not None:
+                try:
+                    return cls._fetch(request)
+                finally:
+                    cls._release(token)
+
+            # Каталог уже запрашивает другой запрос/воркер -- ждём его результат. Если держатель
+            # снял блокировку без результата, upstream запрашивает следующий, а не все ждущие сразу
+            while cache.get(cls.lock_key) is not None and time.monotonic() < deadline:
+                time.sleep(0.05)
+            entry = cache.get(cls.key)
+            if entry is not None:
+                return entry
+            if time.monotonic() >= deadline:
+                cls._wait_timeout(request)
+
+    @classmethod
+    async def _afill(cls, request):
+        """_fill для async-вьюх: ожидание -- asyncio.sleep, запрос к upstream -- Api.aget"""
+        in_thread = partial(sync_to_async, thread_sensitive=False)
+        deadline = time.monotonic() + settings.TARIFFS_CACHE_LOCK_TIMEOUT
+        while True:
+            token = await in_thread(cls._acquire)()
+            if token is not None:
+                try:
+                    try:
+                        tariffs = await Api.aget(settings.TARIFFS_LINK, request=request)
+                    except ConnectionError:
+                        await in_thread(cls._count)('refresh_error')
+                        raise
+                    return await in_thread(cls._store)(tariffs)
+                finally:
+                    await in_thread(cls._release)(token)
+
+            while await in_thread(cache.get)(cls.lock_key) is not None and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            entry = await in_thread(cache.get)(cls.key)
+            if entry is not None:
+                return entry
+            if time.monotonic() >= deadline:
+                await in_thread(cls._wait_timeout)(request)
+
+    @classmethod
+    def _wait_timeout(cls, request):
+        cls._count('wait_timeout')
+        if request:
+            messages.warning(request, message="Сервис оформления подписок недоступен.")
+        raise ConnectionError
+
+    @classmethod
+    def _acquire(cls):
+        """Токен блокировки обновления или None, если её держит другой запрос/воркер"""
+        token = uuid.uuid4().hex
+        return token if cache.add(cls.lock_key, token, settings.TARIFFS_CACHE_LOCK_TIMEOUT) else None
+
+    @classmethod
+    def _release(cls, token):
+        # блокировка могла истечь и достаться другому воркеру -- снимаем только свою
+        if cache.get(cls.lock_key) == token:
+            cache.delete(cls.lock_key)
+
+    @classmethod
+    def _fetch(cls, request=None):
+        try:
+            tariffs = Api.get(settings.TARIFFS_LINK, request=request)
+        except ConnectionError:
+            cls._count('refresh_error')
+            raise
+        return cls._store(tariffs)
+
+    @classmethod
+    def _store(cls, tariffs):
+        entry = {'tariffs': tariffs, 'version': catalogue_version(tariffs), 'fetched_at': time.time()}
+        cache.set(cls.key, entry, settings.TARIFFS_CACHE_TTL + settings.TARIFFS_CACHE_STALE_TTL)
+        cls._count('refresh')
+        return entry
+
+    @classmethod
+    def _refresh_in_background(cls):
+        token = cls._acquire()
+        if token is None:
+            return
+        threading.Thread(target=cls._background_refresh, args=(token,), daemon=True).start()
+
+    @classmethod
+    def _background_refresh(cls, token):
+        try:
+            cls._fetch()
+        except ConnectionError:
+            pass
+        finally:
+            cls._release(token)
+
+    @classmethod
+    def _count(cls, name):
+        metrics.incr(cls.stats_prefix + name)
+
+
 # Затычка api
-def get_pricing(request):
+def get_pricing(request, partner=None, quote_token=None):
     """
     Возвращает
-     \n tariffs_json = объект тарифов
-     \n tariff_obj -- объект тарифа, указанного в request
+     \n catalogue -- каталог тарифов (partner.catalogue.Catalogue)
+     \n tariff_obj -- тариф, указанный в request (catalogue.Tariff)
      \n extra_quotas - extra квоты {code: value}
      \n pricing = {...} -- рассчитанная стоимость подписки
      \n sub_form
+     \n quote -- ключ расчёта в кэше (см. partner.quotes)
+
+    Если передан quote_token, он должен быть выдан partner для тех же данных формы,
+    иначе ValidationError. Расчёт берётся из кэша, в CHECKOUT_LINK -- только при промахе.
     """
 
-    tariffs_json = Api.get('https://adesk.ru/api/tariffs', request=request)
+    catalogue = TariffsCache.get_catalogue(request)
+    sub_form, tariff_obj, api_data, quote = parse_quote_request(request, catalogue, partner, quote_token)
 
-    sub_form = SubscribeForm(tariffs_json, data=request.POST)
+    pricing = quote_pricing(request, catalogue, api_data, quote)
+    return catalogue, tariff_obj, api_data['extra_quotas'], pricing, sub_form, quote
 
-    if sub_form.is_valid():
 
-        tariff_code = sub_form.cleaned_data['tariff']
-        tariff_obj = next(filter(lambda t: t['code'] == tariff_code, tariffs_json['tariffs']))
+def quote_pricing(request, catalogue, api_data, quote):
+    """Стоимость из кэша расчётов, локального расчёта или CHECKOUT_LINK (в этом порядке)"""
+    pricing = quotes.fetch(quote)
+    if pricing is None:
+        pricing = local_pricing(catalogue, api_data)
+    if pricing is None:
+        headers = {"App-Token": settings.APP_TOKEN_SUBSCRIBE}
+        r = Api.post(settings.CHECKOUT_LINK, data=api_data, request=request, auth=settings.DEV_AUTH,
+                     headers=headers)
+        pricing = parse_checkout_response(request, r)
+        shadow_pricing(catalogue, api_data, pricing)
+        quotes.store(quote, pricing)
+    return pricing
 
-        api_data = {
-            'client_email': sub_form.cleaned_data['client_email'],
-            'period': sub_form.cleaned_data['period'],
-            'tariff': tariff_code,
-            'extra_quotas': {},
-            'extra_options': "[]",
-        }
 
-        for quota in tariff_obj['quotas']:
-            code = quota['code']
-            default_quota_value = quota['quantity']
-            extra_value = sub_form.cleaned_data[code] - default_quota_value
-            if extra_value > 0:
-                api_data['extra_quotas'][code] = extra_value
+def parse_quote_request(request, catalogue, partner=None, quote_token=None):
+    """parse_checkout_form + ключ расчёта и проверка quote_token"""
+    sub_form, tariff_obj, api_data = parse_checkout_form(request, catalogue)
+    quote = checkout_quote_key(catalogue, api_data)
 
-        api_data['extra_quotas'] = json.dumps(api_data['extra_quotas'])
-        headers = {"App-Token": settings.APP_TOKEN_SUBSCRIBE}
+    if quote_token is not None and not quotes.check_token(quote_token, partner, quote):
+        messages.error(request, message='Расчёт стоимости устарел или изменился, проверьте подписку ещё раз.')
+        raise ValidationError("")
+
+    return sub_form, tariff_obj, api_data, quote
+
+
+def checkout_quote_key(catalogue, api_data):
+    return quotes.quote_key(catalogue.version, api_data['tariff'], api_data['period'],
+                            json.loads(api_data['extra_quotas']))
+
+
+def parse_checkout_form(request, catalogue):
+    """
+    Валидирует SubscribeForm из request.POST и собирает данные запроса к CHECKOUT_LINK.
+    Возвращает sub_form, tariff_obj (catalogue.Tariff), api_data
+    """
+    sub_form = subscribe_form(catalogue, data=request.POST)
+
+    if not sub_form.is_valid():
+        messages.error(request, message='Данные указаны неверно.')
+        raise ValidationError("")
 
-        r = Api.post(settings.CHECKOUT_LINK, data=api_data, request=request, auth=settings.DEV_AUTH, headers=headers)
+    tariff_obj, api_data = checkout_api_data(catalogue, sub_form)
+    return sub_form, tariff_obj, api_data
 
-        if r['success'] is False:
+
+def checkout_api_data(catalogue, sub_form):
+    """Данные запроса к CHECKOUT_LINK по валидной SubscribeForm. Возвращает tariff_obj, api_data"""
+    tariff_code = sub_form.cleaned_data['tariff']
+    tariff_obj = catalogue.tariffs[tariff_code]
+
+    api_data = {
+        'client_email': sub_form.cleaned_data['client_email'],
+        'period': sub_form.cleaned_data['period'],
+        'tariff': tariff_code,
+        'extra_quotas': {},
+        'extra_options': "[]",
+    }
+
+    for quota in tariff_obj.quotas:
+        extra_value = sub_form.cleaned_data[quota.code] - quota.quantity
+        if extra_value > 0:
+            api_data['extra_quotas'][quota.code] = extra_value
+
+    api_data['extra_quotas'] = json.dumps(api_data['extra_quotas'])
+    return tariff_obj, api_data
+
+
+def local_pricing(catalogue, api_data):
+    """
+    Расчёт без CHECKOUT_LINK, если включён PRICING_ENGINE = 'local' и локальный расчёт для этой
+    версии каталога прошёл теневую сверку (pricing_engine.trusted), иначе None -- стоимость из api
+    """
+    if settings.PRICING_ENGINE != pricing_engine.LOCAL or not pricing_engine.trusted(catalogue):
+        return None
+    try:
+        return pricing_engine.calculate(catalogue, api_data['tariff'], api_data['period'],
+                                        json.loads(api_data['extra_quotas']))
+    except ValueError:
+        # конфигурация, которую каталог не описывает: решает api; если он её посчитает,
+        # shadow_pricing запишет расхождение и версия каталога перестанет считаться проверенной
+        return None
+
+
+def shadow_pricing(catalogue, api_data, pricing):
+    """Сверяет ответ CHECKOUT_LINK с локальным расчётом (в 'local' -- пока сверок недостаточно)"""
+    if settings.PRICING_ENGINE in (pricing_engine.SHADOW, pricing_engine.LOCAL):
+        pricing_engine.shadow_compare(catalogue, api_data['tariff'], api_data['period'],
+                                      json.loads(api_data['extra_quotas']), pricing)
+
+
+def parse_checkout_response(request, r):
+    if r['success'] is False:
+        if request:
             messages.error(request, message=r['message'])
-            raise ValidationError(r['message'])
+        raise ValidationError(r['message'])
+
+    pricing = r['pricing']
+    pricing['quotas_sum'] = sum([q['price'] for q in pricing['extraQuotas']])
+    return pricing
+
+
+def subscription_api_data(request, partner, sub_form, extra_quotas, pricing):
+    total_price = decimal.Decimal(pricing['totalPrice'])
+    partner_commission = total_price * partner.commission / 100
+
+    return {
+        'client_email': sub_form.cleaned_data['client_email'],
+        'partner_email': request.user.email,
+        'partner_commission': partner_commission,
+        'period': sub_form.cleaned_data['period'],
+        'tariff': sub_form.cleaned_data['tariff'],
+        'extra_quotas': extra_quotas,
+        'extra_options': "[]",
+    }
+
+
+def save_subscription(partner, sub_form, tariff_obj, pricing, api_data, idempotency_key=None):
+    """
+    Сохраняет подписку в статусе pending вместе с запросом на её оформление в outbox.
+    В api Adesk подписка уходит из process_subscription_outbox, задолженность
+    и итоги партнёра обновляются при подтверждении.
+    """
+    quotas_all = []
+
+    for quota in tariff_obj.quotas:
+        obj = {
+            "code": quota.code,
+            "name": quota.name,
+            "value": sub_form.cleaned_data[quota.code]
+        }
+        quotas_all.append(obj)
+
+    tariff_name = pricing['tariff']['name']
+
+    s = Subscription(
+        partner=partner,
+        email=sub_form.cleaned_data['client_email'],
+        cost_value=int(pricing['totalPrice']),
+        commission=partner.commission,
+        reg_date=timezone.now(),
+        period=sub_form.cleaned_data['period'],
+        tariff=tariff_name,
+        quotas=quotas_all,
+        idempotency_key=idempotency_key,
+        status=Subscription.PENDING,
+    )
+
+    with transaction.atomic():
+        s.save()
+        enqueue_subscription(s, api_data)
+    return s
 
-        pricing = r['pricing']
-        pricing['quotas_sum'] = sum([q['price'] for q in pricing['extraQuotas']])
 
-        return tariffs_json, tariff_obj, api_data['extra_quotas'], pricing, sub_form
+def new_checkout_key():
+    return uuid.uuid4().hex
 
-    messages.error(request, message='Данные указаны неверно.')
-    raise ValidationError("")
+
+def get_checkout_key(request):
+    """Ключ идемпотентности, выданный странице checkout (None, если не передан)"""
+    key = request.POST.get('checkout_key', '')
+    return key if CHECKOUT_KEY_RE.fullmatch(key) else None
+
+
+def claim_checkout(partner, key):
+    """
+    True, если оформление по ключу можно начинать: подписки с этим ключом ещё нет
+    и форму с ним сейчас не оформляет параллельный запрос (повторная отправка)
+    """
+    if key is None:
+        return True
+    if Subscription.objects.filter(partner=partner, idempotency_key=key).exists():
+        return False
+    return cache.add(f'checkout:{partner.pk}:{key}', 1, settings.CHECKOUT_LOCK_TIMEOUT)
+
+
+def release_checkout(partner, key):
+    if key is not None:
+        cache.delete(f'checkout:{partner.pk}:{key}')
 
 
 def get_overall(partner):
-    revenue_func = F('cost_value') * F('commission') / 100
+    """Сводка продаж из накопительных итогов партнёра, без запросов к истории подписок"""
     return {
-        'revenue': Subscription.objects.filter(partner=partner).aggregate(val=Sum(revenue_func)),
-        'sales': Subscription.objects.filter(partner=partner).aggregate(Sum('cost_value'))
+        'revenue': partner.revenue_total,
+        'sales': partner.sales_total,
+        'count': partner.subscriptions_count,
     }
 
 
+def api_down_messages(request):
+    return [m for m in messages.get_messages(request) if m.level == 30]
+
+
+@method_decorator(query_budget(6, name='AccountProfileView'), name='dispatch')
 class AccountProfileView(LoginRequiredMixin, View):
     template_name = 'partner/account/account_page_profile.html'
 
@@ -154,49 +659,129 @@ class AccountProfileView(LoginRequiredMixin, View):
         except Partner.DoesNotExist:
             return redirect('/admin')
 
-        api_down_messages = [m for m in messages.get_messages(request) if m.level == 30]
-
-        if api_down_messages:
+        if api_down_messages(request) or not Api.available(settings.CHECKOUT_LINK):
             tariffs_json = None
-            subscribe_form = SubscribeForm(None, disable_form=True)
+            sub_form = subscribe_form()
         else:
             try:
-                tariffs_json = Api.get('https://adesk.ru/api/tariffs', request=request)
+                catalogue = TariffsCache.get_catalogue(request)
             except ConnectionError:
                 return redirect('partner:account_profile')
-            subscribe_form = SubscribeForm(tariffs_json)
+            tariffs_json = catalogue.json
+            sub_form = subscribe_form(catalogue)
 
         overall = get_overall(partner)
         return render(request, self.template_name,
                       context={
                           'partner': partner,
                           'overall': overall,
-                          'subscribe_form': subscribe_form,
+                          'subscribe_form': sub_form,
                           'checkout': False,
                           'tariff_json': tariffs_json,
                           'page': {'profile': {'active': 'active'}}
                       })
 
 
+def history_page(partner, filter_form):
+    """
+    Страница истории подписок партнёра: keyset-пагинация по (reg_date, id) в обратном порядке,
+    фильтры и курсор применяются в том же индексе (partner, reg_date, id).
+    Возвращает subs, next_cursor (None на последней странице)
+    """
+    subs = Subscription.objects.filter(partner=partner)
+    limit = settings.HISTORY_PAGE_SIZE
+
+    if filter_form.is_valid():
+        data = filter_form.cleaned_data
+        limit = data['limit']
+        subs = filter_history(subs, data)
+        if data['cursor']:
+            reg_date, pk = data['cursor']
+            # (reg_date, id) < (курсор); reg_date__lte даёт планировщику границу диапазона индекса
+            subs = subs.filter(Q(reg_date__lt=reg_date) | Q(reg_date=reg_date, id__lt=pk), reg_date__lte=reg_date)
+
+    page = list(subs.order_by('-reg_date', '-id')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = SubscriptionHistoryForm.encode_cursor(page[-1])
+    return page, next_cursor
+
+
+def filter_history(subs, data):
+    if data['date_from']:
+        subs = subs.filter(reg_date__gte=_start_of_day(data['date_from']))
+    if data['date_to']:
+        subs = subs.filter(reg_date__lt=_start_of_day(data['date_to'] + datetime.timedelta(days=1)))
+    if data['tariff']:
+        subs = subs.filter(tariff=data['tariff'])
+    return subs
+
+
+def _start_of_day(date):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
+@method_decorator(query_budget(8, name='AccountHistoryView'), name='dispatch')
 class AccountHistoryView(LoginRequiredMixin, View):
     template_name = 'partner/account/account_page_history.html'
 
     def get(self, request):
         partner = request.user.partner
-        subs = reversed(Subscription.objects.filter(partner=partner))
+        filter_form = SubscriptionHistoryForm(request.GET)
+        subs, next_cursor = history_page(partner, filter_form)
         subs_table = {
             'headers': ('Email', 'Стоимость', 'Заработано', 'Процент комиссии', 'Дата оформления', 'Период', 'Тариф'),
-            'dataset': subs
+            'dataset': subs,
+            'next_cursor': next_cursor,
         }
 
         return render(request, self.template_name,
                       context={
                           'partner': partner,
                           'subs_table': subs_table,
+                          'filter_form': filter_form,
+                          'export_formats': export.FORMATS,
                           'page': {'history': {'active': 'active'}}
                       })
 
 
+@method_decorator(query_budget(8, name='AccountHistoryMoreView'), name='dispatch')
+class AccountHistoryMoreView(LoginRequiredMixin, View):
+    """Следующая страница истории для кнопки "Показать ещё": строки таблицы в HTML и курсор"""
+    template_name = 'partner/account/account_subList_rows.html'
+
+    def get(self, request):
+        partner = request.user.partner
+        filter_form = SubscriptionHistoryForm(request.GET)
+        if not filter_form.is_valid():
+            return JsonResponse({'errors': filter_form.errors}, status=400)
+
+        subs, next_cursor = history_page(partner, filter_form)
+        with timing.timed('render'):
+            html = render_to_string(self.template_name, {'subs': subs}, request=request)
+        return JsonResponse({'html': html, 'next_cursor': next_cursor})
+
+
+class AccountHistoryExportView(LoginRequiredMixin, View):
+    """Вся история подписок партнёра (с учётом фильтров страницы) файлом CSV или XLSX"""
+
+    def get(self, request):
+        partner = request.user.partner
+        filter_form = SubscriptionHistoryForm(request.GET)
+        if not filter_form.is_valid():
+            return redirect('partner:account_history')
+
+        file_format = request.GET.get('format', 'csv')
+        if file_format not in export.FORMATS:
+            return HttpResponseBadRequest('Неподдерживаемый формат выгрузки')
+
+        subs = filter_history(Subscription.objects.filter(partner=partner), filter_form.cleaned_data)
+        filename = f"subscriptions_{timezone.localdate():%Y-%m-%d}"
+        return export.export_response(request, subs, filename, file_format)
+
+
+@method_decorator(query_budget(6, name='CheckoutView'), name='dispatch')
 class CheckoutView(LoginRequiredMixin, View):
     template_name = 'partner/account/account_page_profile.html'
 
@@ -209,7 +794,7 @@ class CheckoutView(LoginRequiredMixin, View):
         except (ConnectionError, ValidationError):
             return redirect('partner:account_profile')
 
-        tariffs_json, tariff_obj, extra_quotas, pricing, sub_form = r
+        catalogue, tariff_obj, extra_quotas, pricing, sub_form, quote = r
 
         partner = request.user.partner
         overall = get_overall(partner)
@@ -220,73 +805,92 @@ class CheckoutView(LoginRequiredMixin, View):
                           'overall': overall,
                           'subscribe_form': sub_form,
                           'checkout': True,
+                          'checkout_key': new_checkout_key(),
+                          'quote_token': quotes.make_token(partner, quote),
                           'pricing': pricing,
                           'page': {'profile': {'active': 'active'}}
                       })
 
 
-class SubscribeView(LoginRequiredMixin, View):
+@method_decorator(query_budget(4, name='PricePreviewView'), name='dispatch')
+class PricePreviewView(LoginRequiredMixin, View):
+    """
+    Стоимость для текущих значений формы подписки без перезагрузки страницы:
+    только JSON с блоком pricing, без get_overall и рендеринга шаблонов.
+    Сообщения в сессию не пишутся -- ошибки возвращаются в ответе.
+    Пока email клиента не указан, CHECKOUT_LINK не вызывается: стоимость из кэша расчётов
+    или локальный расчёт (estimate, если он ещё не прошёл теневую сверку)
+    """
     def post(self, request):
         try:
-            r = get_pricing(request)
-        except (ConnectionError, ValidationError):
-            return redirect('partner:account_profile')
-
-        tariffs_json, tariff_obj, extra_quotas, pricing, sub_form = r
-
-        quotas_all = []
+            catalogue = TariffsCache.get_catalogue()
+        except ConnectionError:
+            return JsonResponse({'success': False, 'message': 'Сервис оформления подписок недоступен.'}, status=503)
 
-        for quota in tariff_obj['quotas']:
-            code = quota['code']
-            obj = {
-                "code": code,
-                "name": quota['name'],
-                "value": sub_form.cleaned_data[code]
-            }
-            quotas_all.append(obj)
+        sub_form = subscribe_form(catalogue, data=request.POST)
+        # email клиента на стоимость не влияет и при подборе квот ещё может быть не заполнен
+        sub_form.fields['client_email'].required = False
+        if not sub_form.is_valid():
+            return JsonResponse({'success': False, 'errors': sub_form.errors}, status=400)
 
+        tariff_obj, api_data = checkout_api_data(catalogue, sub_form)
+        quote = checkout_quote_key(catalogue, api_data)
+        estimate = False
+        try:
+            if api_data['client_email']:
+                pricing = quote_pricing(None, catalogue, api_data, quote)
+            else:
+                pricing = quotes.fetch(quote) or local_pricing(catalogue, api_data)
+                if pricing is None:
+                    pricing = pricing_engine.calculate(catalogue, api_data['tariff'], api_data['period'],
+                                                       json.loads(api_data['extra_quotas']))
+                    estimate = True
+        except ConnectionError:
+            return JsonResponse({'success': False, 'message': 'Сервис оформления подписок недоступен.'}, status=503)
+        except ValidationError as e:
+            return JsonResponse({'success': False, 'message': e.message}, status=400)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+        return JsonResponse({'success': True, 'pricing': {
+            'totalPrice': pricing['totalPrice'],
+            'tariffPrice': pricing['tariff']['price'],
+            'extraQuotas': [{'code': q['code'], 'price': q['price']} for q in pricing['extraQuotas']],
+            'quotas_sum': pricing['quotas_sum'],
+            'estimate': estimate,
+        }})
+
+
+@method_decorator(query_budget(12, name='SubscribeView'), name='dispatch')
+class SubscribeView(LoginRequiredMixin, View):
+    def post(self, request):
         partner = request.user.partner
+        key = get_checkout_key(request)
+        if not claim_checkout(partner, key):
+            messages.info(request, 'Подписка по этой форме уже оформлена.')
+            return redirect('partner:account_history')
 
-        total_price = decimal.Decimal(pricing['totalPrice'])
-        partner_commission = total_price * partner.commission / 100
-
-        api_data = {
-            'client_email': sub_form.cleaned_data['client_email'],
-            'partner_email': request.user.email,
-            'partner_commission': partner_commission,
-            'period': sub_form.cleaned_data['period'],
-            'tariff': sub_form.cleaned_data['tariff'],
-            'extra_quotas': extra_quotas,
-            'extra_options': "[]",
-        }
-        headers = {"App-Token": f"{settings.APP_TOKEN_SUBSCRIBE}"}
+        try:
+            return self.subscribe(request, partner, key)
+        finally:
+            release_checkout(partner, key)
 
+    def subscribe(self, request, partner, key):
         try:
-            r = Api.post(settings.SUBSCRIBE_LINK, data=api_data, request=request, headers=headers,
-                         auth=settings.DEV_AUTH)
-        except ConnectionError:
+            r = get_pricing(request, partner, request.POST.get('quote_token', ''))
+        except (ConnectionError, ValidationError):
             return redirect('partner:account_profile')
 
-        if r['success'] is False:
-            messages.error(request, message=r['message'])
-            return redirect('partner:account_profile')
+        catalogue, tariff_obj, extra_quotas, pricing, sub_form, quote = r
 
-        tariff_name = pricing['tariff']['name']
-
-        s = Subscription(
-            partner=partner,
-            email=sub_form.cleaned_data['client_email'],
-            cost_value=pricing['totalPrice'],
-            commission=partner.commission,
-            reg_date=timezone.now(),
-            period=sub_form.cleaned_data['period'],
-            tariff=tariff_name,
-            quotas=quotas_all
-        )
+        api_data = subscription_api_data(request, partner, sub_form, extra_quotas, pricing)
 
-        partner.debt += total_price * (1 - partner.commission / 100)
-        partner.save(update_fields=['debt'])
-        s.save()
+        try:
+            save_subscription(partner, sub_form, tariff_obj, pricing, api_data, idempotency_key=key)
+        except IntegrityError:
+            # ключ уже использован: форму отправили повторно после истечения блокировки
+            messages.info(request, 'Подписка по этой форме уже оформлена.')
+            return redirect('partner:account_history')
 
-        messages.success(request, 'Пользователь успешно подписан.')
+        messages.success(request, 'Подписка принята и будет оформлена в течение нескольких минут.')
         return redirect('partner:account_history')
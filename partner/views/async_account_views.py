@@ -0,0 +1,180 @@
+"""
+Async-версии вьюх личного кабинета для запуска под ASGI (DJANGO_ASYNC_VIEWS=1).
+Запросы к upstream идут через httpx, ORM, сессии и рендеринг шаблонов --
+через sync_to_async, независимые части выполняются одновременно.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.mixins import AccessMixin
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.shortcuts import redirect
+from django.views import View
+
+from .. import quotes
+from ..forms import subscribe_form
+from ..models import Partner
+from ..timing import render
+from .account_views import (
+    Api, TariffsCache, api_down_messages, claim_checkout, get_checkout_key, get_overall, local_pricing,
+    new_checkout_key, parse_checkout_response, parse_quote_request, release_checkout, save_subscription,
+    shadow_pricing, subscription_api_data
+)
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin для async-вьюх: сессия и пользователь загружаются в потоке"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+def _get_partner(request):
+    try:
+        return request.user.partner
+    except Partner.DoesNotExist:
+        return None
+
+
+async def aget_pricing(request, partner=None, quote_token=None):
+    """Async get_pricing: возвращает то же самое"""
+    catalogue = await TariffsCache.aget_catalogue(request)
+    sub_form, tariff_obj, api_data, quote = parse_quote_request(request, catalogue, partner, quote_token)
+
+    pricing = await sync_to_async(quotes.fetch, thread_sensitive=False)(quote)
+    if pricing is None:
+        pricing = await sync_to_async(local_pricing, thread_sensitive=False)(catalogue, api_data)
+    if pricing is None:
+        headers = {"App-Token": settings.APP_TOKEN_SUBSCRIBE}
+        r = await Api.apost(settings.CHECKOUT_LINK, data=api_data, request=request, auth=settings.DEV_AUTH,
+                            headers=headers)
+        pricing = parse_checkout_response(request, r)
+        await sync_to_async(shadow_pricing, thread_sensitive=False)(catalogue, api_data, pricing)
+        await sync_to_async(quotes.store, thread_sensitive=False)(quote, pricing)
+
+    return catalogue, tariff_obj, api_data['extra_quotas'], pricing, sub_form, quote
+
+
+class AsyncAccountProfileView(AsyncLoginRequiredMixin, View):
+    template_name = 'partner/account/account_page_profile.html'
+
+    async def get(self, request):
+        # Загрузка партнёра из БД и проверка upstream с загрузкой каталога не зависят друг от друга
+        partner, catalogue = await asyncio.gather(
+            sync_to_async(_get_partner)(request),
+            self.acatalogue(request),
+            return_exceptions=True,
+        )
+        if isinstance(catalogue, ConnectionError):
+            return redirect('partner:account_profile')
+        for result in (partner, catalogue):
+            if isinstance(result, BaseException):
+                raise result
+        if partner is None:
+            return redirect('/admin')
+
+        if catalogue is None:
+            tariffs_json = None
+            sub_form = subscribe_form()
+        else:
+            tariffs_json = catalogue.json
+            sub_form = subscribe_form(catalogue)
+
+        overall = get_overall(partner)
+
+        return await sync_to_async(render)(request, self.template_name,
+                                           context={
+                                               'partner': partner,
+                                               'overall': overall,
+                                               'subscribe_form': sub_form,
+                                               'checkout': False,
+                                               'tariff_json': tariffs_json,
+                                               'page': {'profile': {'active': 'active'}}
+                                           })
+
+    @staticmethod
+    async def acatalogue(request):
+        """Каталог для формы подписки; None -- upstream недоступен, форма выключена"""
+        api_down, available = await asyncio.gather(
+            sync_to_async(api_down_messages)(request),
+            sync_to_async(Api.available, thread_sensitive=False)(settings.CHECKOUT_LINK),
+        )
+        if api_down or not available:
+            return None
+        return await TariffsCache.aget_catalogue(request)
+
+
+class AsyncCheckoutView(AsyncLoginRequiredMixin, View):
+    template_name = 'partner/account/account_page_profile.html'
+
+    async def get(self, request):
+        return redirect('partner:account_profile')
+
+    async def post(self, request):
+        # Загрузка партнёра из БД и расчёт стоимости в upstream не зависят друг от друга
+        partner, pricing_result = await asyncio.gather(
+            sync_to_async(lambda: request.user.partner)(),
+            aget_pricing(request),
+            return_exceptions=True,
+        )
+        if isinstance(pricing_result, (ConnectionError, ValidationError)):
+            return redirect('partner:account_profile')
+        for result in (partner, pricing_result):
+            if isinstance(result, BaseException):
+                raise result
+
+        catalogue, tariff_obj, extra_quotas, pricing, sub_form, quote = pricing_result
+        overall = get_overall(partner)
+
+        return await sync_to_async(render)(request, self.template_name,
+                                           context={
+                                               'partner': partner,
+                                               'overall': overall,
+                                               'subscribe_form': sub_form,
+                                               'checkout': True,
+                                               'checkout_key': new_checkout_key(),
+                                               'quote_token': quotes.make_token(partner, quote),
+                                               'pricing': pricing,
+                                               'page': {'profile': {'active': 'active'}}
+                                           })
+
+
+class AsyncSubscribeView(AsyncLoginRequiredMixin, View):
+    async def post(self, request):
+        partner = await sync_to_async(lambda: request.user.partner)()
+        key = get_checkout_key(request)
+        if not await sync_to_async(claim_checkout)(partner, key):
+            messages.info(request, 'Подписка по этой форме уже оформлена.')
+            return redirect('partner:account_history')
+
+        try:
+            return await self.subscribe(request, partner, key)
+        finally:
+            await sync_to_async(release_checkout, thread_sensitive=False)(partner, key)
+
+    async def subscribe(self, request, partner, key):
+        try:
+            r = await aget_pricing(request, partner, request.POST.get('quote_token', ''))
+        except (ConnectionError, ValidationError):
+            return redirect('partner:account_profile')
+
+        catalogue, tariff_obj, extra_quotas, pricing, sub_form, quote = r
+
+        api_data = subscription_api_data(request, partner, sub_form, extra_quotas, pricing)
+
+        try:
+            await sync_to_async(save_subscription)(partner, sub_form, tariff_obj, pricing, api_data,
+                                                   idempotency_key=key)
+        except IntegrityError:
+            # ключ уже использован: форму отправили повторно после истечения блокировки
+            messages.info(request, 'Подписка по этой форме уже оформлена.')
+            return redirect('partner:account_history')
+
+        messages.success(request, 'Подписка принята и будет оформлена в течение нескольких минут.')
+        return redirect('partner:account_history')
@@ -0,0 +1,53 @@
+"""
+/metrics в текстовом формате Prometheus: гистограммы времени запросов этого процесса
+(partner.timing) и общие для воркеров счётчики из django cache (partner.metrics).
+"""
+import secrets
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .. import pricing, quotes, timing
+from ..circuit_breaker import all_breakers
+from .account_views import TariffsCache
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def _histogram_lines(name, histograms):
+    lines = [f'# HELP {name} Request duration by phase (this process)', f'# TYPE {name} histogram']
+    bounds = [str(bucket) for bucket in histograms.buckets] + ['+Inf']
+    for (view, phase), (counts, total) in sorted(histograms.snapshot().items()):
+        labels = _labels(view=view, phase=phase)
+        cumulative = 0
+        for bound, count in zip(bounds, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+    return lines
+
+
+def _counter_lines(name, sources):
+    lines = [f'# HELP {name} Cache-backed event counters shared by all workers', f'# TYPE {name} counter']
+    for source, stats in sources:
+        for event, value in stats.items():
+            if isinstance(value, int):
+                lines.append(f'{name}{{{_labels(source=source, event=event)}}} {value}')
+    return lines
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # без токена /metrics закрыт: счётчики и имена вьюх не для публичного доступа
+    if not token or not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+
+    sources = [('tariffs', TariffsCache.stats()), ('quotes', quotes.stats()), ('pricing', pricing.stats())]
+    sources += [(f'breaker:{name}', breaker.stats()) for name, breaker in sorted(all_breakers().items())]
+
+    lines = (_histogram_lines('partner_request_duration_seconds', timing.histograms)
+             + _counter_lines('partner_events_total', sources))
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
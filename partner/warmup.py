@@ -0,0 +1,49 @@
+"""
+Прогрев воркера до первого запроса: шаблоны partner/templates компилируются в кеш cached loader,
+URLconf импортируется вместе со всеми вьюхами. Вызывается из gunicorn.conf.py (post_fork)
+и командой benchmark_first_request.
+"""
+import logging
+import os
+
+from django.apps import apps
+from django.template import TemplateSyntaxError, engines
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+
+def template_names():
+    root = os.path.join(apps.get_app_config('partner').path, 'templates')
+    names = []
+    for directory, _, files in os.walk(root):
+        for file in files:
+            if file.endswith('.html'):
+                names.append(os.path.relpath(os.path.join(directory, file), root).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    """Возвращает количество скомпилированных шаблонов"""
+    names = template_names()
+    compiled = 0
+    for engine in engines.all():
+        for name in names:
+            try:
+                engine.get_template(name)
+                compiled += 1
+            except TemplateSyntaxError:
+                # воркер всё равно должен подняться: ошибка повторится при рендеринге этой страницы
+                logger.exception("Шаблон %s не компилируется", name)
+    return compiled
+
+
+def warm_urls():
+    # импортирует URLconf с модулями вьюх и строит таблицы reverse(), иначе это делает первый запрос
+    reverse('partner:login')
+
+
+def warm_up():
+    """Возвращает количество скомпилированных шаблонов"""
+    warm_urls()
+    return warm_templates()